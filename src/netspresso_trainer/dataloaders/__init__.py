@@ -1,3 +1,3 @@
 from .builder import build_dataloader, build_dataset
-from .registry import CREATE_TRANSFORM, CUSTOM_DATASET, DATA_SAMPLER, HUGGINGFACE_DATASET
+from .registry import CREATE_BATCH_TRANSFORM, CREATE_TRANSFORM, CUSTOM_DATASET, DATA_SAMPLER, HUGGINGFACE_DATASET
 from .utils.constants import IMAGENET_DEFAULT_MEAN, IMAGENET_DEFAULT_STD
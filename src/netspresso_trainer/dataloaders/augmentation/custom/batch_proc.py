@@ -0,0 +1,282 @@
+"""
+Transforms of collated uint8 image batches (N, C, H, W).
+
+With ``augmentation.batch_transform``, dataloader workers stop at uint8 tensors, and normalization and the trailing
+photometric transforms run on the collated batch on the device. Random parameters are still drawn for each sample,
+and the samples are transformed together in a vectorized pass.
+"""
+from typing import List, Optional, Sequence
+
+import torch
+import torch.nn.functional as nnF
+import torchvision.transforms.functional as F
+from torch import Tensor
+from torchvision.transforms.autoaugment import _apply_op
+
+from .image_proc import AutoAugment, ColorJitter, RandomErasing, TrivialAugmentWide
+
+# Ops of TrivialAugmentWide and AutoAugment which only change the pixel values. The others move pixels.
+COLOR_OPS = ['Brightness', 'Color', 'Contrast', 'Sharpness', 'Posterize', 'Solarize', 'AutoContrast', 'Equalize', 'Invert']
+
+
+def _per_sample(values: Sequence[float], images: Tensor) -> Tensor:
+    # Parameter of each sample, which broadcasts over (N, C, H, W) images
+    return torch.tensor(values, dtype=torch.float64, device=images.device).view(-1, 1, 1, 1)
+
+
+def _blend(images: Tensor, other: Tensor, ratio: Tensor) -> Tensor:
+    # Same with ``_blend`` of torchvision, which gets a python float ratio for each image
+    return (ratio.float() * images + (1.0 - ratio).float() * other).clamp(0, 255).to(images.dtype)
+
+
+# Private helpers of torchvision are written here, since their module is renamed across torchvision versions
+
+
+def _rgb2hsv(images: Tensor) -> Tensor:
+    # Same with ``_rgb2hsv`` of torchvision, for float images in [0, 1]
+    r, g, b = images.unbind(dim=-3)
+    maxc = torch.max(images, dim=-3).values
+    minc = torch.min(images, dim=-3).values
+
+    # S and H are zero where ``maxc == minc``, and the denominators are replaced there to avoid NaN
+    eqc = maxc == minc
+    cr = maxc - minc
+    ones = torch.ones_like(maxc)
+    s = cr / torch.where(eqc, ones, maxc)
+    cr_divisor = torch.where(eqc, ones, cr)
+    rc = (maxc - r) / cr_divisor
+    gc = (maxc - g) / cr_divisor
+    bc = (maxc - b) / cr_divisor
+
+    hr = (maxc == r) * (bc - gc)
+    hg = ((maxc == g) & (maxc != r)) * (2.0 + rc - bc)
+    hb = ((maxc != g) & (maxc != r)) * (4.0 + gc - rc)
+    h = torch.fmod(((hr + hg + hb) / 6.0 + 1.0), 1.0)
+    return torch.stack((h, s, maxc), dim=-3)
+
+
+def _hsv2rgb(images: Tensor) -> Tensor:
+    # Same with ``_hsv2rgb`` of torchvision
+    h, s, v = images.unbind(dim=-3)
+    i = torch.floor(h * 6.0)
+    f = (h * 6.0) - i
+    i = i.to(dtype=torch.int32) % 6
+
+    p = torch.clamp((v * (1.0 - s)), 0.0, 1.0)
+    q = torch.clamp((v * (1.0 - s * f)), 0.0, 1.0)
+    t = torch.clamp((v * (1.0 - s * (1.0 - f))), 0.0, 1.0)
+
+    mask = i.unsqueeze(dim=-3) == torch.arange(6, device=i.device).view(-1, 1, 1)
+    a1 = torch.stack((v, q, p, p, t, v), dim=-3)
+    a2 = torch.stack((t, v, v, q, p, p), dim=-3)
+    a3 = torch.stack((p, p, t, v, v, q), dim=-3)
+    a4 = torch.stack((a1, a2, a3), dim=-4)
+    return torch.einsum("...ijk, ...xijk -> ...xjk", mask.to(dtype=images.dtype), a4)
+
+
+def _blurred_degenerate_image(images: Tensor) -> Tensor:
+    # Same with ``_blurred_degenerate_image`` of torchvision, which smooths the inner pixels with a 3x3 kernel
+    dtype = images.dtype if torch.is_floating_point(images) else torch.float32
+    kernel = torch.ones((3, 3), dtype=dtype, device=images.device)
+    kernel[1, 1] = 5.0
+    kernel /= kernel.sum()
+    kernel = kernel.expand(images.shape[-3], 1, kernel.shape[0], kernel.shape[1])
+
+    blurred = nnF.conv2d(images.to(dtype), kernel, groups=images.shape[-3])
+    if not torch.is_floating_point(images):
+        blurred = torch.round(blurred)
+    result = images.clone()
+    result[..., 1:-1, 1:-1] = blurred.to(images.dtype)
+    return result
+
+
+def adjust_brightness(images: Tensor, factor: Tensor) -> Tensor:
+    return _blend(images, torch.zeros_like(images), factor)
+
+
+def adjust_contrast(images: Tensor, factor: Tensor) -> Tensor:
+    mean = torch.mean(F.rgb_to_grayscale(images).float(), dim=(-3, -2, -1), keepdim=True)
+    return _blend(images, mean, factor)
+
+
+def adjust_saturation(images: Tensor, factor: Tensor) -> Tensor:
+    return _blend(images, F.rgb_to_grayscale(images), factor)
+
+
+def adjust_hue(images: Tensor, factor: Tensor) -> Tensor:
+    hsv = _rgb2hsv(F.convert_image_dtype(images, torch.float32))
+    h, s, v = hsv.unbind(dim=-3)
+    h = (h + factor.float().view(-1, 1, 1)) % 1.0
+    return F.convert_image_dtype(_hsv2rgb(torch.stack((h, s, v), dim=-3)), images.dtype)
+
+
+def adjust_sharpness(images: Tensor, factor: Tensor) -> Tensor:
+    if images.size(-1) <= 2 or images.size(-2) <= 2:
+        return images
+    return _blend(images, _blurred_degenerate_image(images), factor)
+
+
+def posterize(images: Tensor, bits: Tensor) -> Tensor:
+    mask = (256 - 2 ** (8 - bits.long())).to(torch.uint8)
+    return images & mask
+
+
+def solarize(images: Tensor, threshold: Tensor) -> Tensor:
+    return torch.where(images >= threshold, F.invert(images), images)
+
+
+def _apply_color_op(images: Tensor, op_name: str, magnitude: Tensor) -> Tensor:
+    if op_name == 'Brightness':
+        return adjust_brightness(images, 1.0 + magnitude)
+    if op_name == 'Color':
+        return adjust_saturation(images, 1.0 + magnitude)
+    if op_name == 'Contrast':
+        return adjust_contrast(images, 1.0 + magnitude)
+    if op_name == 'Sharpness':
+        return adjust_sharpness(images, 1.0 + magnitude)
+    if op_name == 'Posterize':
+        return posterize(images, magnitude)
+    if op_name == 'Solarize':
+        return solarize(images, magnitude)
+    if op_name == 'AutoContrast':
+        return F.autocontrast(images)
+    if op_name == 'Equalize':
+        return F.equalize(images)
+    if op_name == 'Invert':
+        return F.invert(images)
+    raise ValueError(f"The provided operator {op_name} is not recognized.")
+
+
+def _apply_ops(images: Tensor, op_names: List[Optional[str]], magnitudes: List[float], interpolation, fill) -> Tensor:
+    """
+    Apply ``op_names[i]`` with ``magnitudes[i]`` to ``images[i]``, where ``None`` is identity.
+    Samples of the same color op are transformed together, and the others are transformed one by one.
+    """
+    for op_name in set(op_names) - {None, 'Identity'}:
+        indices = [i for i, name in enumerate(op_names) if name == op_name]
+        if op_name in COLOR_OPS:
+            index = torch.tensor(indices, device=images.device)
+            images[index] = _apply_color_op(images[index], op_name, _per_sample([magnitudes[i] for i in indices], images))
+        else:
+            for i in indices:
+                images[i] = _apply_op(images[i], op_name, magnitudes[i], interpolation=interpolation, fill=fill)
+    return images
+
+
+def _tensor_fill(fill, channels: int) -> Optional[List[float]]:
+    if isinstance(fill, (int, float)):
+        return [float(fill)] * channels
+    if fill is not None:
+        return [float(f) for f in fill]
+    return None
+
+
+class BatchCompose:
+    def __init__(self, transforms):
+        self.transforms = transforms
+
+    def __call__(self, images: Tensor, target: Optional[Tensor] = None):
+        for t in self.transforms:
+            images, target = t(images, target)
+        return images, target
+
+    def __repr__(self):
+        format_string = self.__class__.__name__ + "("
+        for t in self.transforms:
+            format_string += "\n"
+            format_string += f"    {t}"
+        format_string += "\n)"
+        return format_string
+
+
+class BatchColorJitter(ColorJitter):
+    def forward(self, images: Tensor, target: Optional[Tensor] = None):
+        num_images = len(images)
+        params = [self.get_params(self.brightness, self.contrast, self.saturation, self.hue) for _ in range(num_images)]
+        applied = torch.rand(num_images) < self.p
+
+        fns = [adjust_brightness, adjust_contrast, adjust_saturation, adjust_hue]
+        for order in range(len(fns)):
+            for fn_id, fn in enumerate(fns):
+                # Samples whose ``order``-th op is ``fn``
+                indices = [i for i, (fn_idx, *factors) in enumerate(params)
+                           if applied[i] and fn_idx[order] == fn_id and factors[fn_id] is not None]
+                if len(indices) == 0:
+                    continue
+                index = torch.tensor(indices, device=images.device)
+                images[index] = fn(images[index], _per_sample([params[i][fn_id + 1] for i in indices], images))
+        return images, target
+
+
+class BatchRandomErasing(RandomErasing):
+    def forward(self, images: Tensor, target: Optional[Tensor] = None):
+        num_images, _, img_h, img_w = images.shape
+        regions = []
+        for _ in range(num_images):
+            erase_size = self.get_erase_size(img_h, img_w, self.scale, self.ratio) if torch.rand(1) < self.p else None
+            if erase_size is None:
+                regions.append((0, 0, 0, 0))
+                continue
+            h, w = erase_size
+            i = torch.randint(0, img_h - h + 1, size=(1,)).item()
+            j = torch.randint(0, img_w - w + 1, size=(1,)).item()
+            regions.append((i, j, h, w))
+
+        top, left, h, w = torch.tensor(regions, device=images.device).view(num_images, 4, 1, 1).unbind(dim=1)
+        rows = torch.arange(img_h, device=images.device).view(1, -1, 1)
+        cols = torch.arange(img_w, device=images.device).view(1, 1, -1)
+        erased = ((rows >= top) & (rows < top + h) & (cols >= left) & (cols < left + w)).unsqueeze(1)
+        # ``value`` is a number or a value of each channel
+        value = torch.tensor(self.value, dtype=images.dtype, device=images.device).view(-1, 1, 1)
+        return torch.where(erased, value, images), target
+
+
+class BatchTrivialAugmentWide(TrivialAugmentWide):
+    def forward(self, images: Tensor, target: Optional[Tensor] = None):
+        op_meta = self._augmentation_space(self.num_magnitude_bins)
+        op_names, magnitudes = zip(*[self.get_params(op_meta) for _ in range(len(images))])
+        images = _apply_ops(images, list(op_names), list(magnitudes), self.interpolation,
+                            _tensor_fill(self.fill, images.shape[-3]))
+        return images, target
+
+
+class BatchAutoAugment(AutoAugment):
+    def forward(self, images: Tensor, target: Optional[Tensor] = None):
+        channels, height, width = images.shape[-3:]
+        fill = _tensor_fill(self.fill, channels)
+        op_meta = self._augmentation_space(10, (height, width))
+
+        params = [self.get_params(len(self.policies)) for _ in range(len(images))]
+        for op_order in range(2):
+            op_names, magnitudes = [], []
+            for transform_id, probs, signs in params:
+                op_name, p, magnitude_id = self.policies[transform_id][op_order]
+                magnitude = 0.0
+                if probs[op_order] <= p:
+                    magnitudes_of_op, signed = op_meta[op_name]
+                    magnitude = float(magnitudes_of_op[magnitude_id].item()) if magnitude_id is not None else 0.0
+                    if signed and signs[op_order] == 0:
+                        magnitude *= -1.0
+                else:
+                    op_name = None
+                op_names.append(op_name)
+                magnitudes.append(magnitude)
+            images = _apply_ops(images, op_names, magnitudes, self.interpolation, fill)
+        return images, target
+
+
+class BatchNormalize:
+    """Convert uint8 images to float in [0, 1] and normalize, as with ``ToTensor`` and ``Normalize`` of each sample."""
+
+    def __init__(self, mean, std):
+        self.mean = mean
+        self.std = std
+
+    def __call__(self, images: Tensor, target: Optional[Tensor] = None):
+        images = F.normalize(images.float().div(255), mean=self.mean, std=self.std)
+        return images, target
+
+    def __repr__(self):
+        return self.__class__.__name__ + "(mean={0}, std={1})".format(
+            self.mean, self.std
+        )
@@ -20,14 +20,88 @@ INVERSE_MODES_MAPPING = {
     'bilinear': InterpolationMode.BILINEAR,
     'bicubic': InterpolationMode.BICUBIC,
 }
+# PIL image modes to stack single channel masks as bands, by the number of masks
+MERGED_MASK_MODES = {2: 'LA', 3: 'RGB', 4: 'RGBA'}
+
+
+def _image_size(image) -> Tuple[int, int]:
+    """(w, h) of PIL image or HWC array."""
+    if isinstance(image, np.ndarray):
+        return image.shape[1], image.shape[0]
+    return image.size
+
+
+def _as_chw(array: np.ndarray) -> Tensor:
+    # CHW tensor which shares the memory of HWC (or HW) array
+    tensor = torch.from_numpy(array)
+    return tensor.unsqueeze(0) if array.ndim == 2 else tensor.permute(2, 0, 1)
+
+
+def _as_hwc(tensor: Tensor, ndim: int) -> np.ndarray:
+    return tensor[0].numpy() if ndim == 2 else tensor.permute(1, 2, 0).numpy()
+
+
+def _apply_to_array(fn, array: np.ndarray, *args, **kwargs) -> np.ndarray:
+    """Apply torchvision functional transform to HWC uint8 array through a tensor view, without PIL round-trip."""
+    return _as_hwc(fn(_as_chw(array), *args, **kwargs), array.ndim)
+
+
+def _nearest_indices(src: int, dst: int) -> np.ndarray:
+    # Same source positions with PIL, which accumulates the scale in double precision
+    scale = src / dst
+    positions = np.add.accumulate(np.concatenate([[scale * 0.5], np.full(dst - 1, scale)]))
+    return np.floor(positions).astype(np.int64).clip(0, src - 1)
+
+
+def _resize_array(array: np.ndarray, size: List[int], interpolation: InterpolationMode, max_size: Optional[int] = None) -> np.ndarray:
+    """Resize HWC (or HW) uint8 array to ``size`` like ``F.resize`` of PIL image. Nearest sampling gives the same result."""
+    h, w = array.shape[:2]
+    size = [size] if isinstance(size, int) else list(size)
+    target_h, target_w = F._compute_resized_output_size((h, w), size, max_size)
+    if interpolation == InterpolationMode.NEAREST:
+        return array[_nearest_indices(h, target_h)[:, None], _nearest_indices(w, target_w)]
+    return _apply_to_array(F.resize, array, [target_h, target_w], interpolation, antialias=True)
+
+
+def _rgb_to_hsv_array(image: np.ndarray) -> np.ndarray:
+    """RGB to HSV of uint8 array, which is the same with ``convert('HSV')`` of PIL (hue in [0, 255], truncated)."""
+    rgb = image.astype(np.int16)
+    maxc, minc = rgb.max(axis=-1), rgb.min(axis=-1)
+    chromatic = maxc > minc
+    # Precision of each step follows the float and double arithmetic of PIL
+    cr = np.where(chromatic, maxc - minc, 1).astype(np.float32)
+    rc, gc, bc = [((maxc - rgb[..., c]).astype(np.float32) / cr).astype(np.float64) for c in range(3)]
+    h = np.where(rgb[..., 0] == maxc, (bc - gc).astype(np.float32),
+                 np.where(rgb[..., 1] == maxc, 2.0 + rc - bc, 4.0 + gc - rc)).astype(np.float32)
+    h = np.fmod(h.astype(np.float64) / 6.0 + 1.0, 1.0).astype(np.float32)
+    s = cr / np.maximum(maxc, 1).astype(np.float32)
+    h = np.where(chromatic, (h.astype(np.float64) * 255.0).astype(np.int64).clip(0, 255), 0)
+    s = np.where(chromatic, (s.astype(np.float64) * 255.0).astype(np.int64).clip(0, 255), 0)
+    return np.stack([h, s, maxc], axis=-1).astype(np.uint8)
+
+
+def _flip_array(array: np.ndarray, horizontal: bool) -> np.ndarray:
+    # cv2 keeps the array contiguous, where numpy slicing would give negative strides
+    return cv2.flip(array, 1 if horizontal else 0).reshape(array.shape)
+
+
+def _pad_array(array: np.ndarray, padding_ltrb: List[int], fill) -> np.ndarray:
+    left, top, right, bottom = padding_ltrb
+    h, w = array.shape[:2]
+    padded = np.empty((h + top + bottom, w + left + right) + array.shape[2:], dtype=array.dtype)
+    padded[...] = np.asarray(fill, dtype=array.dtype) if not isinstance(fill, (int, float)) else fill
+    padded[top:top + h, left:left + w] = array
+    return padded
 
 
 class Compose:
-    def __init__(self, transforms, additional_targets: Dict = None):
+    def __init__(self, transforms, additional_targets: Dict = None, array_mode: bool = False):
         if additional_targets is None:
             additional_targets = {}
         self.transforms = transforms
         self.additional_targets = additional_targets
+        # Transforms work on HWC uint8 arrays instead of PIL images, which are converted to tensors only by ``ToTensor``
+        self.array_mode = array_mode
 
     def _get_transformed(self, image, label, mask, bbox, keypoint, visualize_for_debug, dataset):
         for t in self.transforms:
@@ -36,11 +110,54 @@ class Compose:
             image, label, mask, bbox, keypoint = t(image=image, label=label, mask=mask, bbox=bbox, keypoint=keypoint, dataset=dataset)
         return image, label, mask, bbox, keypoint
 
+    @staticmethod
+    def _can_merge_masks(mask, additional_masks):
+        if len(additional_masks) + 1 not in MERGED_MASK_MODES:
+            return False
+        if isinstance(mask, np.ndarray):
+            return mask.ndim == 2 and all(isinstance(m, np.ndarray) and m.shape == mask.shape for m in additional_masks)
+        if not isinstance(mask, Image.Image) or mask.mode != 'L':
+            return False
+        return all(isinstance(m, Image.Image) and m.mode == 'L' and m.size == mask.size for m in additional_masks)
+
+    @staticmethod
+    def _merge_masks(mask, additional_masks):
+        if isinstance(mask, np.ndarray):
+            return np.stack([mask] + additional_masks, axis=-1)
+        return Image.merge(MERGED_MASK_MODES[len(additional_masks) + 1], [mask] + additional_masks)
+
+    @staticmethod
+    def _to_array(image):
+        # Custom datasets already give arrays from the decoder and image caches, which are taken without copy
+        return np.array(image) if isinstance(image, Image.Image) else image
+
+    @staticmethod
+    def _split_masks(merged_mask):
+        if isinstance(merged_mask, Image.Image):
+            return list(merged_mask.split())
+        return [merged_mask[..., idx].contiguous() if isinstance(merged_mask, Tensor) else merged_mask[..., idx]
+                for idx in range(merged_mask.shape[-1])]
+
     def __call__(self, image, label=None, mask=None, bbox=None, keypoint=None, visualize_for_debug=False, dataset=None, **kwargs):
+        if self.array_mode:
+            image, mask = self._to_array(image), self._to_array(mask)
+            kwargs = {k: self._to_array(v) if self.additional_targets.get(k) == 'mask' else v for k, v in kwargs.items()}
         additional_targets_result = {k: None for k in kwargs if k in self.additional_targets}
 
-        result_image, result_label, result_mask, result_bbox, result_keypoint = self._get_transformed(image=image, label=label, mask=mask, bbox=bbox, keypoint=keypoint, dataset=dataset, visualize_for_debug=visualize_for_debug)
-        for key in additional_targets_result:
+        mask_targets = [k for k in additional_targets_result if self.additional_targets[k] == 'mask']
+        if len(mask_targets) != 0 and self._can_merge_masks(mask, [kwargs[k] for k in mask_targets]):
+            # Stack additional masks as bands of mask, so that they are transformed with the same parameters in one pass
+            merged_mask = self._merge_masks(mask, [kwargs[k] for k in mask_targets])
+            result_image, result_label, result_merged_mask, result_bbox, result_keypoint = self._get_transformed(image=image, label=label, mask=merged_mask, bbox=bbox, keypoint=keypoint, dataset=dataset, visualize_for_debug=visualize_for_debug)
+            result_mask, *result_additional_masks = self._split_masks(result_merged_mask)
+            additional_targets_result.update(zip(mask_targets, result_additional_masks))
+        else:
+            mask_targets = []
+            result_image, result_label, result_mask, result_bbox, result_keypoint = self._get_transformed(image=image, label=label, mask=mask, bbox=bbox, keypoint=keypoint, dataset=dataset, visualize_for_debug=visualize_for_debug)
+
+        for key in list(additional_targets_result):
+            if key in mask_targets:
+                continue
             if self.additional_targets[key] == 'mask':
                 _, _, additional_targets_result[key], _, _ = self._get_transformed(image=image, label=label, mask=kwargs[key], bbox=None, keypoint=keypoint, dataset=dataset, visualize_for_debug=visualize_for_debug)
             elif self.additional_targets[key] == 'bbox':
@@ -59,7 +176,7 @@ class Compose:
         return return_dict
 
     def __repr__(self):
-        compose_summary = "CustomCompose"
+        compose_summary = "CustomCompose" + ("[array]" if self.array_mode else "")
         compose_list = ",\n\t".join([str(t) for t in self.transforms])
         compose_summary += "(\n\t" + compose_list + "\n)"
         return compose_summary
@@ -76,6 +193,8 @@ class CenterCrop(T.CenterCrop):
 
     def forward(self, image, label=None, mask=None, bbox=None, keypoint=None, dataset=None):
         # TODO: Compute mask, bbox, keypoint
+        if isinstance(image, np.ndarray):
+            return _apply_to_array(F.center_crop, image, self.size), label, mask, bbox, keypoint
         return F.center_crop(image, self.size), label, mask, bbox, keypoint
 
     def __repr__(self) -> str:
@@ -113,7 +232,7 @@ class Resize(T.Resize):
         super().__init__(size, interpolation, max_size)
 
     def forward(self, image, label=None, mask=None, bbox=None, keypoint=None, dataset=None):
-        w, h = image.size
+        w, h = _image_size(image)
 
         if isinstance(self.size, int) and self.resize_criteria == 'long':
             long_side, short_side = max(h, w), min(h, w)
@@ -122,12 +241,17 @@ class Resize(T.Resize):
         else:
             target_size = self.size
 
-        image = F.resize(image, target_size, self.interpolation, self.max_size, self.antialias)
-        if mask is not None:
+        if isinstance(image, np.ndarray):
+            image = _resize_array(image, target_size, self.interpolation, self.max_size)
+        else:
+            image = F.resize(image, target_size, self.interpolation, self.max_size, self.antialias)
+        if isinstance(mask, np.ndarray):
+            mask = _resize_array(mask, target_size, T.InterpolationMode.NEAREST, self.max_size)
+        elif mask is not None:
             mask = F.resize(mask, target_size, interpolation=T.InterpolationMode.NEAREST,
                             max_size=self.max_size)
         if bbox is not None:
-            target_w, target_h = image.size # @illian01: Determine ratio according to the actual resized image
+            target_w, target_h = _image_size(image) # @illian01: Determine ratio according to the actual resized image
             bbox[..., 0:4:2] *= float(target_w / w)
             bbox[..., 1:4:2] *= float(target_h / h)
         # TODO: Compute keypoint
@@ -148,11 +272,11 @@ class RandomHorizontalFlip:
         self.p: float = max(0., min(1., p))
 
     def __call__(self, image, label=None, mask=None, bbox=None, keypoint=None, dataset=None):
-        w, _ = image.size
+        w, _ = _image_size(image)
         if random.random() < self.p:
-            image = F.hflip(image)
+            image = _flip_array(image, horizontal=True) if isinstance(image, np.ndarray) else F.hflip(image)
             if mask is not None:
-                mask = F.hflip(mask)
+                mask = _flip_array(mask, horizontal=True) if isinstance(mask, np.ndarray) else F.hflip(mask)
             if bbox is not None:
                 bbox[..., 2::-2] = w - bbox[..., 0:4:2]
             if keypoint is not None:
@@ -174,11 +298,11 @@ class RandomVerticalFlip:
         self.p: float = max(0., min(1., p))
 
     def __call__(self, image, label=None, mask=None, bbox=None, keypoint=None, dataset=None):
-        _, h = image.size
+        _, h = _image_size(image)
         if random.random() < self.p:
-            image = F.vflip(image)
+            image = _flip_array(image, horizontal=False) if isinstance(image, np.ndarray) else F.vflip(image)
             if mask is not None:
-                mask = F.vflip(mask)
+                mask = _flip_array(mask, horizontal=False) if isinstance(mask, np.ndarray) else F.vflip(mask)
             if bbox is not None:
                 bbox[..., 3::-2] = h - bbox[..., 1:4:2]
             if keypoint is not None:
@@ -209,11 +333,11 @@ class Pad:
         self.padding_mode = 'constant' # @illian: Fix as constant. I think other options are not gonna used well.
 
     def __call__(self, image, label=None, mask=None, bbox=None, keypoint=None, dataset=None):
-        if not isinstance(image, (torch.Tensor, Image.Image)):
-            raise TypeError("Image should be Tensor or PIL.Image. Got {}".format(type(image)))
+        if not isinstance(image, (torch.Tensor, Image.Image, np.ndarray)):
+            raise TypeError("Image should be Tensor, PIL.Image or np.ndarray. Got {}".format(type(image)))
 
-        if isinstance(image, Image.Image):
-            w, h = image.size
+        if isinstance(image, (Image.Image, np.ndarray)):
+            w, h = _image_size(image)
         else:
             w, h = image.shape[-1], image.shape[-2]
 
@@ -227,8 +351,13 @@ class Pad:
                         w_pad_needed // 2 + w_pad_needed % 2,
                         h_pad_needed // 2 + h_pad_needed % 2]
         '''
-        image = F.pad(image, padding_ltrb, fill=self.fill, padding_mode=self.padding_mode)
-        if mask is not None:
+        if isinstance(image, np.ndarray):
+            image = _pad_array(image, padding_ltrb, fill=self.fill)
+        else:
+            image = F.pad(image, padding_ltrb, fill=self.fill, padding_mode=self.padding_mode)
+        if isinstance(mask, np.ndarray):
+            mask = _pad_array(mask, padding_ltrb, fill=255)
+        elif mask is not None:
             mask = F.pad(mask, padding_ltrb, fill=255, padding_mode=self.padding_mode)
         if bbox is not None:
             padding_left, padding_top, _, _ = padding_ltrb
@@ -262,6 +391,9 @@ class ColorJitter(T.ColorJitter):
             self.get_params(self.brightness, self.contrast, self.saturation, self.hue)
 
         if random.random() < self.p:
+            is_array = isinstance(image, np.ndarray)
+            if is_array:
+                image = _as_chw(image)
             for fn_id in fn_idx:
                 if fn_id == 0 and brightness_factor is not None:
                     image = F.adjust_brightness(image, brightness_factor)
@@ -271,6 +403,8 @@ class ColorJitter(T.ColorJitter):
                     image = F.adjust_saturation(image, saturation_factor)
                 elif fn_id == 3 and hue_factor is not None:
                     image = F.adjust_hue(image, hue_factor)
+            if is_array:
+                image = _as_hwc(image, 3)
 
         return image, label, mask, bbox, keypoint
 
@@ -313,9 +447,15 @@ class RandomCrop:
 
     def __call__(self, image, label=None, mask=None, bbox=None, keypoint=None, dataset=None):
         image, mask, bbox = self.image_pad_if_needed(image=image, mask=mask, bbox=bbox)
-        i, j, h, w = T.RandomCrop.get_params(image, (self.size_h, self.size_w))
-        image = F.crop(image, i, j, h, w)
-        if mask is not None:
+        if isinstance(image, np.ndarray):
+            i, j, h, w = T.RandomCrop.get_params(_as_chw(image), (self.size_h, self.size_w))
+            image = image[i:i + h, j:j + w]
+        else:
+            i, j, h, w = T.RandomCrop.get_params(image, (self.size_h, self.size_w))
+            image = F.crop(image, i, j, h, w)
+        if isinstance(mask, np.ndarray):
+            mask = mask[i:i + h, j:j + w]
+        elif mask is not None:
             mask = F.crop(mask, i, j, h, w)
         if bbox is not None:
             bbox_candidate = self._crop_bbox(bbox, i, j, h, w)
@@ -360,10 +500,16 @@ class RandomResizedCrop(T.RandomResizedCrop):
         return bbox
 
     def forward(self, image, label=None, mask=None, bbox=None, keypoint=None, dataset=None):
-        w_orig, h_orig = image.size
-        i, j, h, w = self.get_params(image, self.scale, self.ratio)
-        image = F.resized_crop(image, i, j, h, w, self.size, self.interpolation)
-        if mask is not None:
+        w_orig, h_orig = _image_size(image)
+        if isinstance(image, np.ndarray):
+            i, j, h, w = self.get_params(_as_chw(image), self.scale, self.ratio)
+            image = _resize_array(_apply_to_array(F.crop, image, i, j, h, w), self.size, self.interpolation)
+        else:
+            i, j, h, w = self.get_params(image, self.scale, self.ratio)
+            image = F.resized_crop(image, i, j, h, w, self.size, self.interpolation)
+        if isinstance(mask, np.ndarray):
+            mask = _resize_array(_apply_to_array(F.crop, mask, i, j, h, w), self.size, T.InterpolationMode.NEAREST)
+        elif mask is not None:
             mask = F.resized_crop(mask, i, j, h, w, self.size, interpolation=T.InterpolationMode.NEAREST)
         if bbox is not None:
             # img = crop(img, top, left, height, width)
@@ -409,11 +555,7 @@ class RandomErasing(T.RandomErasing):
         super().__init__(p, scale, ratio, value, inplace)
 
     @staticmethod
-    def get_params(
-        img, scale: Tuple[float, float], ratio: Tuple[float, float], value: Optional[int] = None
-    ):
-        img_w, img_h = img.size
-
+    def get_erase_size(img_h: int, img_w: int, scale: Tuple[float, float], ratio: Tuple[float, float]) -> Optional[Tuple[int, int]]:
         area = img_h * img_w
 
         log_ratio = torch.log(torch.tensor(ratio))
@@ -423,14 +565,27 @@ class RandomErasing(T.RandomErasing):
 
             h = int(round(math.sqrt(erase_area * aspect_ratio)))
             w = int(round(math.sqrt(erase_area / aspect_ratio)))
-            if not (h < img_h and w < img_w):
-                continue
+            if h < img_h and w < img_w:
+                return h, w
+        return None
+
+    @staticmethod
+    def get_params(
+        img, scale: Tuple[float, float], ratio: Tuple[float, float], value: Optional[int] = None
+    ):
+        img_w, img_h = _image_size(img)
+        img_mode = img.mode if isinstance(img, Image.Image) else ('L' if img.ndim == 2 else 'RGB')
 
+        erase_size = RandomErasing.get_erase_size(img_h, img_w, scale, ratio)
+        if erase_size is not None:
+            h, w = erase_size
             if value is None:
                 v = np.random.randint(255, size=(h, w)).astype('uint8')
-                v = Image.fromarray(v).convert(img.mode)
+                v = Image.fromarray(v).convert(img_mode)
             else:
-                v = Image.new(img.mode, (w, h), value)
+                v = Image.new(img_mode, (w, h), value)
+            if isinstance(img, np.ndarray):
+                v = np.asarray(v)
 
             i = torch.randint(0, img_h - h + 1, size=(1,)).item()
             j = torch.randint(0, img_w - w + 1, size=(1,)).item()
@@ -442,7 +597,11 @@ class RandomErasing(T.RandomErasing):
     def forward(self, image, label=None, mask=None, bbox=None, keypoint=None, dataset=None):
         if torch.rand(1) < self.p:
             x, y, v = self.get_params(image, scale=self.scale, ratio=self.ratio, value=self.value)
-            image.paste(v, (y, x))
+            if isinstance(image, np.ndarray):
+                if v is not image:
+                    image[x:x + v.shape[0], y:y + v.shape[1]] = v
+            else:
+                image.paste(v, (y, x))
             # TODO: Object-aware
             return image, label, mask, bbox, keypoint
         return image, label, mask, bbox, keypoint
@@ -487,16 +646,8 @@ class TrivialAugmentWide(torch.nn.Module):
             "Equalize": (torch.tensor(0.0), False),
         }
 
-    def forward(self, image, label=None, mask=None, bbox=None, keypoint=None, dataset=None):
-        fill = self.fill
-        channels, height, width = F.get_dimensions(image)
-        if isinstance(image, Tensor):
-            if isinstance(fill, (int, float)):
-                fill = [float(fill)] * channels
-            elif fill is not None:
-                fill = [float(f) for f in fill]
-
-        op_meta = self._augmentation_space(self.num_magnitude_bins)
+    @staticmethod
+    def get_params(op_meta: Dict[str, Tuple[Tensor, bool]]) -> Tuple[str, float]:
         op_index = int(torch.randint(len(op_meta), (1,)).item())
         op_name = list(op_meta.keys())[op_index]
         magnitudes, signed = op_meta[op_name]
@@ -507,6 +658,22 @@ class TrivialAugmentWide(torch.nn.Module):
         )
         if signed and torch.randint(2, (1,)):
             magnitude *= -1.0
+        return op_name, magnitude
+
+    def forward(self, image, label=None, mask=None, bbox=None, keypoint=None, dataset=None):
+        if isinstance(image, np.ndarray):
+            # Ops of torchvision work on the tensor view of the array
+            image, label, mask, bbox, keypoint = self.forward(_as_chw(image), label, mask, bbox, keypoint, dataset)
+            return _as_hwc(image, 3), label, mask, bbox, keypoint
+        fill = self.fill
+        channels, height, width = F.get_dimensions(image)
+        if isinstance(image, Tensor):
+            if isinstance(fill, (int, float)):
+                fill = [float(fill)] * channels
+            elif fill is not None:
+                fill = [float(f) for f in fill]
+
+        op_name, magnitude = self.get_params(self._augmentation_space(self.num_magnitude_bins))
 
         # TODO: Compute mask, bbox
         return _apply_op(image, op_name, magnitude, interpolation=self.interpolation, fill=fill), label, mask, bbox, keypoint
@@ -543,6 +710,10 @@ class AutoAugment(T.AutoAugment):
         Returns:
             PIL Image or Tensor: AutoAugmented image.
         """
+        if isinstance(image, np.ndarray):
+            # Ops of torchvision work on the tensor view of the array
+            image, label, mask, bbox, keypoint = self.forward(_as_chw(image), label, mask, bbox, keypoint, dataset)
+            return _as_hwc(image, 3), label, mask, bbox, keypoint
         fill = self.fill
         channels, height, width = F.get_dimensions(image)
         if isinstance(image, Tensor):
@@ -584,6 +755,15 @@ class HSVJitter:
         hsv_augs *= np.random.randint(0, 2, 3)  # random selection of h, s, v
         hsv_augs = hsv_augs.astype(np.int16)
 
+        if isinstance(image, np.ndarray):
+            # Same lookup tables in HSV of PIL, whose hue is in [0, 255]
+            values = np.arange(256, dtype=np.int16)
+            luts = [(values + hsv_augs[0]) % 180, np.clip(values + hsv_augs[1], 0, 255), np.clip(values + hsv_augs[2], 0, 255)]
+            image_hsv = _rgb_to_hsv_array(image)
+            image_hsv = np.stack([lut.astype(np.uint8)[image_hsv[..., c]] for c, lut in enumerate(luts)], axis=-1)
+            image = cv2.cvtColor(image_hsv, cv2.COLOR_HSV2RGB_FULL)
+            return image, label, mask, bbox, keypoint
+
         image_hsv = image.convert('HSV')
         h, s, v = image_hsv.split()
 
@@ -614,25 +794,20 @@ class RandomResize:
         self.stride = stride
         self.random_range = random_range
         self.resize = Resize(size=base_size, interpolation=interpolation, max_size=None, resize_criteria=None)
-        self.counter = 0
+        self.sizes = self.get_sizes(base_size, stride, random_range)
 
-    def random_set(self):
-        delta = self.stride * random.randint(-self.random_range, self.random_range)
-        size = [self.base_size[0] + delta, self.base_size[1] + delta]
-        self.resize.size = size
+    @staticmethod
+    def get_sizes(base_size: List, stride: int, random_range: int) -> List[List[int]]:
+        return [[base_size[0] + stride * v, base_size[1] + stride * v] for v in range(-random_range, random_range + 1)]
 
     def __call__(self, image, label=None, mask=None, bbox=None, keypoint=None, dataset=None):
         """
-        @illian01:
-            Count random resized samples.
-            If one batch completed, randomly reset target size and set counter to 0.
+        Resize to the size of the batch, which ``MultiScaleBatchSampler`` gives to the dataset with the sample index.
+        Without it (e.g. in the augmentation simulator), a random size is chosen for each image.
         """
-        if self.counter == dataset.batch_size:
-            self.random_set()
-            self.counter = 0
-        image, label, mask, bbox, keypoint = self.resize(image, label, mask, bbox, dataset)
-        self.counter += 1
-        return image, label, mask, bbox, keypoint
+        size = getattr(dataset, 'batch_image_size', None)
+        self.resize.size = list(size) if size is not None else random.choice(self.sizes)
+        return self.resize(image, label, mask, bbox, keypoint, dataset)
 
     def __repr__(self):
         return self.__class__.__name__ + "(base_size={0}, stride={1}, random_range={2})".format(
@@ -745,7 +920,8 @@ class PoseTopDownAffine:
         return warp_mat
 
     def __call__(self, image, label=None, mask=None, bbox=None, keypoint=None, dataset=None):
-        image = np.array(image)
+        is_array = isinstance(image, np.ndarray)
+        image = np.asarray(image)
 
         # This is only for one instance (bbox)
         bbox_ = bbox[0].reshape(2, 2).copy()
@@ -772,7 +948,8 @@ class PoseTopDownAffine:
 
         # Apply affine transform
         image = cv2.warpAffine(image, warp_mat, self.size, flags=cv2.INTER_LINEAR)
-        image = Image.fromarray(image) # return as PIL
+        if not is_array:
+            image = Image.fromarray(image) # return as PIL
 
         # Compute keypoint. Note that this is only for one instance.
         # ``keypoint.shape`` should be (1, num_keypoints, 3)
@@ -808,7 +985,24 @@ class ToTensor(T.ToTensor):
     visualize = False
 
     def __call__(self, image, label=None, mask=None, bbox=None, keypoint=None, dataset=None):
-        image = F.to_tensor(image)
+        image = F.to_tensor(np.ascontiguousarray(image) if isinstance(image, np.ndarray) else image)
+        if mask is not None:
+            mask = torch.as_tensor(np.array(mask), dtype=torch.int64)
+        if bbox is not None:
+            bbox = torch.as_tensor(np.array(bbox), dtype=torch.float)
+
+        return image, label, mask, bbox, keypoint
+
+    def __repr__(self):
+        return self.__class__.__name__ + "()"
+
+
+class PILToTensor(T.PILToTensor):
+    """Convert image to uint8 tensor without scaling, which is normalized later on the collated batch."""
+    visualize = False
+
+    def __call__(self, image, label=None, mask=None, bbox=None, keypoint=None, dataset=None):
+        image = _as_chw(np.ascontiguousarray(image)) if isinstance(image, np.ndarray) else F.pil_to_tensor(image)
         if mask is not None:
             mask = torch.as_tensor(np.array(mask), dtype=torch.int64)
         if bbox is not None:
@@ -21,6 +21,7 @@ class Mixing:
         self.mixup = bool(mixup)
         self.cutmix = bool(cutmix)
         self.num_classes = num_classes
+        self.inplace = inplace
         assert self.mixup or self.cutmix, "One of mixup or cutmix must be activated."
 
         self.transforms = []
@@ -1,5 +1,6 @@
 import math
 import random
+from collections import deque
 from typing import List
 
 import cv2
@@ -157,6 +158,7 @@ class MosaicDetection:
         mixup_prob: float,
         fill: int,
         mosaic_off_epoch: int,
+        pool_size: int = 0,
     ):
         self.size = size
         self.affine_scale = affine_scale
@@ -169,6 +171,21 @@ class MosaicDetection:
         self.mixup_prob = mixup_prob
         self.fill = fill
         self.mosaic_off_epoch = mosaic_off_epoch
+        self.pool_size = pool_size
+        # Recently decoded samples of this worker, which are reused as mosaic and mixup partners
+        self.pool = deque(maxlen=pool_size) if pool_size > 0 else None
+
+    def pull_partner(self, dataset, with_boxes=False):
+        if self.pool is not None and len(self.pool) == self.pool_size:
+            candidates = [item for item in self.pool if len(item[1]) != 0] if with_boxes else self.pool
+            if len(candidates) != 0:
+                return random.choice(candidates)
+        while True:
+            item = dataset.pull_item(random.randint(0, len(dataset) - 1))
+            if self.pool is not None:
+                self.pool.append(item)
+            if not with_boxes or len(item[1]) != 0:
+                return item
 
     def __call__(self, image, label=None, mask=None, bbox=None, keypoint=None, dataset=None):
         # Turn off mosaic augmentation when cur_epoch >= mosaic_off_epoch
@@ -181,19 +198,22 @@ class MosaicDetection:
             yc = int(random.uniform(0.5 * input_h, 1.5 * input_h))
             xc = int(random.uniform(0.5 * input_w, 1.5 * input_w))
 
-            # 3 additional image indices
-            items = [dataset.pull_item(random.randint(0, len(dataset) - 1)) for _ in range(3)]
+            # 3 additional images
+            items = [self.pull_partner(dataset) for _ in range(3)]
             items = [(image, label, bbox)] + items
+            if self.pool is not None:
+                self.pool.append((image, label, bbox))
 
-            c = len(image.split())
+            is_array = isinstance(image, np.ndarray)
+            c = image.shape[2] if is_array else len(image.split())
             mosaic_img = np.full((input_h * 2, input_w * 2, c), self.fill, dtype=np.uint8)
 
             for i_mosaic, (image, label, bbox) in enumerate(items):
-                #h0, w0 = image.shape[:2]  # orig hw
-                w, h = image.size
+                # Partners from ``dataset.pull_item`` are PIL images unless ``array_mode`` is on
+                image = np.asarray(image)
+                h, w = image.shape[:2]
                 scale = min(1. * input_h / h, 1. * input_w / w)
 
-                image = np.array(image)
                 image = cv2.resize(image, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_LINEAR)
 
                 h, w, _ = image.shape[:3]
@@ -244,7 +264,8 @@ class MosaicDetection:
 
             bbox = mosaic_labels[:, :4]
             label = mosaic_labels[:, -1:]
-            mosaic_img = Image.fromarray(mosaic_img) # return as PIL
+            if not is_array:
+                mosaic_img = Image.fromarray(mosaic_img) # return as PIL
             # TODO: Compute mask, keypoint
             return mosaic_img, label, mask, bbox, keypoint
 
@@ -254,12 +275,8 @@ class MosaicDetection:
     def mixup(self, origin_img, origin_labels, input_dim, dataset):
         jit_factor = random.uniform(*self.mixup_scale)
         FLIP = random.uniform(0, 1) > 0.5
-        cp_labels = []
-        while len(cp_labels) == 0:
-            cp_index = random.randint(0, len(dataset) - 1)
-            _, cp_labels, _ = dataset.pull_item(cp_index)
-        img, cp_labels, cp_boxes = dataset.pull_item(cp_index)
-        img = np.array(img)
+        img, cp_labels, cp_boxes = self.pull_partner(dataset, with_boxes=True)
+        img = np.asarray(img)
         cp_labels = np.concatenate([cp_boxes, cp_labels], axis=-1)
 
         if len(img.shape) == 3:
@@ -328,6 +345,6 @@ class MosaicDetection:
         return origin_img.astype(np.uint8), origin_labels
 
     def __repr__(self) -> str:
-        return "{}(size={}, mosaic_prob={}, affine_scale={}, degrees={}, translate={}, shear={}, enable_mixup={}, mixup_prob={}, mixup_scale={}, fill={})".format(
-            self.__class__.__name__, self.size, self.mosaic_prob, self.affine_scale, self.degrees, self.translate, self.shear, self.enable_mixup, self.mixup_prob, self.mixup_scale, self.fill
+        return "{}(size={}, mosaic_prob={}, affine_scale={}, degrees={}, translate={}, shear={}, enable_mixup={}, mixup_prob={}, mixup_scale={}, fill={}, pool_size={})".format(
+            self.__class__.__name__, self.size, self.mosaic_prob, self.affine_scale, self.degrees, self.translate, self.shear, self.enable_mixup, self.mixup_prob, self.mixup_scale, self.fill, self.pool_size
         )
@@ -1,5 +1,6 @@
 from typing import Callable, Dict
 
+from .custom.batch_proc import BatchAutoAugment, BatchColorJitter, BatchRandomErasing, BatchTrivialAugmentWide
 from .custom.image_proc import (
     AutoAugment,
     CenterCrop,
@@ -37,3 +38,11 @@ TRANSFORM_DICT: Dict[str, Callable] = {
     'hsvjitter': HSVJitter,
     'posetopdownaffine': PoseTopDownAffine,
 }
+
+# Transforms of collated uint8 batches, which replace the trailing photometric transforms with ``batch_transform``
+BATCH_TRANSFORM_DICT: Dict[str, Callable] = {
+    'colorjitter': BatchColorJitter,
+    'randomerasing': BatchRandomErasing,
+    'trivialaugmentwide': BatchTrivialAugmentWide,
+    'autoaugment': BatchAutoAugment,
+}
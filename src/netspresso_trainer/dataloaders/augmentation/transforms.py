@@ -1,12 +1,15 @@
+import math
 from functools import partial
+from typing import Dict, List, Optional, Tuple
 
 import cv2
 import numpy as np
 import PIL.Image as Image
 
 from ..utils.constants import IMAGENET_DEFAULT_MEAN, IMAGENET_DEFAULT_STD
+from .custom import batch_proc as TB
 from .custom import image_proc as TC
-from .registry import TRANSFORM_DICT
+from .registry import BATCH_TRANSFORM_DICT, TRANSFORM_DICT
 
 EDGE_SIZE = 4
 Y_K_SIZE = 6
@@ -40,12 +43,121 @@ def transforms_check(transforms):
     return transforms
 
 
-def transforms_custom(conf_augmentation, training):
-    phase_conf = conf_augmentation.train if training else conf_augmentation.inference
+# Transforms whose result does not depend on the pixel resolution of the input image
+RESOLUTION_INDEPENDENT_TRANSFORMS = [
+    'colorjitter', 'hsvjitter', 'randomhorizontalflip', 'randomverticalflip',
+    'randomerasing', 'trivialaugmentwide', 'autoaugment',
+]
+
+
+def _as_hw(size):
+    return (size, size) if isinstance(size, int) else (size[0], size[1])
+
+
+def _min_source_scale(augment, w: int, h: int):
+    """Smallest scale of (w, h) input image which still gives full detail to this resizing transform.
+    ``None`` if the transform does not resize the whole image to a fixed resolution."""
+    name = augment.name.lower()
+    if name == 'resize':
+        if isinstance(augment.size, int):
+            side = max(w, h) if augment.resize_criteria == 'long' else min(w, h)
+            return augment.size / side
+        target_h, target_w = _as_hw(augment.size)
+        return max(target_h / h, target_w / w)
+    if name == 'randomresize':
+        max_delta = augment.stride * augment.random_range
+        target_h, target_w = augment.base_size[0] + max_delta, augment.base_size[1] + max_delta
+        return max(target_h / h, target_w / w)
+    if name == 'randomresizedcrop':
+        # The smallest crop has about sqrt(min_scale) of each side
+        min_scale = augment.scale[0] if not isinstance(augment.scale, (int, float)) else augment.scale
+        return max(_as_hw(augment.size)) / (math.sqrt(min_scale) * min(w, h))
+    if name == 'mosaicdetection':
+        # Each image is fit into ``size`` and then zoomed in with the affine (and mixup) scale
+        target_h, target_w = _as_hw(augment.size)
+        max_zoom = max(augment.affine_scale[1], augment.mixup_scale[1] if augment.enable_mixup else 1.)
+        return min(target_h / h, target_w / w) * max_zoom
+    return None
+
+
+def get_cache_scale(phase_conf, w: int, h: int) -> float:
+    """
+    Scale to downsize (w, h) image at caching time without losing any detail used by the transforms.
+    Only the transforms until the first resizing transform are considered, since the others work on resized image.
+    """
+    if not phase_conf:
+        return 1.
+    for augment in transforms_check(phase_conf):
+        if augment.name.lower() in RESOLUTION_INDEPENDENT_TRANSFORMS:
+            continue
+        scale = _min_source_scale(augment, w, h)
+        return min(scale, 1.) if scale is not None else 1.
+    return 1.
+
+
+# Transforms whose result depends only on the input, so they give the same output in every epoch
+DETERMINISTIC_TRANSFORMS = ['resize', 'centercrop', 'pad']
+
+
+def split_deterministic_transforms(phase_conf) -> Tuple[List, List]:
+    """Split transforms into the leading deterministic transforms and the rest, which have to run in every epoch."""
+    if not phase_conf:
+        return [], []
+    checked_transforms = list(transforms_check(phase_conf))
+    num_deterministic = 0
+    while num_deterministic < len(checked_transforms) \
+            and checked_transforms[num_deterministic].name.lower() in DETERMINISTIC_TRANSFORMS:
+        num_deterministic += 1
+    return checked_transforms[:num_deterministic], checked_transforms[num_deterministic:]
+
+
+def deterministic_transform(phase_conf, additional_targets: Optional[Dict] = None):
+    """Leading deterministic transforms of ``phase_conf`` on PIL images, without conversion to tensor."""
+    preprocess = []
+    for augment in split_deterministic_transforms(phase_conf)[0]:
+        name = augment.name.lower()
+        augment_kwargs = {k: augment[k] for k in augment if k != 'name'}
+        preprocess.append(TRANSFORM_DICT[name](**augment_kwargs))
+    return TC.Compose(preprocess, additional_targets=additional_targets)
+
+
+def get_multi_scale_sizes(phase_conf) -> Optional[List[List[int]]]:
+    """Candidate sizes of ``randomresize`` in ``phase_conf``, one of which ``MultiScaleBatchSampler`` picks for each batch."""
+    for augment in phase_conf or []:
+        if augment.name.lower() == 'randomresize':
+            return TC.RandomResize.get_sizes(augment.base_size, augment.stride, augment.random_range)
+    return None
+
+
+# Photometric transforms which can run on collated uint8 batches with ``augmentation.batch_transform``
+BATCH_TRANSFORMS = ['colorjitter', 'randomerasing', 'trivialaugmentwide', 'autoaugment']
+
+
+def split_batch_transforms(phase_conf) -> Tuple[List, List]:
+    """
+    Split transforms into the per-sample transforms and the trailing photometric transforms, which can run on batches.
+    Photometric transforms followed by any geometric transform stay per-sample, since they do not commute.
+    """
+    if not phase_conf:
+        return [], []
+    checked_transforms = list(transforms_check(phase_conf))
+    num_sample_transforms = len(checked_transforms)
+    while num_sample_transforms > 0 and checked_transforms[num_sample_transforms - 1].name.lower() in BATCH_TRANSFORMS:
+        num_sample_transforms -= 1
+    return checked_transforms[:num_sample_transforms], checked_transforms[num_sample_transforms:]
 
+
+def _sample_transforms(conf_augmentation, phase_conf, skip_deterministic):
     preprocess = []
     if phase_conf:
-        checked_transforms = transforms_check(phase_conf)
+        checked_transforms = list(transforms_check(phase_conf))
+        if skip_deterministic:
+            # Leading deterministic transforms are already applied by offline preprocessing
+            checked_transforms = split_deterministic_transforms(phase_conf)[1]
+        if getattr(conf_augmentation, 'batch_transform', False):
+            # Trailing photometric transforms run on the collated batch
+            num_batch_transforms = len(split_batch_transforms(phase_conf)[1])
+            checked_transforms = checked_transforms[:len(checked_transforms) - num_batch_transforms]
         for augment in checked_transforms:
             name = augment.name.lower()
             augment_kwargs = list(augment.keys())
@@ -54,32 +166,61 @@ def transforms_custom(conf_augmentation, training):
             transform = TRANSFORM_DICT[name](**augment_kwargs)
             preprocess.append(transform)
 
-    preprocess = preprocess + [
+    if getattr(conf_augmentation, 'batch_transform', False):
+        # Samples are kept in uint8, and normalized on the collated batch by ``create_batch_transform``
+        return preprocess + [TC.PILToTensor()]
+    return preprocess + [
         TC.ToTensor(),
         TC.Normalize(mean=IMAGENET_DEFAULT_MEAN, std=IMAGENET_DEFAULT_STD)
     ]
-    return TC.Compose(preprocess)
 
 
-def train_transforms_pidnet(conf_augmentation, training):
-    preprocess = []
+def transforms_custom(conf_augmentation, training, skip_deterministic=False):
     phase_conf = conf_augmentation.train if training else conf_augmentation.inference
 
-    if phase_conf:
-        checked_transforms = transforms_check(phase_conf)
-        for augment in checked_transforms:
-            name = augment.name.lower()
-            augment_kwargs = list(augment.keys())
-            augment_kwargs.remove('name')
-            augment_kwargs = {k:augment[k] for k in augment_kwargs}
-            transform = TRANSFORM_DICT[name](**augment_kwargs)
-            preprocess.append(transform)
+    preprocess = _sample_transforms(conf_augmentation, phase_conf, skip_deterministic)
+    return TC.Compose(preprocess, array_mode=bool(getattr(conf_augmentation, 'array_mode', False)))
 
-    preprocess = preprocess + [
-        TC.ToTensor(),
-        TC.Normalize(mean=IMAGENET_DEFAULT_MEAN, std=IMAGENET_DEFAULT_STD)
-    ]
-    return TC.Compose(preprocess, additional_targets={'edge': 'mask'})
+
+def train_transforms_pidnet(conf_augmentation, training, skip_deterministic=False):
+    phase_conf = conf_augmentation.train if training else conf_augmentation.inference
+
+    preprocess = _sample_transforms(conf_augmentation, phase_conf, skip_deterministic)
+    return TC.Compose(preprocess, additional_targets={'edge': 'mask'},
+                      array_mode=bool(getattr(conf_augmentation, 'array_mode', False)))
+
+
+def mixing_on_device(conf_augmentation) -> bool:
+    """Whether ``mixing`` runs on the batch on the device, instead of the collate function of dataloader workers."""
+    return bool(getattr(conf_augmentation, 'batch_transform', False) or getattr(conf_augmentation, 'device_mixing', False))
+
+
+def create_batch_transform(conf_augmentation, is_training=False, num_classes: Optional[int] = None):
+    """
+    Transform of collated batches on the device. With ``augmentation.batch_transform``, it runs the trailing
+    photometric transforms and normalization of uint8 batches. If ``mixing`` runs on the device, it also runs
+    ``mixing`` in training. ``None`` if every transform runs in the dataloader.
+    """
+    batch_transform = getattr(conf_augmentation, 'batch_transform', False)
+    phase_conf = getattr(conf_augmentation, 'train' if is_training else 'inference', None)
+
+    preprocess = []
+    if batch_transform:
+        for augment in split_batch_transforms(phase_conf)[1]:
+            name = augment.name.lower()
+            augment_kwargs = {k: augment[k] for k in augment if k != 'name'}
+            preprocess.append(BATCH_TRANSFORM_DICT[name](**augment_kwargs))
+        preprocess.append(TB.BatchNormalize(mean=IMAGENET_DEFAULT_MEAN, std=IMAGENET_DEFAULT_STD))
+
+    if is_training and mixing_on_device(conf_augmentation) and phase_conf and phase_conf[-1].name.lower() == 'mixing':
+        # Mixing works on the normalized images, as with ``classification_mix_collate_fn``.
+        # The batch is already a fresh copy on the device, so it is mixed in place.
+        mix_kwargs = {k: phase_conf[-1][k] for k in phase_conf[-1] if k not in ['name', 'inplace']}
+        preprocess.append(TRANSFORM_DICT['mixing'](num_classes=num_classes, inplace=True, **mix_kwargs))
+
+    if len(preprocess) == 0:
+        return None
+    return TB.BatchCompose(preprocess)
 
 
 def create_transform(model_name: str, is_training=False):
@@ -1,12 +1,26 @@
+import io
+import math
+import multiprocessing as mp
 import os
 from abc import ABC, abstractmethod, abstractproperty
+from ctypes import c_long
+from functools import partial
 from itertools import repeat
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
 
 import numpy as np
+import PIL.Image as Image
 import torch
 import torch.utils.data as data
 
+from .augmentation.transforms import deterministic_transform, get_cache_scale
+from .utils.cache import BaseImageCache, build_image_cache, fingerprint
+from .utils.decode import ImageDecoder
+from .utils.hf_preprocess import DEFAULT_NUM_PROC, HFPreprocessor, preprocess_hf_dataset
+from .utils.packed import PackedRecord, load_packed_data
+from .utils.sample_table import SampleTable
+
 
 class BaseCustomDataset(data.Dataset):
 
@@ -17,7 +31,8 @@ class BaseCustomDataset(data.Dataset):
         self.model_name = model_name
 
         self.transform = transform(conf_augmentation)
-        self.samples = samples
+        # Samples are kept in compact columns, so that forked dataloader workers do not copy them
+        self.samples = SampleTable.from_samples(samples)
 
         self._root = conf_data.path.root
         self._idx_to_class = idx_to_class
@@ -26,18 +41,164 @@ class BaseCustomDataset(data.Dataset):
         self._with_label = with_label
 
         self.cache = False
+        self.image_cache: Optional[BaseImageCache] = None
+        self.cache_resolution_capped = False
+        self.decoder = ImageDecoder()
+        self.reduced_decode = False
+        # Images are decoded (or read from the cache) into HWC uint8 arrays, which the transforms take as they are
+        self.array_mode = bool(getattr(conf_augmentation, 'array_mode', False))
+        # Image size of the batch of the current sample, given by ``MultiScaleBatchSampler`` for ``RandomResize``
+        self.batch_image_size = None
+        # Reuse the last decoded image for the next sample of the same index, e.g. repeats of ``RepeatAugSampler``
+        self.echo_image = False
+        self._echoed_image = None
+        # Images which are actually loaded, shared with dataloader workers, so that echoed repeats are not counted
+        self.num_loaded_images = mp.Value(c_long, 0)
+
+    # Whether labels stay valid for images which are decoded at a reduced scale
+    supports_reduced_decode = True
 
     @abstractmethod
     def __getitem__(self, index):
         pass
 
+    def _parse_index(self, index) -> int:
+        # ``MultiScaleBatchSampler`` gives a pair of the sample index and the image size of its batch
+        if isinstance(index, tuple):
+            index, self.batch_image_size = index
+        else:
+            self.batch_image_size = None
+        return index
+
     @abstractmethod
-    def cache_dataset(self, sampler, distributed):
+    def cache_dataset(self, sampler, distributed, cache_conf: Dict):
         pass
 
+    def set_decoder(self, decoder: ImageDecoder):
+        self.decoder = decoder
+        # Original resolution is kept for evaluation, since outputs may be compared in the original image shape
+        self.reduced_decode = decoder.reduced and self.supports_reduced_decode and self._split in ['train', 'training']
+
+    @property
+    def phase_conf_augmentation(self):
+        return self.conf_augmentation.train if self._split in ['train', 'training'] else self.conf_augmentation.inference
+
+    def _cache_images(self, sampler, distributed, cache_conf: Dict, field='image', mode='RGB', tag=None) -> BaseImageCache:
+        keys = list(self.samples.column(field))
+        name = f"{self.conf_data.name}_{self._split}_{field}"
+        if tag is not None:
+            name += f"_{tag}"
+        if field == 'image' and not self.decoder.is_default:
+            name += f"_{self.decoder.key}"
+        self.cache_resolution_capped = cache_conf['cap_resolution']
+        if self.cache_resolution_capped:
+            # Cached images depend on the transforms, so they are kept apart from the full resolution cache
+            name += f"_capped{fingerprint([str(self.phase_conf_augmentation)])[:8]}"
+        return build_image_cache(
+            cache_conf,
+            name=name,
+            keys=keys,
+            load_fn=partial(self._load_sample, field=field, mode=mode),
+            read_fn=partial(self._read_sample_bytes, field=field),
+            decode_fn=partial(self._decode_bytes, field=field, mode=mode),
+            indices=sampler,
+            distributed=distributed,
+            mode=mode,
+            as_array=self.array_mode and field == 'image',
+        )
+
+    def _decode_image(self, source) -> Union[Image.Image, np.ndarray]:
+        scale_fn = partial(get_cache_scale, self.phase_conf_augmentation) if self.reduced_decode else None
+        return self.decoder.decode(source, scale_fn=scale_fn, as_array=self.array_mode)
+
+    def _decode_bytes(self, data: bytes, field='image', mode='RGB') -> Union[Image.Image, np.ndarray]:
+        if field == 'image' and mode == 'RGB':
+            return self._decode_image(data)
+        return Image.open(io.BytesIO(data)).convert(mode)
+
+    def _load_sample(self, index, field='image', mode='RGB') -> Union[Image.Image, np.ndarray]:
+        source = self.samples[index][field]
+        image = self._decode_image(source) if field == 'image' and mode == 'RGB' else self._open_image(source, mode=mode)
+        if self.cache_resolution_capped:
+            image = self._cap_resolution(image, resample=Image.BILINEAR if field == 'image' else Image.NEAREST)
+        return image
+
+    def _cap_resolution(self, image: Union[Image.Image, np.ndarray], resample) -> Union[Image.Image, np.ndarray]:
+        # Downsize the image to the largest resolution which transforms actually use
+        if isinstance(image, np.ndarray):
+            # Resized by PIL, so that cached images are the same with and without ``array_mode``
+            capped = self._cap_resolution(Image.fromarray(image), resample)
+            return image if capped.size == self._image_size(image) else np.array(capped)
+        w, h = image.size
+        scale = get_cache_scale(self.phase_conf_augmentation, w, h)
+        if scale >= 1.:
+            return image
+        return image.resize((max(1, math.ceil(w * scale)), max(1, math.ceil(h * scale))), resample=resample)
+
+    def _read_sample_bytes(self, index, field='image') -> bytes:
+        source = self.samples[index][field]
+        data = bytes(source.read_bytes()) if isinstance(source, PackedRecord) else Path(source).read_bytes()
+        if self.cache_resolution_capped:
+            image = Image.open(io.BytesIO(data))
+            capped = self._cap_resolution(image, resample=Image.BILINEAR if field == 'image' else Image.NEAREST)
+            if capped is not image:
+                # Labels are encoded losslessly
+                buffer = io.BytesIO()
+                capped.save(buffer, format=image.format if field == 'image' and image.format else 'PNG', quality=95)
+                data = buffer.getvalue()
+        return data
+
+    @staticmethod
+    def _image_size(image: Union[Image.Image, np.ndarray]) -> Tuple[int, int]:
+        """(w, h) of PIL image or HWC array."""
+        if isinstance(image, np.ndarray):
+            return image.shape[1], image.shape[0]
+        return image.size
+
+    def _load_cached(self, image_cache: Optional[BaseImageCache], index, field='image', mode='RGB') -> Union[Image.Image, np.ndarray]:
+        if image_cache is not None:
+            return image_cache.load(index)
+        return self._load_sample(index, field=field, mode=mode)
+
+    def _load_image(self, index) -> Union[Image.Image, np.ndarray]:
+        if self.echo_image and self._echoed_image is not None and self._echoed_image[0] == index:
+            # Transforms may modify the image in place (e.g. ``RandomErasing``), so every repeat gets its own copy
+            return self._echoed_image[1].copy()
+        image = self._load_cached(self.image_cache, index)
+        with self.num_loaded_images.get_lock():
+            self.num_loaded_images.value += 1
+        if self.echo_image:
+            self._echoed_image = (index, image.copy())
+        return image
+
+    def pop_num_loaded_images(self) -> int:
+        with self.num_loaded_images.get_lock():
+            num_loaded_images, self.num_loaded_images.value = self.num_loaded_images.value, 0
+        return num_loaded_images
+
+    def pop_cache_stats(self) -> Optional[Dict[str, float]]:
+        if self.image_cache is None:
+            return None
+        return self.image_cache.pop_stats()
+
     def __len__(self):
         return len(self.samples)
 
+    def get_image_sizes(self) -> np.ndarray:
+        """(w, h) of each image, which is read from the image header without decoding."""
+        sizes = np.zeros((len(self.samples), 2), dtype=np.int64)
+        for index, source in enumerate(self.samples.column('image')):
+            with Image.open(source.open() if isinstance(source, PackedRecord) else str(source)) as image:
+                sizes[index] = image.size
+        return sizes
+
+    @staticmethod
+    def _open_image(image, mode='RGB') -> Image.Image:
+        # ``image`` is either a file path or a reference to a sample in packed shards
+        if isinstance(image, PackedRecord):
+            return Image.open(image.open()).convert(mode)
+        return Image.open(str(image)).convert(mode)
+
     @property
     def num_classes(self):
         return self._num_classes
@@ -66,9 +227,11 @@ class BaseHFDataset(data.Dataset):
         self.conf_augmentation = conf_augmentation
         self.model_name = model_name
         self.transform = transform(conf_augmentation)
+        self._transform_factory = transform
         self._root = root
         self._split = split
         self._with_label = with_label
+        self.preprocessed = False
 
     def _load_dataset(self, root, subset_name=None, cache_dir=None):
         from datasets import load_dataset
@@ -77,10 +240,38 @@ class BaseHFDataset(data.Dataset):
         total_dataset = load_dataset(root, name=subset_name, cache_dir=cache_dir)
         return total_dataset
 
-    @abstractmethod
     def __getitem__(self, index):
+        # Read the row only once, since each access to ``self.samples`` decodes the whole row
+        return self._process_row(index, self.samples[index])
+
+    def __getitems__(self, indices: List[int]) -> List:
+        # DataLoader fetches a whole batch with this, so the rows are read from Arrow table in one call
+        rows = self.samples[list(indices)]
+        return [self._process_row(index, {name: values[i] for name, values in rows.items()})
+                for i, index in enumerate(indices)]
+
+    @abstractmethod
+    def _process_row(self, index, row: Dict):
         pass
 
+    @property
+    def phase_conf_augmentation(self):
+        return self.conf_augmentation.train if self._split in ['train', 'training'] else self.conf_augmentation.inference
+
+    @abstractmethod
+    def _build_preprocessor(self, transform) -> HFPreprocessor:
+        pass
+
+    def preprocess(self, num_proc: int = DEFAULT_NUM_PROC):
+        """Run the deterministic part of ``_process_row`` once for all rows. Later, only the rest runs online."""
+        # Boundary maps of PIDNet are transformed along with the masks
+        transform = deterministic_transform(self.phase_conf_augmentation, additional_targets={'edge': 'mask'})
+        preprocessor = self._build_preprocessor(transform)
+        key = fingerprint([self.samples._fingerprint, self._split, preprocessor.key])
+        self.samples = preprocess_hf_dataset(self.samples, preprocessor, key, num_proc=num_proc)
+        self.transform = self._transform_factory(self.conf_augmentation, skip_deterministic=True)
+        self.preprocessed = True
+
     @abstractmethod
     def __len__(self):
         pass
@@ -115,6 +306,10 @@ class BaseDataSampler(ABC):
     def load_data(self):
         raise NotImplementedError
 
+    def load_packed_data(self, split='train'):
+        assert split in ['train', 'valid', 'test'], f"split should be either {['train', 'valid', 'test']}."
+        return load_packed_data(self.conf_data.path.root, split)
+
     @abstractmethod
     def load_samples(self):
         raise NotImplementedError
@@ -3,14 +3,21 @@ from functools import partial
 from pathlib import Path
 from typing import Dict, List, Optional, Type, Union
 
+import torch
 import torch.distributed as dist
 from loguru import logger
+from torch.utils.data import default_collate
 
+from ..metrics.segmentation.metric import IGNORE_INDEX_NONE_VALUE
 from .augmentation.registry import TRANSFORM_DICT
-from .classification import classification_mix_collate_fn, classification_onehot_collate_fn
+from .augmentation.transforms import get_multi_scale_sizes, mixing_on_device
+from .base import BaseCustomDataset
+from .classification import classification_collate_fn, classification_mix_collate_fn
 from .detection import detection_collate_fn
 from .registry import CREATE_TRANSFORM, CUSTOM_DATASET, DATA_SAMPLER, HUGGINGFACE_DATASET
-from .utils.loader import create_loader
+from .utils.hf_preprocess import DEFAULT_NUM_PROC
+from .utils.loader import create_loader, padded_collate
+from .utils.streaming import DEFAULT_SHUFFLE_BUFFER, StreamingHFDataset
 
 TRAIN_VALID_SPLIT_RATIO = 0.9
 
@@ -29,9 +36,10 @@ def build_dataset(conf_data, conf_augmentation, task: str, model_name: str, dist
 
     data_format = conf_data.format
 
-    assert data_format in ['local', 'huggingface'], f"No such data format named {data_format} in {['local', 'huggingface']}!"
+    assert data_format in ['local', 'huggingface', 'packed'], f"No such data format named {data_format} in {['local', 'huggingface', 'packed']}!"
 
-    if data_format == 'local':
+    if data_format in ['local', 'packed']:
+        # Packed dataset shares the custom dataset, only the way of reading each sample is different
         assert task in CUSTOM_DATASET, f"Local dataset for {task} is not yet supported!"
         data_sampler = DATA_SAMPLER[task](conf_data, train_valid_split_ratio=TRAIN_VALID_SPLIT_RATIO)
 
@@ -93,21 +101,55 @@ def build_dataset(conf_data, conf_augmentation, task: str, model_name: str, dist
                 huggingface_dataset=test_samples, transform=target_transform, label_value_to_idx=label_value_to_idx
             )
 
+        if getattr(conf_data.metadata, 'preprocess', False):
+            assert 'num_samples' not in misc, "Offline preprocessing is not supported in streaming mode!"
+            num_proc = conf_data.metadata.preprocess_num_proc if getattr(conf_data.metadata, 'preprocess_num_proc', None) \
+                else DEFAULT_NUM_PROC
+            for dataset in [train_dataset, valid_dataset, test_dataset]:
+                if dataset is not None:
+                    dataset.preprocess(num_proc=num_proc)
+
+        if 'num_samples' in misc:
+            # Streaming dataset is iterated, not indexed
+            shuffle_buffer = conf_data.metadata.shuffle_buffer if getattr(conf_data.metadata, 'shuffle_buffer', None) \
+                else DEFAULT_SHUFFLE_BUFFER
+            num_samples = misc['num_samples']
+            train_dataset = StreamingHFDataset(train_dataset, num_samples['train'], shuffle=True, shuffle_buffer=shuffle_buffer)
+            if valid_dataset is not None:
+                valid_dataset = StreamingHFDataset(valid_dataset, num_samples['valid'], shuffle=False)
+            if test_dataset is not None:
+                test_dataset = StreamingHFDataset(test_dataset, num_samples['test'], shuffle=False)
+
     return train_dataset, valid_dataset, test_dataset
 
 
-def build_dataloader(conf, task: str, model_name: str, dataset, phase, profile=False):
+def build_dataloader(conf, task: str, model_name: str, dataset, phase, profile=False, devices=None):
     is_training = phase == 'train'
 
     #TODO: Temporarily set ``cache_data`` as optional since this is experimental
     cache_data = conf.environment.cache_data if hasattr(conf.environment, 'cache_data') else False
+    decode_backend = conf.environment.decode_backend if hasattr(conf.environment, 'decode_backend') else None
+    # Number of batches to be copied to ``devices`` (or loaded in a background thread) ahead of the current batch
+    prefetch = conf.environment.prefetch if getattr(conf.environment, 'prefetch', None) else 0
+    pin_memory = bool(prefetch) and torch.cuda.is_available()
+    # Float images are sent from dataloader workers in half precision
+    fp16_transport = getattr(conf.environment, 'fp16_transport', False)
+    # Image size of each batch of ``randomresize``, given to the dataset with sample indices
+    multi_scale_sizes = get_multi_scale_sizes(getattr(conf.augmentation, phase, None)) if is_training else None
+    assert multi_scale_sizes is None or isinstance(dataset, BaseCustomDataset), \
+        "randomresize is only supported for local and packed datasets, whose batches are given the image size!"
+    # The number of augmented views of each training sample in an epoch
+    num_aug_repeats = (getattr(conf.environment, 'num_aug_repeats', None) or 0) if is_training else 0
+    # Evaluation batches of images with similar shape, which are padded to the same size
+    eval_bucketing = not is_training and getattr(conf.environment, 'eval_bucketing', False) \
+        and getattr(dataset, 'with_label', False) and hasattr(dataset, 'get_image_sizes')
 
     if task == 'classification':
         # TODO: ``phase`` should be removed later.
         transforms = getattr(conf.augmentation, phase, None)
         if transforms:
             name = transforms[-1].name.lower()
-            if name == 'mixing':
+            if name == 'mixing' and not mixing_on_device(conf.augmentation):
                 mix_kwargs = list(transforms[-1].keys())
                 mix_kwargs.remove('name')
                 mix_kwargs = {k:transforms[-1][k] for k in mix_kwargs}
@@ -116,9 +158,11 @@ def build_dataloader(conf, task: str, model_name: str, dataset, phase, profile=F
 
                 collate_fn = partial(classification_mix_collate_fn, mix_transforms=mix_transforms)
             else:
-                collate_fn = partial(classification_onehot_collate_fn, num_classes=dataset.num_classes)
+                # Labels are sent as class indices, and expanded to one-hot vectors by the task processor.
+                # Mixing on the device is done by the task processor too (see ``create_batch_transform``)
+                collate_fn = classification_collate_fn
         else:
-            collate_fn = partial(classification_onehot_collate_fn, num_classes=dataset.num_classes)
+            collate_fn = classification_collate_fn
 
         dataloader = create_loader(
             dataset,
@@ -126,20 +170,35 @@ def build_dataloader(conf, task: str, model_name: str, dataset, phase, profile=F
             logger,
             batch_size=conf.environment.batch_size,
             is_training=is_training,
+            num_aug_repeats=num_aug_repeats,
             num_workers=conf.environment.num_workers if not profile else 1,
             distributed=conf.distributed,
             collate_fn=collate_fn,
-            pin_memory=False,
+            pin_memory=pin_memory,
+            fp16=fp16_transport,
             world_size=conf.world_size,
             rank=conf.rank,
             cache_data=cache_data,
+            decode_backend=decode_backend,
+            prefetch=prefetch,
+            device=devices,
+            multi_scale_sizes=multi_scale_sizes,
             kwargs=None
         )
     elif task == 'segmentation':
         collate_fn = None
+        bucket_image_sizes = None
 
         if phase == 'train':
             batch_size = conf.environment.batch_size
+        elif eval_bucketing:
+            # Padded pixels of labels are ignored by the loss and metric
+            losses = getattr(conf.model, 'losses', None)
+            ignore_index = getattr(losses[0], 'ignore_index', None) if losses else None
+            batch_size = conf.environment.batch_size
+            bucket_image_sizes = dataset.get_image_sizes()
+            collate_fn = partial(padded_collate, collate_fn=default_collate, pad_values={
+                'pixel_values': 0, 'labels': ignore_index if ignore_index is not None else IGNORE_INDEX_NONE_VALUE, 'edges': 0})
         else:
             batch_size = conf.environment.batch_size if model_name == 'pidnet' and not conf.distributed else 1
 
@@ -149,20 +208,32 @@ def build_dataloader(conf, task: str, model_name: str, dataset, phase, profile=F
             logger,
             batch_size=batch_size,
             is_training=is_training,
+            num_aug_repeats=num_aug_repeats,
             num_workers=conf.environment.num_workers if not profile else 1,
             distributed=conf.distributed,
             collate_fn=collate_fn,
-            pin_memory=False,
+            pin_memory=pin_memory,
+            fp16=fp16_transport,
             world_size=conf.world_size,
             rank=conf.rank,
             cache_data=cache_data,
+            decode_backend=decode_backend,
+            prefetch=prefetch,
+            device=devices,
+            bucket_image_sizes=bucket_image_sizes,
+            multi_scale_sizes=multi_scale_sizes,
             kwargs=None
         )
     elif task == 'detection':
         collate_fn = detection_collate_fn
+        bucket_image_sizes = None
 
         if phase == 'train':
             batch_size = conf.environment.batch_size
+        elif eval_bucketing:
+            batch_size = conf.environment.batch_size
+            bucket_image_sizes = dataset.get_image_sizes()
+            collate_fn = partial(padded_collate, collate_fn=detection_collate_fn, pad_values={'pixel_values': 0})
         else:
             batch_size = conf.environment.batch_size if not conf.distributed else 2
 
@@ -172,13 +243,20 @@ def build_dataloader(conf, task: str, model_name: str, dataset, phase, profile=F
             logger,
             batch_size=batch_size,
             is_training=is_training,
+            num_aug_repeats=num_aug_repeats,
             num_workers=conf.environment.num_workers if not profile else 1,
             distributed=conf.distributed,
             collate_fn=collate_fn,
-            pin_memory=False,
+            pin_memory=pin_memory,
+            fp16=fp16_transport,
             world_size=conf.world_size,
             rank=conf.rank,
             cache_data=cache_data,
+            decode_backend=decode_backend,
+            prefetch=prefetch,
+            device=devices,
+            bucket_image_sizes=bucket_image_sizes,
+            multi_scale_sizes=multi_scale_sizes,
             kwargs=None
         )
     elif task == 'pose_estimation':
@@ -190,13 +268,19 @@ def build_dataloader(conf, task: str, model_name: str, dataset, phase, profile=F
             logger,
             batch_size=conf.environment.batch_size,
             is_training=is_training,
+            num_aug_repeats=num_aug_repeats,
             num_workers=conf.environment.num_workers if not profile else 1,
             distributed=conf.distributed,
             collate_fn=collate_fn,
-            pin_memory=False,
+            pin_memory=pin_memory,
+            fp16=fp16_transport,
             world_size=conf.world_size,
             rank=conf.rank,
             cache_data=cache_data,
+            decode_backend=decode_backend,
+            prefetch=prefetch,
+            device=devices,
+            multi_scale_sizes=multi_scale_sizes,
             kwargs=None
         )
     else:
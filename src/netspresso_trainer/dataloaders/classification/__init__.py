@@ -1,3 +1,7 @@
-from .dataset import ClassficationDataSampler, classification_mix_collate_fn, classification_onehot_collate_fn
+from .dataset import (
+    ClassficationDataSampler,
+    classification_collate_fn,
+    classification_mix_collate_fn,
+)
 from .huggingface import ClassificationHFDataset
 from .local import ClassificationCustomDataset
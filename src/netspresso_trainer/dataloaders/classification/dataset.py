@@ -1,21 +1,18 @@
 import csv
 import random
 from collections import Counter
-from itertools import chain
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple, Union
 
 import torch
 from loguru import logger
 from omegaconf import DictConfig
-from torch.nn import functional as F
 from torch.utils.data import random_split
 
 from ..base import BaseDataSampler
 from ..utils.constants import IMG_EXTENSIONS
-from ..utils.misc import natural_key
-
-VALID_IMG_EXTENSIONS = IMG_EXTENSIONS + tuple((x.upper() for x in IMG_EXTENSIONS))
+from ..utils.manifest import load_manifest, scan_files
+from ..utils.streaming import scan_label_column, split_streaming_dataset
 
 
 def load_custom_class_map(id_mapping: List[str]):
@@ -49,7 +46,7 @@ def is_file_dict(image_dir: Union[Path, str], file_or_dir_to_idx):
     return True
 
 
-def classification_mix_collate_fn(original_batch, mix_transforms):
+def classification_collate_fn(original_batch):
     indices = []
     images = []
     target = []
@@ -62,26 +59,14 @@ def classification_mix_collate_fn(original_batch, mix_transforms):
     images = torch.stack(images, dim=0)
     target = torch.tensor(target, dtype=torch.long)
 
-    images, target = mix_transforms(images, target)
-
     outputs = (indices, images, target)
     return outputs
 
 
-def classification_onehot_collate_fn(original_batch, num_classes):
-    indices = []
-    images = []
-    target = []
-    for data_sample in original_batch:
-        indices.append(data_sample[0])
-        images.append(data_sample[1])
-        target.append(data_sample[2])
+def classification_mix_collate_fn(original_batch, mix_transforms):
+    indices, images, target = classification_collate_fn(original_batch)
 
-    indices = torch.tensor(indices, dtype=torch.long)
-    images = torch.stack(images, dim=0)
-    target = torch.tensor(target, dtype=torch.long)
-    if -1 not in target:
-        target = F.one_hot(target, num_classes=num_classes).to(dtype=images.dtype)
+    images, target = mix_transforms(images, target)
 
     outputs = (indices, images, target)
     return outputs
@@ -92,6 +77,8 @@ class ClassficationDataSampler(BaseDataSampler):
         super(ClassficationDataSampler, self).__init__(conf_data, train_valid_split_ratio)
 
     def load_data(self, split='train'):
+        if self.conf_data.format == 'packed':
+            return self.load_packed_data(split=split)
         data_root = Path(self.conf_data.path.root)
         split_dir = self.conf_data.path[split]
         image_dir: Path = data_root / split_dir.image
@@ -99,22 +86,27 @@ class ClassficationDataSampler(BaseDataSampler):
         images_and_targets: List[Dict[str, Optional[Union[str, int]]]] = []
 
         assert split in ['train', 'valid', 'test'], f"split should be either {['train', 'valid', 'test']}"
-        if annotation_path is not None:
-            file_to_idx = load_class_map_with_id_mapping(annotation_path)
-            for ext in IMG_EXTENSIONS:
-                for file in chain(image_dir.glob(f'*{ext}'), image_dir.glob(f'*{ext.upper()}')):
-                    if file.name in file_to_idx:
-                        images_and_targets.append({'image': str(file), 'label': file_to_idx[file.name]})
+        manifest_name = f"{self.conf_data.name}_{split}"
+        manifest_sources = [image_dir, annotation_path]
+
+        def _scan():
+            image_files = scan_files(image_dir, IMG_EXTENSIONS)
+            if annotation_path is not None:
+                file_to_idx = load_class_map_with_id_mapping(annotation_path)
+                for file in image_files:
+                    file_name = Path(file).name
+                    if file_name in file_to_idx:
+                        images_and_targets.append({'image': file, 'label': file_to_idx[file_name]})
                         continue
                     logger.debug(f"Found file without label: {file}")
-        else:
-            if split in ['train', 'valid']:
-                raise ValueError("For train and valid split, label path must be provided!")
-            for ext in VALID_IMG_EXTENSIONS:
-                images_and_targets.extend([{'image': str(file), 'label': None} for file in chain(image_dir.glob(f'*{ext}'), image_dir.glob(f'*{ext.upper()}'))])
+            else:
+                if split in ['train', 'valid']:
+                    raise ValueError("For train and valid split, label path must be provided!")
+                images_and_targets.extend([{'image': file, 'label': None} for file in image_files])
 
-        images_and_targets = sorted(images_and_targets, key=lambda k: natural_key(k['image']))
-        return images_and_targets
+            return images_and_targets
+
+        return load_manifest(manifest_name, manifest_sources, _scan)
 
     def load_samples(self):
         assert self.conf_data.id_mapping is not None
@@ -153,15 +145,20 @@ class ClassficationDataSampler(BaseDataSampler):
         if cache_dir is not None:
             cache_dir = Path(cache_dir)
             Path(cache_dir).mkdir(exist_ok=True, parents=True)
-        total_dataset = load_dataset(root, name=subset_name, cache_dir=cache_dir)
+        streaming = bool(getattr(self.conf_data.metadata, 'streaming', False))
+        total_dataset = load_dataset(root, name=subset_name, cache_dir=cache_dir, streaming=streaming)
 
         label_feature_name = self.conf_data.metadata.features.label
         # Assumed hugging face dataset always has training split
-        label_feature = total_dataset['train'].features[label_feature_name]
+        label_feature = total_dataset['train'].features[label_feature_name] \
+            if total_dataset['train'].features is not None else None
         if isinstance(label_feature, ClassLabel):
             labels: List[str] = label_feature.names
+        elif streaming:
+            labels = scan_label_column(total_dataset['train'], label_feature_name)
         else:
-            labels = list({sample[label_feature_name] for sample in total_dataset['train']})
+            # Read only the label column, not to decode every image
+            labels = sorted(total_dataset['train'].unique(label_feature_name))
 
         if isinstance(labels[0], int):
             # TODO: find class_map <-> idx and apply it (ex. using id_mapping)
@@ -169,6 +166,11 @@ class ClassficationDataSampler(BaseDataSampler):
         elif isinstance(labels[0], str):
             idx_to_class: Dict[int, str] = dict(enumerate(labels))
 
+        if streaming:
+            train_samples, valid_samples, test_samples, num_samples = split_streaming_dataset(
+                total_dataset, self.conf_data.metadata.features.image, self.train_valid_split_ratio)
+            return train_samples, valid_samples, test_samples, {'idx_to_class': idx_to_class, 'num_samples': num_samples}
+
         exists_valid = 'validation' in total_dataset
         exists_test = 'test' in total_dataset
 
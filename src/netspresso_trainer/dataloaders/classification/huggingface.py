@@ -4,6 +4,7 @@ from typing import Union
 import PIL.Image as Image
 
 from ..base import BaseHFDataset
+from ..utils.hf_preprocess import HFPreprocessor
 
 
 class ClassificationHFDataset(BaseHFDataset):
@@ -50,9 +51,12 @@ class ClassificationHFDataset(BaseHFDataset):
     def __len__(self):
         return self.samples.num_rows
 
-    def __getitem__(self, index):
-        img: Image.Image = self.samples[index][self.image_feature_name]
-        target: Union[int, str] = self.samples[index][self.label_feature_name] if self.label_feature_name in self.samples[index] else None
+    def _build_preprocessor(self, transform):
+        return HFPreprocessor(self.image_feature_name, self.label_feature_name, transform)
+
+    def _process_row(self, index, row):
+        img: Image.Image = row[self.image_feature_name]
+        target: Union[int, str] = row[self.label_feature_name] if self.label_feature_name in row else None
         if isinstance(target, str):
             target: int = self.class_to_idx[target]
 
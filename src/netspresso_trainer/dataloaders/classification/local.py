@@ -1,8 +1,5 @@
 import os
-from functools import partial
-from multiprocessing.pool import ThreadPool
 
-import PIL.Image as Image
 import torch.distributed as dist
 from loguru import logger
 
@@ -18,32 +15,20 @@ class ClassificationCustomDataset(BaseCustomDataset):
             split, samples, transform, with_label, **kwargs
         )
 
-    def cache_dataset(self, sampler, distributed):
+    def cache_dataset(self, sampler, distributed, cache_conf):
         if (not distributed) or (distributed and dist.get_rank() == 0):
-            logger.info(f'Caching | Loading samples of {self.mode} to memory... This can take minutes.')
-
-        def _load(i, samples):
-            image = Image.open(str(samples[i]['image'])).convert('RGB')
-            return i, image
-
-        num_threads = 8 # TODO: Compute appropriate num_threads
-        load_imgs = ThreadPool(num_threads).imap(
-            partial(_load, samples=self.samples),
-            sampler
-        )
-        for i, image in load_imgs:
-            self.samples[i]['image'] = image
+            logger.info(f'Caching | Loading samples of {self.mode} to {cache_conf["backend"]} cache... This can take minutes.')
 
+        self.image_cache = self._cache_images(sampler, distributed, cache_conf)
         self.cache = True
 
     def __getitem__(self, index):
-        img = self.samples[index]['image']
+        index = self._parse_index(index)
+        img = self._load_image(index)
         target = self.samples[index]['label']
-        if not self.cache:
-            img = Image.open(img).convert('RGB')
 
         if self.transform is not None:
-            out = self.transform(img)
+            out = self.transform(img, dataset=self)
 
         if target is None:
             target = -1  # To be ignored at cross-entropy loss
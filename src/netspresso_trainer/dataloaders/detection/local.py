@@ -1,8 +1,6 @@
 import os
-from functools import partial
-from multiprocessing.pool import ThreadPool
 from pathlib import Path
-from typing import List
+from typing import List, Union
 
 import numpy as np
 import PIL.Image as Image
@@ -12,6 +10,8 @@ from loguru import logger
 from omegaconf import OmegaConf
 
 from ..base import BaseCustomDataset
+from ..utils.label_index import LabelIndexRecord
+from ..utils.packed import PackedRecord
 
 ID2LABEL_FILENAME = "id2label.json"
 TEMP_COCO_LABEL_FILE = "data/detection/coco.yaml"
@@ -24,23 +24,38 @@ def exist_name(candidate, folder_iterable):
         return list(filter(lambda x: candidate[1] in x, folder_iterable))[0]
 
 
-def get_label(label_file: Path):
-    target = Path(label_file).read_text()
+def get_label(label_file: Union[Path, PackedRecord, LabelIndexRecord]):
+    if isinstance(label_file, LabelIndexRecord):
+        # Labels are already parsed in the label index
+        rows = label_file.read()
+        return rows['classes'][..., np.newaxis].astype(np.float32), rows['boxes']
 
-    if target == '': # target label can be empty string
-        target_array = np.zeros((0, 5))
+    if isinstance(label_file, PackedRecord):
+        # Packed dataset already has the parsed (num_boxes, 5) label array
+        target_array = label_file.read_array()
     else:
-        try:
-            target_array = np.array([list(map(float, box.split(' '))) for box in target.split('\n') if box.strip()])
-        except ValueError as e:
-            print(target)
-            raise e
+        target = Path(label_file).read_text()
+
+        if target == '': # target label can be empty string
+            target_array = np.zeros((0, 5))
+        else:
+            try:
+                target_array = np.array([list(map(float, box.split(' '))) for box in target.split('\n') if box.strip()])
+            except ValueError as e:
+                print(target)
+                raise e
 
     label, boxes = target_array[:, 0], target_array[:, 1:]
     label = label[..., np.newaxis]
     return label, boxes
 
 
+def parse_label_rows(label_file: Union[Path, PackedRecord]):
+    # Columns of the label index
+    label, boxes = get_label(label_file)
+    return {'classes': label[:, 0].astype(np.int32), 'boxes': boxes.astype(np.float32)}
+
+
 class DetectionCustomDataset(BaseCustomDataset):
 
     def __init__(self, conf_data, conf_augmentation, model_name, idx_to_class,
@@ -61,38 +76,20 @@ class DetectionCustomDataset(BaseCustomDataset):
         converted[..., 3] = h * (original[..., 1] + original[..., 3] / 2) + padh
         return converted
 
-    def cache_dataset(self, sampler, distributed):
+    def cache_dataset(self, sampler, distributed, cache_conf):
         if (not distributed) or (distributed and dist.get_rank() == 0):
-            logger.info(f'Caching | Loading samples of {self.mode} to memory... This can take minutes.')
-
-        def _load(i, samples):
-            image = Image.open(Path(samples[i]['image'])).convert('RGB')
-            label = self.samples[i]['label']
-            if label is not None:
-                label = get_label(Path(label))
-            return i, image, label
-
-        num_threads = 8 # TODO: Compute appropriate num_threads
-        load_imgs = ThreadPool(num_threads).imap(
-            partial(_load, samples=self.samples),
-            sampler
-        )
-        for i, image, label in load_imgs:
-            self.samples[i]['image'] = image
-            self.samples[i]['label'] = label
+            logger.info(f'Caching | Loading samples of {self.mode} to {cache_conf["backend"]} cache... This can take minutes.')
 
+        self.image_cache = self._cache_images(sampler, distributed, cache_conf)
         self.cache = True
 
     def __getitem__(self, index):
-        if self.cache:
-            img = self.samples[index]['image']
-            ann = self.samples[index]['label']
-        else:
-            img = Image.open(self.samples[index]['image']).convert('RGB')
-            ann_path = Path(self.samples[index]['label']) if self.samples[index]['label'] is not None else None
-            ann = get_label(Path(ann_path)) if ann_path is not None else None
+        index = self._parse_index(index)
+        img = self._load_image(index)
+        ann_path = self.samples[index]['label']
+        ann = get_label(ann_path) if ann_path is not None else None
 
-        w, h = img.size
+        w, h = self._image_size(img)
 
         outputs = {}
         outputs.update({'indices': index})
@@ -121,17 +118,17 @@ class DetectionCustomDataset(BaseCustomDataset):
         return outputs
 
     def pull_item(self, index):
-        img_path = Path(self.samples[index]['image'])
-        ann_path = Path(self.samples[index]['label']) if 'label' in self.samples[index] else None
-        img = Image.open(str(img_path)).convert('RGB')
+        # Mosaic and MixUp partners bypass ``_load_image``, so they neither replace the echoed image
+        # nor count as loaded images of the sampler
+        img = self._load_cached(self.image_cache, index)
+        ann_path = self.samples[index]['label'] if 'label' in self.samples[index] else None
 
-        org_img = img.copy()
-        w, h = img.size
+        w, h = self._image_size(img)
         if ann_path is None:
-            return org_img, np.zeros(0, 1), np.zeros(0, 5)
+            return img, np.zeros((0, 1)), np.zeros((0, 4))
 
-        label, boxes_yolo = get_label(Path(ann_path))
+        label, boxes_yolo = get_label(ann_path)
         boxes = self.xywhn2xyxy(boxes_yolo, w, h)
 
-        return org_img, label, boxes
+        return img, label, boxes
 
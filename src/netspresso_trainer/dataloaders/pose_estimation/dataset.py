@@ -1,6 +1,5 @@
 import json
 import os
-from itertools import chain
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple, Union
 
@@ -12,7 +11,10 @@ from torch.utils.data import random_split
 
 from ..base import BaseDataSampler
 from ..utils.constants import IMG_EXTENSIONS
-from ..utils.misc import natural_key
+from ..utils.label_index import build_label_index
+from ..utils.manifest import load_manifest, scan_dirs, scan_files
+from ..utils.packed import PACKED_INDEX_SUFFIX
+from .local import parse_pose_rows
 
 
 def load_custom_class_map(id_mapping: List[str]):
@@ -25,6 +27,25 @@ class PoseEstimationDataSampler(BaseDataSampler):
         super(PoseEstimationDataSampler, self).__init__(conf_data, train_valid_split_ratio)
 
     def load_data(self, split='train'):
+        if self.conf_data.format == 'packed':
+            images_and_targets = self.load_packed_data(split=split)
+            label_sources = [Path(self.conf_data.path.root) / f"{split}{PACKED_INDEX_SUFFIX}"]
+        else:
+            images_and_targets = self.load_local_data(split=split)
+            split_dir = self.conf_data.path[split]
+            label_sources = [Path(self.conf_data.path.root) / split_dir.label] if split_dir.label is not None else []
+        return self.index_labels(images_and_targets, split=split, sources=label_sources)
+
+    def index_labels(self, images_and_targets, split, sources):
+        # Parse all labels once into columnar label index, so that datasets only slice it
+        if len(images_and_targets) == 0 or any(sample['label'] is None for sample in images_and_targets):
+            return images_and_targets
+        records = build_label_index(f"{self.conf_data.name}_{split}",
+                                    labels=[sample['label'] for sample in images_and_targets],
+                                    parse_fn=parse_pose_rows, sources=sources)
+        return [{'image': sample['image'], 'label': record} for sample, record in zip(images_and_targets, records)]
+
+    def load_local_data(self, split='train'):
         assert split in ['train', 'valid', 'test'], f"split should be either {['train', 'valid', 'test']}."
         data_root = Path(self.conf_data.path.root)
         split_dir = self.conf_data.path[split]
@@ -33,27 +54,29 @@ class PoseEstimationDataSampler(BaseDataSampler):
         images: List[str] = []
         labels: List[str] = []
         images_and_targets: List[Dict[str, str]] = []
-        if annotation_dir is not None:
-            for ext in IMG_EXTENSIONS:
-                for file in chain(image_dir.glob(f'*{ext}'), image_dir.glob(f'*{ext.upper()}')):
-                    ann_path_maybe = annotation_dir / file.with_suffix('.txt').name
-                    if not ann_path_maybe.exists():
+        manifest_name = f"{self.conf_data.name}_{split}"
+        manifest_sources = [image_dir, annotation_dir]
+
+        def _scan():
+            if annotation_dir is not None:
+                image_files, label_files = scan_dirs([(image_dir, IMG_EXTENSIONS), (annotation_dir, ('.txt',))])
+                label_names = {Path(file).name for file in label_files}
+                for file in image_files:
+                    ann_name = Path(file).with_suffix('.txt').name
+                    if ann_name not in label_names:
                         continue
-                    images.append(str(file))
-                    labels.append(str(ann_path_maybe))
-                # TODO: get paired data from regex pattern matching (self.conf_data.path.pattern)
+                    images.append(file)
+                    labels.append(str(annotation_dir / ann_name))
+                    # TODO: get paired data from regex pattern matching (self.conf_data.path.pattern)
 
-            images = sorted(images, key=lambda k: natural_key(k))
-            labels = sorted(labels, key=lambda k: natural_key(k))
-            images_and_targets.extend([{'image': str(image), 'label': str(label)} for image, label in zip(images, labels)])
+                images_and_targets.extend([{'image': image, 'label': label} for image, label in zip(images, labels)])
 
-        else:
-            for ext in IMG_EXTENSIONS:
-                images_and_targets.extend([{'image': str(file), 'label': None}
-                                        for file in chain(image_dir.glob(f'*{ext}'), image_dir.glob(f'*{ext.upper()}'))])
-            images_and_targets = sorted(images_and_targets, key=lambda k: natural_key(k['image']))
+            else:
+                images_and_targets.extend([{'image': file, 'label': None} for file in scan_files(image_dir, IMG_EXTENSIONS)])
+
+            return images_and_targets
 
-        return images_and_targets
+        return load_manifest(manifest_name, manifest_sources, _scan)
 
     def load_samples(self):
         assert self.conf_data.id_mapping is not None
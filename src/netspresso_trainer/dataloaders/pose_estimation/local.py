@@ -1,8 +1,6 @@
 import os
-from functools import partial
-from multiprocessing.pool import ThreadPool
 from pathlib import Path
-from typing import List
+from typing import List, Optional, Tuple, Union
 
 import cv2
 import numpy as np
@@ -13,9 +11,24 @@ from loguru import logger
 from omegaconf import OmegaConf
 
 from ..base import BaseCustomDataset
+from ..utils.label_index import LabelIndexRecord
+from ..utils.packed import PackedRecord
+
+
+def parse_pose_rows(label_file: Union[Path, PackedRecord]):
+    # Columns of the label index. Each row is (keypoints (x, y, visibility) * num_keypoints, bbox) of an instance
+    if isinstance(label_file, PackedRecord):
+        # Packed dataset keeps parsed instances as (num_instances, num_keypoints * 3 + 4) array
+        instances = label_file.read_array().astype(np.float32)
+    else:
+        lines = [line.strip() for line in Path(label_file).read_text().split('\n') if line.strip()]
+        instances = np.array([line.split(' ') for line in lines], dtype=np.float32)
+    return {'instances': instances.reshape(len(instances), -1)}
 
 
 class PoseEstimationCustomDataset(BaseCustomDataset):
+    # Keypoints and boxes of pose estimation labels are pixel coordinates of the original image
+    supports_reduced_decode = False
 
     def __init__(self, conf_data, conf_augmentation, model_name, idx_to_class,
                  split, samples, transform=None, with_label=True, **kwargs):
@@ -23,16 +36,14 @@ class PoseEstimationCustomDataset(BaseCustomDataset):
             conf_data, conf_augmentation, model_name, idx_to_class,
             split, samples, transform, with_label, **kwargs
         )
-        flattened_samples = []
+        # Each item is an instance (person) of an image, and ``group_ids`` is the image index of each item.
+        # Images are not duplicated per instance, so an image is decoded (or cached) once for all of its instances.
         # label field must be filled
-        for sample in self.samples:
-            flattened_sample = {}
-            with open(sample['label'], 'r') as f:
-                lines = f.readlines()
-                f.close()
-            flattened_sample = [{'image': sample['image'], 'label': line.strip()} for line in lines]
-            flattened_samples += flattened_sample
-        self.samples = flattened_samples
+        num_instances = [len(self._read_instances(i)) for i in range(len(self.samples))]
+        self.group_ids = np.repeat(np.arange(len(self.samples)), num_instances)
+        self.instance_ids = np.concatenate([np.arange(n) for n in num_instances]) if len(num_instances) != 0 \
+            else np.zeros(0, dtype=np.int64)
+        self._last_image: Optional[Tuple[int, Image.Image]] = None
 
         # Build flip map. This is needed when try randomflip augmentation.
         if split == 'train':
@@ -46,32 +57,43 @@ class PoseEstimationCustomDataset(BaseCustomDataset):
                     assert idx_swap is not None, "To apply flip transform, keypoint swap info must be filled."
                     self.flip_indices[idx] = class_to_idx[idx_swap] if idx_swap else -1
 
-    def cache_dataset(self, sampler, distributed):
+    def cache_dataset(self, sampler, distributed, cache_conf):
         if (not distributed) or (distributed and dist.get_rank() == 0):
-            logger.info(f'Caching | Loading samples of {self.mode} to memory... This can take minutes.')
+            logger.info(f'Caching | Loading samples of {self.mode} to {cache_conf["backend"]} cache... This can take minutes.')
 
-        def _load(i, samples):
-            image = Image.open(Path(samples[i]['image'])).convert('RGB')
-            return i, image
-
-        num_threads = 8 # TODO: Compute appropriate num_threads
-        load_imgs = ThreadPool(num_threads).imap(
-            partial(_load, samples=self.samples),
-            sampler
-        )
-        for i, image in load_imgs:
-            self.samples[i]['image'] = image
+        if cache_conf['cap_resolution']:
+            # Keypoints and boxes of pose estimation labels are pixel coordinates of the original image
+            logger.warning("Caching | cap_resolution is not supported for pose estimation. Images are cached in original resolution.")
+            cache_conf = {**cache_conf, 'cap_resolution': False}
 
+        # Images are cached by image index, not by instance index
+        image_indices = np.unique(self.group_ids[np.asarray(list(sampler), dtype=np.int64)]).tolist()
+        self.image_cache = self._cache_images(image_indices, distributed, cache_conf)
         self.cache = True
 
-    def __getitem__(self, index):
-        img = self.samples[index]['image']
-        ann = self.samples[index]['label'] # TODO: Pose estimation is not assuming that label can be None now
+    def _read_instances(self, image_index) -> np.ndarray:
+        label = self.samples[image_index]['label']
+        if isinstance(label, LabelIndexRecord):
+            return label.read()['instances']
+        return parse_pose_rows(label)['instances']
+
+    def _load_group_image(self, image_index) -> Union[Image.Image, np.ndarray]:
+        # Instances of the same image come in a row (see ``GroupedBatchSampler``), so the last image is reused.
+        # Each instance gets its own copy, since transforms may modify the image in place (e.g. ``RandomErasing``)
+        if self._last_image is None or self._last_image[0] != image_index:
+            self._last_image = (image_index, self._load_image(image_index))
+        return self._last_image[1].copy()
 
-        if not self.cache:
-            img = Image.open(Path(img)).convert('RGB')
+    def __len__(self):
+        return len(self.group_ids)
+
+    def __getitem__(self, index):
+        index = self._parse_index(index)
+        image_index = int(self.group_ids[index])
+        img = self._load_group_image(image_index)
+        ann = self._read_instances(image_index)[self.instance_ids[index]] # TODO: Pose estimation is not assuming that label can be None now
 
-        w, h = img.size
+        w, h = self._image_size(img)
 
         outputs = {}
         outputs.update({'indices': index})
@@ -80,7 +102,6 @@ class PoseEstimationCustomDataset(BaseCustomDataset):
             outputs.update({'pixel_values': out['image'], 'org_shape': (h, w)})
             return outputs
 
-        ann = ann.split(' ')
         bbox = ann[-4:]
         keypoints = ann[:-4]
 
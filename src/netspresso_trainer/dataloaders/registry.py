@@ -1,6 +1,6 @@
 from typing import Callable, Dict, Type
 
-from .augmentation.transforms import create_transform
+from .augmentation.transforms import create_batch_transform, create_transform
 from .base import BaseCustomDataset, BaseDataSampler, BaseHFDataset
 from .classification import (
     ClassficationDataSampler,
@@ -19,6 +19,7 @@ from .segmentation import (
 )
 
 CREATE_TRANSFORM = create_transform
+CREATE_BATCH_TRANSFORM = create_batch_transform
 
 CUSTOM_DATASET: Dict[str, Type[BaseCustomDataset]] = {
     'classification': ClassificationCustomDataset,
@@ -1,6 +1,5 @@
 import json
 import os
-from itertools import chain
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple, Union
 
@@ -11,7 +10,10 @@ from torch.utils.data import random_split
 
 from ..base import BaseDataSampler
 from ..utils.constants import IMG_EXTENSIONS
-from ..utils.misc import natural_key
+from ..utils.label_remap import MASK_STORES, LabelRemap, build_mask_store
+from ..utils.manifest import load_manifest, scan_dirs, scan_files
+from ..utils.packed import PACKED_INDEX_SUFFIX
+from ..utils.streaming import split_streaming_dataset
 
 
 def as_tuple(tuple_string: str) -> Tuple:
@@ -52,31 +54,53 @@ class SegmentationDataSampler(BaseDataSampler):
         super(SegmentationDataSampler, self).__init__(conf_data, train_valid_split_ratio)
 
     def load_data(self, split='train'):
+        if self.conf_data.format == 'packed':
+            images_and_targets = self.load_packed_data(split=split)
+            label_sources = [Path(self.conf_data.path.root) / f"{split}{PACKED_INDEX_SUFFIX}"]
+        else:
+            images_and_targets = self.load_local_data(split=split)
+            split_dir = self.conf_data.path[split]
+            label_sources = [Path(self.conf_data.path.root) / split_dir.label] if split_dir.label is not None else []
+        return self.store_masks(images_and_targets, split=split, sources=label_sources)
+
+    def store_masks(self, images_and_targets, split, sources):
+        # Remap all labels once and save them as class index masks, so that datasets skip remapping
+        mask_store = getattr(self.conf_data, 'mask_store', None)
+        if mask_store is None:
+            return images_and_targets
+        assert mask_store in MASK_STORES, f"Mask store {mask_store} is not supported! Supported: {MASK_STORES}"
+        if len(images_and_targets) == 0 or any(sample['label'] is None for sample in images_and_targets):
+            return images_and_targets
+
+        _, label_value_to_idx = load_custom_class_map(id_mapping=self.conf_data.id_mapping)
+        label_image_mode = str(self.conf_data.label_image_mode).upper() if self.conf_data.label_image_mode is not None else 'L'
+        masks = build_mask_store(f"{self.conf_data.name}_{split}",
+                                 labels=[sample['label'] for sample in images_and_targets],
+                                 remap=LabelRemap(label_value_to_idx, label_image_mode), sources=sources)
+        return [{'image': sample['image'], 'label': mask} for sample, mask in zip(images_and_targets, masks)]
+
+    def load_local_data(self, split='train'):
         assert split in ['train', 'valid', 'test'], f"split should be either {['train', 'valid', 'test']}."
         data_root = Path(self.conf_data.path.root)
         split_dir = self.conf_data.path[split]
         image_dir: Path = data_root / split_dir.image
         annotation_dir: Optional[Path] = data_root / split_dir.label if split_dir.label is not None else None
-        images: List[str] = []
-        labels: List[str] = []
         images_and_targets: List[Dict[str, str]] = []
-        if annotation_dir is not None:
-            for ext in IMG_EXTENSIONS:
-                images.extend([str(file) for file in chain(image_dir.glob(f'*{ext}'), image_dir.glob(f'*{ext.upper()}'))])
+        manifest_name = f"{self.conf_data.name}_{split}"
+        manifest_sources = [image_dir, annotation_dir]
+
+        def _scan():
+            if annotation_dir is not None:
                 # TODO: get paired data from regex pattern matching (conf_data.path.pattern)
-                labels.extend([str(file) for file in chain(annotation_dir.glob(f'*{ext}'), annotation_dir.glob(f'*{ext.upper()}'))])
+                images, labels = scan_dirs([(image_dir, IMG_EXTENSIONS), (annotation_dir, IMG_EXTENSIONS)])
+                images_and_targets.extend([{'image': image, 'label': label} for image, label in zip(images, labels)])
 
-            images = sorted(images, key=lambda k: natural_key(k))
-            labels = sorted(labels, key=lambda k: natural_key(k))
-            images_and_targets.extend([{'image': str(image), 'label': str(label)} for image, label in zip(images, labels)])
+            else:
+                images_and_targets.extend([{'image': file, 'label': None} for file in scan_files(image_dir, IMG_EXTENSIONS)])
 
-        else:
-            for ext in IMG_EXTENSIONS:
-                images_and_targets.extend([{'image': str(file), 'label': None}
-                                           for file in chain(image_dir.glob(f'*{ext}'), image_dir.glob(f'*{ext.upper()}'))])
-            images_and_targets = sorted(images_and_targets, key=lambda k: natural_key(k['image']))
+            return images_and_targets
 
-        return images_and_targets
+        return load_manifest(manifest_name, manifest_sources, _scan)
 
     def load_samples(self):
         assert isinstance(self.conf_data.id_mapping, (ListConfig, DictConfig))
@@ -114,12 +138,19 @@ class SegmentationDataSampler(BaseDataSampler):
         if cache_dir is not None:
             cache_dir = Path(cache_dir)
             Path(cache_dir).mkdir(exist_ok=True, parents=True)
-        total_dataset = load_dataset(root, name=subset_name, cache_dir=cache_dir)
+        streaming = bool(getattr(self.conf_data.metadata, 'streaming', False))
+        total_dataset = load_dataset(root, name=subset_name, cache_dir=cache_dir, streaming=streaming)
 
         assert isinstance(self.conf_data.id_mapping, (ListConfig, DictConfig))
 
         idx_to_class, label_value_to_idx = load_custom_class_map(id_mapping=self.conf_data.id_mapping)
 
+        if streaming:
+            train_samples, valid_samples, test_samples, num_samples = split_streaming_dataset(
+                total_dataset, self.conf_data.metadata.features.image, self.train_valid_split_ratio)
+            return train_samples, valid_samples, test_samples, \
+                {'idx_to_class': idx_to_class, 'label_value_to_idx': label_value_to_idx, 'num_samples': num_samples}
+
         exists_valid = 'validation' in total_dataset
         exists_test = 'test' in total_dataset
 
@@ -5,6 +5,8 @@ import PIL.Image as Image
 
 from ..augmentation.transforms import generate_edge, reduce_label
 from ..base import BaseHFDataset
+from ..utils.hf_preprocess import EDGE_COLUMN, ORG_SHAPE_COLUMN, HFPreprocessor
+from ..utils.label_remap import LabelRemap
 
 
 class SegmentationHFDataset(BaseHFDataset):
@@ -40,6 +42,7 @@ class SegmentationHFDataset(BaseHFDataset):
 
         self.label_image_mode: Literal['RGB', 'L', 'P'] = str(conf_data.label_image_mode).upper() \
             if conf_data.label_image_mode is not None else 'L'
+        self.label_remap = LabelRemap(self.label_value_to_idx, self.label_image_mode)
 
         self.image_feature_name = conf_data.metadata.features.image
         self.label_feature_name = conf_data.metadata.features.label
@@ -55,24 +58,26 @@ class SegmentationHFDataset(BaseHFDataset):
     def __len__(self):
         return self.samples.num_rows
 
-    def __getitem__(self, index):
+    def _build_preprocessor(self, transform):
+        return HFPreprocessor(self.image_feature_name, self.label_feature_name, transform,
+                              label_remap=self.label_remap, with_edge=self.model_name == 'pidnet')
+
+    def _process_row(self, index, row):
 
         img_name = f"{index:06d}"
-        img: Image.Image = self.samples[index][self.image_feature_name]
-        label: Image.Image = self.samples[index][self.label_feature_name] if self.label_feature_name in self.samples[index] else None
+        img: Image.Image = row[self.image_feature_name]
+        label: Image.Image = row[self.label_feature_name] if self.label_feature_name in row else None
 
-        label_array = np.array(label.convert(self.label_image_mode))
-        label_array = label_array[..., np.newaxis] if label_array.ndim == 2 else label_array
         # if self.conf_augmentation.reduce_zero_label:
         #     label = reduce_label(np.array(label))
 
-        mask = np.zeros((label.size[1], label.size[0]), dtype=np.uint8)
-        for label_value in self.label_value_to_idx:
-            class_mask = (label_array == np.array(label_value)).all(axis=-1)
-            mask[class_mask] = self.label_value_to_idx[label_value]
-        mask = Image.fromarray(mask, mode='L')  # single mode array (PIL.Image) compatbile with torchvision transform API
-
-        w, h = img.size
+        if self.preprocessed:
+            # Labels are already remapped, and the shape of the image is recorded before resizing
+            mask = label
+            h, w = row[ORG_SHAPE_COLUMN]
+        else:
+            mask = self.label_remap(label)  # single mode array (PIL.Image) compatbile with torchvision transform API
+            w, h = img.size
 
         if label is None:
             out = self.transform(image=img)
@@ -81,7 +86,7 @@ class SegmentationHFDataset(BaseHFDataset):
         outputs = {}
 
         if self.model_name == 'pidnet':
-            edge = generate_edge(np.array(label))
+            edge = row[EDGE_COLUMN] if self.preprocessed else generate_edge(np.array(label))
             out = self.transform(image=img, mask=mask, edge=edge)
             outputs.update({'pixel_values': out['image'], 'labels': out['mask'], 'edges': out['edge'].float(), 'name': img_name})
         else:
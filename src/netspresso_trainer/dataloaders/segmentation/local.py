@@ -1,8 +1,7 @@
+import io
 import os
-from functools import partial
-from multiprocessing.pool import ThreadPool
 from pathlib import Path
-from typing import Literal
+from typing import Literal, Optional
 
 import numpy as np
 import PIL.Image as Image
@@ -11,6 +10,8 @@ from loguru import logger
 
 from ..augmentation.transforms import generate_edge, reduce_label
 from ..base import BaseCustomDataset
+from ..utils.cache import BaseImageCache
+from ..utils.label_remap import LabelRemap, RemappedMask
 
 
 class SegmentationCustomDataset(BaseCustomDataset):
@@ -26,67 +27,74 @@ class SegmentationCustomDataset(BaseCustomDataset):
 
         self.label_image_mode: Literal['RGB', 'L', 'P'] = str(conf_data.label_image_mode).upper() \
             if conf_data.label_image_mode is not None else 'L'
+        self.label_remap = LabelRemap(self.label_value_to_idx, self.label_image_mode)
+        # PIDNet boundary maps are derived from masks with the masks, and kept as the second band of label images
+        self.with_edge = 'pidnet' in self.model_name
+        self.label_cache_mode = 'LA' if self.with_edge else 'L'
+        self.label_cache: Optional[BaseImageCache] = None
 
-    def cache_dataset(self, sampler, distributed):
+    def cache_dataset(self, sampler, distributed, cache_conf):
         if (not distributed) or (distributed and dist.get_rank() == 0):
-            logger.info(f'Caching | Loading samples of {self.mode} to memory... This can take minutes.')
-
-        def _load(i, samples):
-            image = Image.open(Path(samples[i]['image'])).convert('RGB')
-            label = self.samples[i]['label']
-            if label is not None:
-                label = Image.open(Path(label)).convert(self.label_image_mode)
-            return i, image, label
-
-        num_threads = 8 # TODO: Compute appropriate num_threads
-        load_imgs = ThreadPool(num_threads).imap(
-            partial(_load, samples=self.samples),
-            sampler
-        )
-        for i, image, label in load_imgs:
-            self.samples[i]['image'] = image
-            self.samples[i]['label'] = label
+            logger.info(f'Caching | Loading samples of {self.mode} to {cache_conf["backend"]} cache... This can take minutes.')
+
+        self.image_cache = self._cache_images(sampler, distributed, cache_conf)
+        if all(sample['label'] is not None for sample in self.samples):
+            # Labels are cached after remapping, so they depend on the label mapping
+            tag = self.label_remap.key[:8] + ('_edge' if self.with_edge else '')
+            self.label_cache = self._cache_images(sampler, distributed, cache_conf, field='label',
+                                                  mode=self.label_cache_mode, tag=tag)
 
         self.cache = True
 
-    def __getitem__(self, index):
-        if self.cache:
-            img = self.samples[index]['image']
-            label = self.samples[index]['label']
+    def _load_sample(self, index, field='image', mode='RGB') -> Image.Image:
+        if field != 'label':
+            return super()._load_sample(index, field=field, mode=mode)
+        label = self.samples[index]['label']
+        if isinstance(label, RemappedMask):
+            mask = label.open()
         else:
-            img_path = self.samples[index]['image']
-            ann_path = self.samples[index]['label']
-            img = Image.open(Path(img_path)).convert('RGB')
-            label = Image.open(Path(ann_path)).convert(self.label_image_mode) if ann_path is not None else None
+            mask = self.label_remap(self._open_image(label, mode=self.label_image_mode))
+        if self.cache_resolution_capped:
+            mask = self._cap_resolution(mask, resample=Image.NEAREST)
+        if self.with_edge:
+            return Image.merge('LA', (mask, generate_edge(np.array(mask))))
+        return mask
+
+    def _read_sample_bytes(self, index, field='image') -> bytes:
+        if field != 'label':
+            return super()._read_sample_bytes(index, field=field)
+        buffer = io.BytesIO()
+        self._load_sample(index, field='label').save(buffer, format='PNG')
+        return buffer.getvalue()
 
-        w, h = img.size
+    def __getitem__(self, index):
+        index = self._parse_index(index)
+        img = self._load_image(index)
+        label = self._load_cached(self.label_cache, index, field='label', mode=self.label_cache_mode) \
+            if self.samples[index]['label'] is not None else None
+
+        w, h = self._image_size(img)
 
         outputs = {}
         outputs.update({'indices': index})
         if label is None:
-            out = self.transform(image=img)
+            out = self.transform(image=img, dataset=self)
             outputs.update({'pixel_values': out['image'], 'org_shape': (h, w)})
             return outputs
 
-
-        label_array = np.array(label)
-        label_array = label_array[..., np.newaxis] if label_array.ndim == 2 else label_array
         # if self.conf_augmentation.reduce_zero_label:
         #     label = reduce_label(np.array(label))
 
-        mask = np.zeros((label.size[1], label.size[0]), dtype=np.uint8)
-        for label_value in self.label_value_to_idx:
-            class_mask = (label_array == np.array(label_value)).all(axis=-1)
-            mask[class_mask] = self.label_value_to_idx[label_value]
-
-        mask = Image.fromarray(mask, mode='L')  # single mode array (PIL.Image) compatbile with torchvision transform API
+        if label.size != (w, h):
+            # Image is decoded at a reduced scale
+            label = label.resize((w, h), resample=Image.NEAREST)
 
-        if 'pidnet' in self.model_name:
-            edge = generate_edge(np.array(mask))
-            out = self.transform(image=img, mask=mask, edge=edge)
+        if self.with_edge:
+            mask, edge = label.split()
+            out = self.transform(image=img, mask=mask, edge=edge, dataset=self)
             outputs.update({'pixel_values': out['image'], 'labels': out['mask'], 'edges': out['edge'].float()})
         else:
-            out = self.transform(image=img, mask=mask)
+            out = self.transform(image=img, mask=label, dataset=self)
             outputs.update({'pixel_values': out['image'], 'labels': out['mask']})
 
         if self._split in ['train', 'training']:
@@ -0,0 +1,188 @@
+"""
+Calibration of data loading parallelism on the machine, which is selected with ``auto``.
+
+The number of dataloader workers and their prefetch factor are chosen by loading batches from the real dataset and
+transforms with several settings, and the thread pool which fills the image cache is sized while it runs. Each
+candidate is only taken if it is clearly faster than a smaller one, so that spare cores and memory are kept for the
+training itself.
+"""
+import itertools
+import math
+import os
+import time
+from multiprocessing.pool import ThreadPool
+from typing import Callable, Iterable, Iterator, Optional, Tuple
+
+import torch
+import torch.distributed as dist
+from loguru import logger
+from torch.utils.data import DataLoader
+
+AUTO = 'auto'
+DEFAULT_NUM_WORKERS = 4
+DEFAULT_PREFETCH_FACTOR = 2
+PREFETCH_FACTORS = [2, 4, 8]
+MIN_SPEEDUP = 1.1  # A larger setting is taken only if it is at least 10% faster
+MAX_SECONDS_PER_TRIAL = 10.
+MIN_MEASURED_BATCHES = 2
+MEMORY_FRACTION_FOR_BATCHES = 0.25  # Batches in flight may use at most this fraction of the available memory
+MAX_CACHE_THREADS = 32
+ITEMS_PER_THREAD = 8
+
+
+def available_cpus() -> int:
+    """The number of CPU cores for this process, shared with the other processes of the machine in distributed training."""
+    try:
+        num_cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # Not available on macOS and Windows
+        num_cpus = os.cpu_count() or 1
+    local_world_size = int(os.environ.get('LOCAL_WORLD_SIZE', 1))
+    return max(num_cpus // local_world_size, 1)
+
+
+def available_memory() -> Optional[int]:
+    """Available memory of the machine in bytes, or ``None`` if it is unknown."""
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def batch_nbytes(batch) -> int:
+    if isinstance(batch, torch.Tensor):
+        return batch.nbytes
+    if isinstance(batch, dict):
+        return sum(batch_nbytes(value) for value in batch.values())
+    if isinstance(batch, (list, tuple)):
+        return sum(batch_nbytes(value) for value in batch)
+    return 0
+
+
+def tuned_imap(fn: Callable, items: Iterable, max_threads: Optional[int] = None, name: str = '') -> Iterator:
+    """
+    Same as ``ThreadPool.imap``, with the number of threads calibrated on the first items.
+    The pool size is doubled from 1 while the throughput of each round of items keeps improving,
+    and the rest of items are mapped with the best one. No item is mapped more than once.
+    """
+    if max_threads is None:
+        # Reading and decoding files release the GIL, so threads may exceed the number of cores
+        max_threads = min(2 * available_cpus(), MAX_CACHE_THREADS)
+    items = iter(items)
+    num_threads, best = 1, (1, 0.)
+    while True:
+        chunk = list(itertools.islice(items, ITEMS_PER_THREAD * num_threads))
+        if len(chunk) == 0:
+            return
+
+        start = time.perf_counter()
+        with ThreadPool(num_threads) as pool:
+            yield from pool.imap(fn, chunk)
+        if len(chunk) < ITEMS_PER_THREAD * num_threads:
+            return  # Every item is mapped while calibrating
+        rate = len(chunk) / max(time.perf_counter() - start, 1e-9)
+
+        if rate < best[1] * MIN_SPEEDUP:
+            break
+        best = (num_threads, rate)
+        if num_threads >= max_threads:
+            break
+        num_threads = min(2 * num_threads, max_threads)
+
+    num_threads = best[0]
+    logger.info(f"Autotune | {name}: {num_threads} threads for caching ({best[1]:.1f} samples/sec)")
+    with ThreadPool(num_threads) as pool:
+        yield from pool.imap(fn, items)
+
+
+def _measure_throughput(loader: DataLoader, num_workers: int, batch_size: int) -> Tuple[float, int]:
+    """Samples per second of ``loader`` after workers are started, and the bytes of a batch."""
+    num_warmup = max(num_workers, 1)  # First batches include starting workers
+    num_batches = max(2 * num_workers, 4)
+    nbytes, measured, elapsed = 0, 0, 0.
+    iterator = iter(loader)
+    try:
+        nbytes = batch_nbytes(next(iterator))
+        for _ in range(num_warmup - 1):
+            next(iterator)
+
+        start = time.perf_counter()
+        for _ in range(num_batches):
+            next(iterator)
+            measured += 1
+            elapsed = time.perf_counter() - start
+            if elapsed > MAX_SECONDS_PER_TRIAL:
+                break
+    except StopIteration:
+        pass
+    finally:
+        del iterator  # Shuts down workers
+
+    if measured < MIN_MEASURED_BATCHES:
+        return 0., nbytes
+    return measured * batch_size / max(elapsed, 1e-9), nbytes
+
+
+def autotune_workers(build_loader: Callable[[int, int], DataLoader], batch_size: int,
+                     name: str = '', distributed: bool = False) -> Tuple[int, int]:
+    """
+    Choose ``(num_workers, prefetch_factor)`` with the highest throughput of samples per second.
+
+    Args:
+        build_loader: Function which builds the dataloader with ``num_workers`` and ``prefetch_factor``.
+            The loader must not keep persistent workers, so that workers are shut down after each trial.
+        batch_size: The number of samples in a batch.
+        name: Name of the dataset for logging.
+        distributed: If ``True``, every process uses the choice of rank 0.
+    """
+    max_workers = available_cpus()
+    candidates = [2 ** i for i in range(int(math.log2(max_workers)) + 1)]
+    if candidates[-1] != max_workers:
+        candidates.append(max_workers)
+
+    def _trial(num_workers, prefetch_factor):
+        loader = build_loader(num_workers, prefetch_factor)
+        rate, nbytes = _measure_throughput(loader, num_workers, batch_size)
+        logger.debug(f"Autotune | {name}: num_workers={num_workers}, prefetch_factor={prefetch_factor}, {rate:.1f} samples/sec")
+        return rate, nbytes
+
+    best_workers, best_rate = candidates[0], 0.
+    max_batches_in_flight = None
+    for num_workers in candidates:
+        if max_batches_in_flight is not None and num_workers * DEFAULT_PREFETCH_FACTOR > max_batches_in_flight:
+            break
+        rate, nbytes = _trial(num_workers, DEFAULT_PREFETCH_FACTOR)
+        if max_batches_in_flight is None:
+            memory = available_memory()
+            if memory is not None and nbytes > 0:
+                max_batches_in_flight = int(memory * MEMORY_FRACTION_FOR_BATCHES) // nbytes
+        if rate < best_rate * MIN_SPEEDUP:
+            break
+        best_workers, best_rate = num_workers, rate
+
+    best_prefetch_factor = DEFAULT_PREFETCH_FACTOR
+    if best_rate == 0.:
+        # Too few batches to measure the throughput
+        best_workers = min(max_workers, DEFAULT_NUM_WORKERS)
+    else:
+        for prefetch_factor in PREFETCH_FACTORS:
+            if prefetch_factor <= best_prefetch_factor:
+                continue
+            if max_batches_in_flight is not None and best_workers * prefetch_factor > max_batches_in_flight:
+                break
+            rate, _ = _trial(best_workers, prefetch_factor)
+            if rate < best_rate * MIN_SPEEDUP:
+                break
+            best_prefetch_factor, best_rate = prefetch_factor, rate
+
+    choice = [best_workers, best_prefetch_factor, best_rate]
+    if distributed and dist.is_available() and dist.is_initialized():
+        dist.broadcast_object_list(choice, src=0)
+    best_workers, best_prefetch_factor, best_rate = choice
+    throughput = f"{best_rate:.1f} samples/sec" if best_rate > 0. else "too few batches to measure"
+    logger.info(f"Autotune | {name}: num_workers={best_workers}, prefetch_factor={best_prefetch_factor} "
+                f"({throughput}, {max_workers} cores available)")
+    return best_workers, best_prefetch_factor
@@ -0,0 +1,392 @@
+import io
+import os
+import re
+import shutil
+import tempfile
+import time
+import weakref
+from ctypes import c_int8, c_long, c_longlong
+from functools import partial
+from multiprocessing.pool import ThreadPool
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Type, Union
+
+import numpy as np
+import PIL.Image as Image
+import torch.multiprocessing as mp
+from loguru import logger
+
+from .autotune import AUTO, tuned_imap
+from .store import DEFAULT_CACHE_DIR, build_store, files_fingerprint, fingerprint
+
+DEFAULT_NUM_THREADS = AUTO  # Calibrated while caching, see ``tuned_imap``
+MMAP_META_FILENAME = "meta.json"
+CACHE_POLICIES = ['lru']
+SHARED_MEMORY_DIR = Path("/dev/shm")
+BYTE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+
+def parse_bytes(size: Union[int, str]) -> int:
+    """Parse a size given as number of bytes or human readable string (e.g. ``512M``, ``32G``)."""
+    if isinstance(size, int):
+        return size
+    matched = re.fullmatch(r"\s*([0-9.]+)\s*([KMGT]?)i?B?\s*", str(size).upper())
+    assert matched is not None, f"Cannot parse size {size}! Use the number of bytes or such as 512M, 32G."
+    return int(float(matched.group(1)) * BYTE_UNITS[matched.group(2)])
+
+
+def get_cache_config(cache_data) -> Optional[Dict]:
+    """Normalize ``environment.cache_data``, which is either a bool or a dict of cache options."""
+    if not cache_data:
+        return None
+    cache_conf = {'backend': 'memory', 'cache_dir': None, 'num_threads': DEFAULT_NUM_THREADS,
+                  'max_bytes': None, 'policy': 'lru', 'encoded': False, 'cap_resolution': False}
+    if cache_data is not True:
+        cache_conf.update({k: v for k, v in dict(cache_data).items() if v is not None})
+    assert cache_conf['backend'] in IMAGE_CACHE, f"No such cache backend named {cache_conf['backend']} in {list(IMAGE_CACHE.keys())}!"
+    assert cache_conf['policy'] in CACHE_POLICIES, f"Cache policy {cache_conf['policy']} is not supported! Supported: {CACHE_POLICIES}"
+    if cache_conf['max_bytes'] is not None:
+        cache_conf['max_bytes'] = parse_bytes(cache_conf['max_bytes'])
+    return cache_conf
+
+
+class BaseImageCache:
+    """
+    Image cache which is accessed by sample index.
+    Hit and miss counters are shared with dataloader workers, so they can be reported by the main process.
+    With ``as_array``, images are loaded as HWC uint8 arrays instead of PIL images (see ``augmentation.array_mode``).
+    """
+
+    def __init__(self, name: str, mode: str = 'RGB', num_threads: Union[int, str] = DEFAULT_NUM_THREADS, encoded: bool = False,
+                 as_array: bool = False, **kwargs):
+        self.name = name
+        self.mode = mode
+        self.num_threads = num_threads
+        self.encoded = encoded
+        self.as_array = as_array
+        self.hits = mp.Value(c_long, 0)
+        self.misses = mp.Value(c_long, 0)
+
+        self.load_fn: Optional[Callable[[int], Image.Image]] = None
+        self.read_fn: Optional[Callable[[int], bytes]] = None
+        self.decode_fn: Optional[Callable[[bytes], Image.Image]] = None
+
+    def build(self, keys: List, load_fn: Callable[[int], Image.Image], read_fn: Callable[[int], bytes],
+              indices: Iterable[int], distributed: bool, decode_fn: Optional[Callable[[bytes], Image.Image]] = None):
+        """
+        Args:
+            keys: Sources of every sample (e.g. file paths), which are used to fingerprint the cache.
+            load_fn: Function which loads the decoded image of a sample index.
+            read_fn: Function which reads the encoded file bytes of a sample index.
+            indices: Sample indices which are used by this process.
+            decode_fn: Function which decodes the encoded file bytes. Defaults to PIL.
+        """
+        self.load_fn = load_fn
+        self.read_fn = read_fn
+        self.decode_fn = decode_fn
+        self._build(keys, indices, distributed)
+
+    def _build(self, keys: List, indices: Iterable[int], distributed: bool):
+        raise NotImplementedError
+
+    def _imap(self, fn: Callable, items: Iterable) -> Iterable:
+        # ``fn`` of each item in the order of ``items``, with ``num_threads`` threads
+        if self.num_threads == AUTO:
+            yield from tuned_imap(fn, items, name=self.name)
+            return
+        with ThreadPool(self.num_threads) as pool:
+            yield from pool.imap(fn, items)
+
+    def _fetch(self, index: int) -> Union[Image.Image, bytes]:
+        # Entry to be cached, which is either encoded bytes or decoded image
+        return self.read_fn(index) if self.encoded else self.load_fn(index)
+
+    def _decode(self, entry: Union[Image.Image, np.ndarray, bytes]) -> Union[Image.Image, np.ndarray]:
+        if self.encoded:
+            if self.decode_fn is not None:
+                return self.decode_fn(entry)
+            image = Image.open(io.BytesIO(entry)).convert(self.mode)
+            return np.array(image) if self.as_array else image
+        if isinstance(entry, np.ndarray):
+            # Transforms may write into the array, so that the cached entry is not given as it is
+            return entry.copy()
+        return entry
+
+    def _get(self, index: int) -> Optional[Union[Image.Image, bytes]]:
+        raise NotImplementedError
+
+    def _put(self, index: int, entry: Union[Image.Image, bytes]):
+        # Caches which are filled by ``build`` ignore the entries loaded on miss
+        pass
+
+    def load(self, index: int) -> Union[Image.Image, np.ndarray]:
+        entry = self._get(index)
+        counter = self.hits if entry is not None else self.misses
+        with counter.get_lock():
+            counter.value += 1
+        if entry is None:
+            entry = self._fetch(index)
+            self._put(index, entry)
+        return self._decode(entry)
+
+    def pop_stats(self) -> Dict[str, float]:
+        """Return the hit rate since the last call and reset counters."""
+        with self.hits.get_lock(), self.misses.get_lock():
+            hits, misses = self.hits.value, self.misses.value
+            self.hits.value, self.misses.value = 0, 0
+        total = hits + misses
+        return {'hit_rate': hits / total if total > 0 else 0., 'hits': hits, 'misses': misses}
+
+
+def _remove_store_dir(store_dir: Path, owner_pid: int):
+    # Forked dataloader workers inherit the finalizer, but only the process which created the store removes it
+    if os.getpid() == owner_pid:
+        shutil.rmtree(store_dir, ignore_errors=True)
+
+
+class SharedLRUStore:
+    """
+    Byte-budgeted store of cache entries with least recently used eviction, which is shared by every dataloader worker.
+    Each entry is a file in shared memory (``/dev/shm``, if available), and the state, size, shape and last access time
+    of every sample are kept in shared arrays. So an entry stored by one worker is a hit for every other worker,
+    and each sample is stored only once for the process.
+    """
+
+    EMPTY, PENDING, CACHED = 0, 1, 2
+
+    def __init__(self, num_samples: int, max_bytes: int):
+        self.max_bytes = max_bytes
+        root = SHARED_MEMORY_DIR if SHARED_MEMORY_DIR.is_dir() else None
+        self.store_dir = Path(tempfile.mkdtemp(prefix="netspresso_trainer_cache_", dir=root))
+        weakref.finalize(self, _remove_store_dir, self.store_dir, os.getpid())
+        free_bytes = shutil.disk_usage(self.store_dir).free
+        if free_bytes < max_bytes:
+            logger.warning(f"Caching | Only {free_bytes / 1024 ** 3:.2f} GB is free at {self.store_dir.parent} "
+                           f"for the cache budget of {max_bytes / 1024 ** 3:.2f} GB. Entries which do not fit are not cached.")
+
+        self.lock = mp.Lock()
+        self.cached_bytes = mp.Value(c_longlong, 0, lock=False)
+        self.shared_arrays = {
+            'states': mp.Array(c_int8, num_samples, lock=False),
+            'nbytes': mp.Array(c_longlong, num_samples, lock=False),
+            'shapes': mp.Array(c_longlong, num_samples * 3, lock=False),
+            'last_used': mp.Array(c_longlong, num_samples, lock=False),
+        }
+        self._arrays: Optional[Dict[str, np.ndarray]] = None
+
+    def __getstate__(self):
+        # Numpy views are not shared once pickled, each process makes them again from the shared arrays
+        state = self.__dict__.copy()
+        state['_arrays'] = None
+        return state
+
+    @property
+    def arrays(self) -> Dict[str, np.ndarray]:
+        if self._arrays is None:
+            self._arrays = {k: np.ctypeslib.as_array(v) for k, v in self.shared_arrays.items()}
+            self._arrays['shapes'] = self._arrays['shapes'].reshape(-1, 3)
+        return self._arrays
+
+    def _path(self, index: int) -> Path:
+        return self.store_dir / str(index)
+
+    def get(self, index: int) -> Optional[Tuple[np.ndarray, Tuple[int, int, int]]]:
+        """Return the stored bytes as uint8 array and the shape of the entry, or ``None`` if the entry is not stored."""
+        arrays = self.arrays
+        if arrays['states'][index] != self.CACHED:
+            return None
+        try:
+            data = np.fromfile(self._path(index), dtype=np.uint8)
+        except FileNotFoundError:
+            # Evicted by another worker in the meantime
+            return None
+        arrays['last_used'][index] = time.monotonic_ns()
+        return data, tuple(int(v) for v in arrays['shapes'][index])
+
+    def _evict(self, nbytes: int) -> bool:
+        # Called with ``lock``. Entries which are being written by other workers are not evicted
+        arrays = self.arrays
+        while self.cached_bytes.value + nbytes > self.max_bytes:
+            cached = np.flatnonzero(arrays['states'] == self.CACHED)
+            if len(cached) == 0:
+                return False
+            victim = cached[np.argmin(arrays['last_used'][cached])]
+            arrays['states'][victim] = self.EMPTY
+            self.cached_bytes.value -= int(arrays['nbytes'][victim])
+            self._path(victim).unlink(missing_ok=True)
+        return True
+
+    def put(self, index: int, data: np.ndarray, shape: Tuple[int, int, int]):
+        nbytes = data.nbytes
+        if nbytes > self.max_bytes:
+            return
+        arrays = self.arrays
+        with self.lock:
+            # Another worker may have stored (or be storing) the same sample
+            if arrays['states'][index] != self.EMPTY or not self._evict(nbytes):
+                return
+            arrays['states'][index] = self.PENDING
+            arrays['nbytes'][index] = nbytes
+            self.cached_bytes.value += nbytes
+
+        path = self._path(index)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        try:
+            data.tofile(tmp_path)
+            # Readers see either no file or the complete file
+            os.replace(tmp_path, path)
+        except OSError:
+            # Shared memory is full, the entry is not cached
+            tmp_path.unlink(missing_ok=True)
+            with self.lock:
+                arrays['states'][index] = self.EMPTY
+                self.cached_bytes.value -= nbytes
+            return
+        arrays['shapes'][index] = shape
+        arrays['last_used'][index] = time.monotonic_ns()
+        arrays['states'][index] = self.CACHED
+
+
+class MemoryImageCache(BaseImageCache):
+    """
+    Keeps images in memory, either decoded or as encoded file bytes (``encoded``).
+    Encoded entries take a fraction of the memory, and they are decoded by dataloader workers in ``__getitem__``.
+    Without ``max_bytes``, every sample of this process is loaded before training.
+    With ``max_bytes``, the cache is filled lazily while training and least recently used entries are evicted
+    when the budget is exceeded. Entries are kept in :class:`SharedLRUStore`, so the budget is shared by the
+    dataloader workers.
+    """
+
+    def __init__(self, name: str, mode: str = 'RGB', num_threads: Union[int, str] = DEFAULT_NUM_THREADS, encoded: bool = False,
+                 as_array: bool = False, max_bytes: Optional[int] = None, **kwargs):
+        super(MemoryImageCache, self).__init__(name, mode, num_threads, encoded, as_array)
+        self.max_bytes = max_bytes
+        self.entries: Dict[int, Union[Image.Image, bytes]] = {}
+        self.cached_bytes = 0
+        self.store: Optional[SharedLRUStore] = None
+
+    def _build(self, keys, indices, distributed):
+        if self.max_bytes is not None:
+            self.store = SharedLRUStore(len(keys), self.max_bytes)
+            logger.info(f"Caching | {self.name} is filled while training up to {self.max_bytes / 1024 ** 3:.2f} GB "
+                        f"at {self.store.store_dir}")
+            return
+
+        def _load(i):
+            return i, self._fetch(i)
+
+        # One bulk read (and decode, if not ``encoded``) per file in thread pool
+        for i, entry in self._imap(_load, indices):
+            self.entries[i] = entry
+            self.cached_bytes += self._nbytes(entry)
+        logger.info(f"Caching | {self.name}: {len(self.entries)} samples in {self.cached_bytes / 1024 ** 3:.2f} GB")
+
+    @staticmethod
+    def _nbytes(entry: Union[Image.Image, np.ndarray, bytes]) -> int:
+        if isinstance(entry, bytes):
+            return len(entry)
+        if isinstance(entry, np.ndarray):
+            return entry.nbytes
+        return entry.width * entry.height * len(entry.getbands())
+
+    def _get(self, index):
+        if self.store is None:
+            return self.entries.get(index)
+        stored = self.store.get(index)
+        if stored is None:
+            return None
+        data, (h, w, c) = stored
+        if self.encoded:
+            return data.tobytes()
+        array = data.reshape((h, w, c) if c != 0 else (h, w))
+        return array if self.as_array else Image.fromarray(array)
+
+    def _put(self, index, entry):
+        if self.store is None:
+            return
+        if self.encoded:
+            self.store.put(index, np.frombuffer(entry, dtype=np.uint8), (0, 0, 0))
+            return
+        array = np.ascontiguousarray(np.asarray(entry, dtype=np.uint8))
+        self.store.put(index, array, array.shape if array.ndim == 3 else (*array.shape, 0))
+
+
+class MmapImageCache(BaseImageCache):
+    """
+    Decodes each image once into a single flat uint8 file with offsets and shapes.
+    The file is opened read-only with memory mapping, so every dataloader worker and DDP rank on the machine
+    share one physical copy of the decoded images through the page cache.
+    """
+
+    def __init__(self, name: str, mode: str = 'RGB', num_threads: Union[int, str] = DEFAULT_NUM_THREADS, encoded: bool = False,
+                 as_array: bool = False, cache_dir: Optional[Union[str, Path]] = None, **kwargs):
+        super(MmapImageCache, self).__init__(name, mode, num_threads, encoded, as_array)
+        assert not encoded, "mmap cache keeps decoded images. To memory-map encoded files, use the packed dataset format."
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else DEFAULT_CACHE_DIR
+        self.store_dir: Optional[Path] = None
+        self.offsets: Optional[np.ndarray] = None
+        self.shapes: Optional[np.ndarray] = None
+        self._buffer: Optional[np.memmap] = None
+
+    def __getstate__(self):
+        # Do not pickle the memory map itself, each process opens it again
+        state = self.__dict__.copy()
+        state['_buffer'] = None
+        return state
+
+    def _write(self, tmp_dir: Path, num_samples: int):
+        def _load(i):
+            return np.ascontiguousarray(np.array(self.load_fn(i), dtype=np.uint8))
+
+        offsets = np.zeros(num_samples + 1, dtype=np.int64)
+        shapes = np.zeros((num_samples, 3), dtype=np.int64)
+        with open(tmp_dir / "buffer.bin", 'wb') as f:
+            for i, array in enumerate(self._imap(_load, range(num_samples))):
+                f.write(array.tobytes())
+                offsets[i + 1] = offsets[i] + array.nbytes
+                shapes[i] = array.shape if array.ndim == 3 else (*array.shape, 0)
+        np.save(tmp_dir / "offsets.npy", offsets)
+        np.save(tmp_dir / "shapes.npy", shapes)
+
+    def _build(self, keys, indices, distributed):
+        # Every sample is stored (not only ``indices``), since the store is shared by all ranks of the machine
+        self.store_dir = self.cache_dir / "image_cache" / f"{self.name}_{self.mode}_{fingerprint(keys)}"
+        build_store(self.store_dir, MMAP_META_FILENAME, meta_fn=lambda: {'files': files_fingerprint(keys)},
+                    write_fn=partial(self._write, num_samples=len(keys)), description="memory-mapped image cache")
+
+        self.offsets = np.load(self.store_dir / "offsets.npy")
+        self.shapes = np.load(self.store_dir / "shapes.npy")
+
+    @property
+    def buffer(self) -> np.memmap:
+        if self._buffer is None:
+            self._buffer = np.memmap(self.store_dir / "buffer.bin", dtype=np.uint8, mode='r')
+        return self._buffer
+
+    def _get(self, index):
+        if self.offsets is None:
+            return None
+        if index < 0:
+            index += len(self.shapes)
+        start, end = self.offsets[index], self.offsets[index + 1]
+        h, w, c = self.shapes[index]
+        shape = (h, w, c) if c != 0 else (h, w)
+        array = np.asarray(self.buffer[start:end]).reshape(shape)
+        # The read-only view of the memory map is copied by ``_decode``
+        return array if self.as_array else Image.fromarray(array)
+
+
+IMAGE_CACHE: Dict[str, Type[BaseImageCache]] = {
+    'memory': MemoryImageCache,
+    'mmap': MmapImageCache,
+}
+
+
+def build_image_cache(cache_conf: Dict, name: str, keys: List, load_fn: Callable[[int], Image.Image],
+                      read_fn: Callable[[int], bytes], indices: Iterable[int], distributed: bool,
+                      mode: str = 'RGB', decode_fn: Optional[Callable[[bytes], Image.Image]] = None,
+                      as_array: bool = False) -> BaseImageCache:
+    image_cache = IMAGE_CACHE[cache_conf['backend']](name=name, mode=mode, as_array=as_array,
+                                                     **{k: v for k, v in cache_conf.items() if k != 'backend'})
+    image_cache.build(keys, load_fn, read_fn, indices, distributed, decode_fn=decode_fn)
+    return image_cache
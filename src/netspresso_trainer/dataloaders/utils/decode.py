@@ -0,0 +1,134 @@
+"""
+Decoding of encoded image files with a selectable backend.
+
+If the first resizing transform is known, JPEG images can be decoded at a reduced scale (1/2, 1/4 or 1/8) with DCT
+scaling, which is much faster than decoding at full resolution and downsizing afterwards. The decoded image is never
+smaller than the resolution which the transforms actually use (see ``get_cache_scale``).
+"""
+import io
+import math
+from typing import Callable, Dict, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+import PIL.Image as Image
+import torch
+from torchvision.io import ImageReadMode, decode_image
+
+from .packed import PackedRecord
+
+DECODE_BACKENDS = ['pil', 'opencv', 'torchvision']
+REDUCED_DECODE_FACTORS = [8, 4, 2, 1]
+OPENCV_REDUCED_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+ImageSource = Union[str, bytes, memoryview, PackedRecord]
+
+
+def get_decode_config(decode_backend) -> Optional[Dict]:
+    """Normalize ``environment.decode_backend``, which is either a backend name or a dict of decode options."""
+    if not decode_backend:
+        return None
+    decode_conf = {'backend': 'pil', 'reduced': False}
+    if isinstance(decode_backend, str):
+        decode_conf['backend'] = decode_backend
+    else:
+        decode_conf.update({k: v for k, v in dict(decode_backend).items() if v is not None})
+    decode_conf['backend'] = str(decode_conf['backend']).lower()
+    assert decode_conf['backend'] in DECODE_BACKENDS, f"No such decode backend named {decode_conf['backend']} in {DECODE_BACKENDS}!"
+    return decode_conf
+
+
+def reduced_decode_factor(size: Tuple[int, int], target_size: Tuple[int, int]) -> int:
+    """Largest DCT scaling factor which still gives an image of at least ``target_size``. Same as ``PIL.Image.draft``."""
+    max_factor = min(size[0] // max(target_size[0], 1), size[1] // max(target_size[1], 1))
+    return next(factor for factor in REDUCED_DECODE_FACTORS if factor <= max(max_factor, 1))
+
+
+class ImageDecoder:
+    """
+    Decoder of image files into RGB PIL images, or HWC uint8 arrays with ``as_array`` of ``decode``.
+    ``scale_fn`` of ``decode`` gives the scale of (w, h) image which still has every detail used by the transforms.
+    """
+
+    def __init__(self, backend: str = 'pil', reduced: bool = False):
+        assert backend in DECODE_BACKENDS, f"No such decode backend named {backend} in {DECODE_BACKENDS}!"
+        self.backend = backend
+        self.reduced = reduced
+
+    @property
+    def key(self) -> str:
+        return self.backend + ('_reduced' if self.reduced else '')
+
+    @property
+    def is_default(self) -> bool:
+        return self.backend == 'pil' and not self.reduced
+
+    @staticmethod
+    def _read(source: ImageSource) -> Union[bytes, memoryview]:
+        if isinstance(source, PackedRecord):
+            return source.read_bytes()
+        if isinstance(source, (bytes, memoryview)):
+            return source
+        with open(str(source), 'rb') as f:
+            return f.read()
+
+    def _target_size(self, size: Tuple[int, int], scale_fn: Optional[Callable[[int, int], float]]) -> Optional[Tuple[int, int]]:
+        if not self.reduced or scale_fn is None:
+            return None
+        w, h = size
+        scale = scale_fn(w, h)
+        if scale >= 1.:
+            return None
+        return max(1, math.ceil(w * scale)), max(1, math.ceil(h * scale))
+
+    def _decode_pil(self, data, scale_fn, as_array) -> Union[Image.Image, np.ndarray]:
+        image = Image.open(io.BytesIO(data))
+        target_size = self._target_size(image.size, scale_fn)
+        if target_size is not None:
+            # Only JPEG images are affected
+            image.draft('RGB', target_size)
+        image = image.convert('RGB')
+        # ``np.asarray`` of PIL image is read-only, while transforms may write into the array
+        return np.array(image) if as_array else image
+
+    def _decode_opencv(self, data, scale_fn, as_array) -> Union[Image.Image, np.ndarray]:
+        flags = cv2.IMREAD_COLOR
+        if self.reduced and scale_fn is not None:
+            # Only the header is read to know the size
+            size = Image.open(io.BytesIO(data)).size
+            target_size = self._target_size(size, scale_fn)
+            if target_size is not None:
+                flags = OPENCV_REDUCED_FLAGS[reduced_decode_factor(size, target_size)]
+        # EXIF orientation is ignored, as with PIL
+        array = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flags | cv2.IMREAD_IGNORE_ORIENTATION)
+        if array is None:
+            return self._decode_pil(data, scale_fn, as_array)
+        array = cv2.cvtColor(array, cv2.COLOR_BGR2RGB)
+        return array if as_array else Image.fromarray(array)
+
+    def _decode_torchvision(self, data, scale_fn, as_array) -> Union[Image.Image, np.ndarray]:
+        # torchvision decoders have no reduced scale decoding, so images are decoded in full resolution
+        try:
+            tensor = decode_image(torch.frombuffer(bytearray(data), dtype=torch.uint8), mode=ImageReadMode.RGB)
+        except RuntimeError:
+            return self._decode_pil(data, scale_fn, as_array)
+        array = tensor.permute(1, 2, 0).contiguous().numpy()
+        return array if as_array else Image.fromarray(array)
+
+    def decode(self, source: ImageSource, scale_fn: Optional[Callable[[int, int], float]] = None,
+               as_array: bool = False) -> Union[Image.Image, np.ndarray]:
+        """Decode ``source`` into RGB PIL image, or HWC uint8 array with ``as_array``."""
+        data = self._read(source)
+        if self.backend == 'opencv':
+            return self._decode_opencv(data, scale_fn, as_array)
+        if self.backend == 'torchvision':
+            return self._decode_torchvision(data, scale_fn, as_array)
+        return self._decode_pil(data, scale_fn, as_array)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(backend={self.backend}, reduced={self.reduced})"
@@ -0,0 +1,79 @@
+"""
+Offline preprocessing of Hugging Face datasets.
+
+Decoding, RGB conversion, label remapping and the leading deterministic transforms (e.g. resize to the training
+resolution) give the same output in every epoch. They are run once for every row with multi-process
+``Dataset.map``, and the results are saved in the Arrow cache of the dataset. The cache is keyed by a fingerprint of
+the data and the transforms, so it is reused by later runs. Only the other transforms run in ``__getitem__``.
+"""
+from typing import Dict, Optional
+
+import numpy as np
+import torch.distributed as dist
+from loguru import logger
+
+from ..augmentation.transforms import generate_edge
+from .cache import fingerprint
+from .label_remap import LabelRemap
+
+DEFAULT_NUM_PROC = 8
+# Columns added by preprocessing
+ORG_SHAPE_COLUMN = '_org_shape'
+EDGE_COLUMN = '_edge'
+
+
+class HFPreprocessor:
+    """Deterministic part of the sample processing, which is applied to a row of Hugging Face dataset."""
+
+    def __init__(self, image_feature_name: str, label_feature_name: str, transform,
+                 label_remap: Optional[LabelRemap] = None, with_edge: bool = False):
+        self.image_feature_name = image_feature_name
+        self.label_feature_name = label_feature_name
+        self.transform = transform
+        self.label_remap = label_remap
+        self.with_edge = with_edge
+
+    @property
+    def key(self) -> str:
+        return fingerprint([self.image_feature_name, self.label_feature_name, str(self.transform),
+                            self.label_remap.key if self.label_remap is not None else None, self.with_edge])
+
+    def __call__(self, row: Dict) -> Dict:
+        image = row[self.image_feature_name].convert('RGB')
+        w, h = image.size
+
+        targets = {}
+        label = row.get(self.label_feature_name)
+        if self.label_remap is not None and label is not None:
+            targets['mask'] = self.label_remap(label)
+            if self.with_edge:
+                targets['edge'] = generate_edge(np.array(label))
+
+        out = self.transform(image, **targets)
+        row[self.image_feature_name] = out['image']
+        if 'mask' in targets:
+            row[self.label_feature_name] = out['mask']
+        if 'edge' in targets:
+            row[EDGE_COLUMN] = out['edge']
+        row[ORG_SHAPE_COLUMN] = [h, w]
+        return row
+
+
+def preprocess_hf_dataset(samples, preprocessor: HFPreprocessor, key: str, num_proc: int = DEFAULT_NUM_PROC):
+    """
+    Apply ``preprocessor`` to every row of ``samples``, or load the result from the cache if it exists.
+    The main process preprocesses first in distributed training, and the others load its result from the cache.
+    """
+    is_writer = (not dist.is_initialized()) or dist.get_rank() == 0
+    if not is_writer:
+        dist.barrier()
+
+    if is_writer:
+        logger.info(f"Preprocessing {samples.num_rows} samples with {num_proc} processes, or loading them from the cache... (fingerprint: {key})")
+    preprocessed = samples.map(preprocessor, num_proc=max(min(num_proc, samples.num_rows), 1),
+                               new_fingerprint=key, load_from_cache_file=True,
+                               desc="Preprocessing" if is_writer else None)
+
+    if is_writer and dist.is_initialized():
+        dist.barrier()
+    return preprocessed
@@ -0,0 +1,102 @@
+"""
+Columnar label index, which keeps pre-parsed labels of every sample in a few flat ``.npy`` arrays.
+
+Each column is an array whose rows are the instances (e.g. boxes) of all samples concatenated in sample order.
+Rows of the i-th sample are ``column[offsets[i]:offsets[i + 1]]``. Arrays are memory-mapped, so the labels are
+sliced without any parsing and shared by every dataloader worker and rank.
+"""
+import json
+from functools import partial
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from .store import (
+    DEFAULT_CACHE_DIR,
+    DEFAULT_NUM_PROCESSES,
+    PathLike,
+    build_store,
+    file_mtime,
+    files_fingerprint,
+    fingerprint,
+)
+
+LABEL_INDEX_DIR = DEFAULT_CACHE_DIR / "label_index"
+LABEL_INDEX_OFFSETS = "offsets"
+LABEL_INDEX_META_FILENAME = "meta.json"
+
+
+class LabelIndex:
+    """Read-only access to a label index directory."""
+
+    def __init__(self, store_dir: PathLike):
+        self.store_dir = Path(store_dir)
+        with open(self.store_dir / LABEL_INDEX_META_FILENAME, 'r') as f:
+            self.columns: List[str] = json.load(f)['columns']
+        self.offsets = np.load(self.store_dir / f"{LABEL_INDEX_OFFSETS}.npy", mmap_mode='r')
+        self.arrays = {column: np.load(self.store_dir / f"{column}.npy", mmap_mode='r') for column in self.columns}
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> Dict[str, np.ndarray]:
+        start, end = int(self.offsets[index]), int(self.offsets[index + 1])
+        # Copy the slices, since transforms may modify labels in place
+        return {column: np.array(array[start:end]) for column, array in self.arrays.items()}
+
+
+# Indices are opened lazily in each process (after DataLoader workers are forked)
+_INDICES: Dict[str, LabelIndex] = {}
+
+
+def get_label_index(store_dir: PathLike) -> LabelIndex:
+    key = str(store_dir)
+    if key not in _INDICES:
+        _INDICES[key] = LabelIndex(store_dir)
+    return _INDICES[key]
+
+
+class LabelIndexRecord(NamedTuple):
+    """Picklable reference to the labels of one sample in a label index. It is used in place of a label file path."""
+    store_dir: str
+    index: int
+
+    def read(self) -> Dict[str, np.ndarray]:
+        return get_label_index(self.store_dir)[self.index]
+
+
+def _write_label_index(tmp_dir: Path, labels: Sequence, parse_fn: Callable, num_processes: int):
+    with Pool(num_processes) as pool:
+        parsed: List[Dict[str, np.ndarray]] = pool.map(parse_fn, labels, chunksize=256)
+
+    columns = list(parsed[0].keys()) if len(parsed) != 0 else []
+    offsets = np.zeros(len(parsed) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(rows[columns[0]]) for rows in parsed]) if len(columns) != 0 else 0
+    np.save(tmp_dir / f"{LABEL_INDEX_OFFSETS}.npy", offsets)
+    for column in columns:
+        # Empty labels may not know the row shape, e.g. (0, 0) array of a text label without any row
+        arrays = [rows[column] for rows in parsed if len(rows[column]) != 0] or [parsed[0][column]]
+        np.save(tmp_dir / f"{column}.npy", np.concatenate(arrays, axis=0))
+    with open(tmp_dir / LABEL_INDEX_META_FILENAME, 'w') as f:
+        json.dump({'columns': columns}, f)
+
+
+def build_label_index(name: str, labels: Sequence, parse_fn: Callable, sources: Sequence[Optional[PathLike]],
+                      num_processes: int = DEFAULT_NUM_PROCESSES) -> List[LabelIndexRecord]:
+    """
+    Parse every label once with ``parse_fn`` in parallel processes and save them as a label index.
+    ``parse_fn`` must be picklable and return a dict of arrays with the same row count.
+    The index is reused while the list of labels, sizes and modification times of label files, and modification
+    times of ``sources`` are unchanged.
+    """
+    store_dir = LABEL_INDEX_DIR / f"{name}_{fingerprint(str(label) for label in labels)}"
+    build_store(store_dir, LABEL_INDEX_META_FILENAME,
+                meta_fn=lambda: {'sources': {str(source): file_mtime(source) for source in sources if source is not None},
+                                 'files': files_fingerprint(labels)},
+                write_fn=partial(_write_label_index, labels=labels, parse_fn=parse_fn, num_processes=num_processes),
+                description="label index")
+
+    _INDICES.pop(str(store_dir), None)
+    return [LabelIndexRecord(str(store_dir), idx) for idx in range(len(labels))]
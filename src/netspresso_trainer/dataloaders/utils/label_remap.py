@@ -0,0 +1,124 @@
+"""
+Remapping of segmentation label images to single channel class index masks.
+
+Label values (e.g. RGB colors) are packed into integer keys, so a whole label image is remapped with one lookup
+instead of comparing the image with every label value. Remapped masks can also be saved once as PNG files in a mask
+store, so that later runs only open them.
+"""
+from functools import partial
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import PIL.Image as Image
+
+from .packed import PackedRecord
+from .store import (
+    DEFAULT_CACHE_DIR,
+    DEFAULT_NUM_PROCESSES,
+    PathLike,
+    build_store,
+    file_mtime,
+    files_fingerprint,
+    fingerprint,
+)
+
+MASK_STORE_DIR = DEFAULT_CACHE_DIR / "mask_store"
+MASK_STORE_META_FILENAME = "meta.json"
+MASK_STORES = ['png']
+
+
+class LabelRemap:
+    """
+    Lookup table from label values of ``label_image_mode`` image to class indices.
+    Pixels which match no label value are mapped to 0. If several label values match a pixel, the last one is used.
+    """
+
+    def __init__(self, label_value_to_idx: Dict[Union[int, Tuple], int], label_image_mode: str = 'L'):
+        self.label_image_mode = label_image_mode
+        self.num_channels = len(Image.new(label_image_mode, (1, 1)).getbands())
+        self.key = fingerprint([label_image_mode] + [f"{value}:{idx}" for value, idx in label_value_to_idx.items()])
+
+        key_to_idx: Dict[int, int] = {}
+        for label_value, class_idx in label_value_to_idx.items():
+            key = self._value_to_key(label_value)
+            if key is not None:
+                key_to_idx[key] = class_idx
+
+        if self.num_channels == 1:
+            # Dense table over every 8-bit value
+            self.lut = np.zeros(256, dtype=np.uint8)
+            for key, class_idx in key_to_idx.items():
+                self.lut[key] = class_idx
+        else:
+            self.keys = np.array(sorted(key_to_idx), dtype=np.uint32)
+            self.indices = np.array([key_to_idx[key] for key in sorted(key_to_idx)], dtype=np.uint8)
+
+    def _value_to_key(self, label_value) -> Optional[int]:
+        # An int value matches pixels whose channels are all equal to it
+        channels = (label_value,) * self.num_channels if isinstance(label_value, int) else tuple(label_value)
+        if len(channels) == 1:
+            channels = channels * self.num_channels
+        if len(channels) != self.num_channels:
+            if len(set(channels)) != 1 or self.num_channels != 1:
+                return None
+            channels = channels[:1]
+        if any(not 0 <= channel <= 255 for channel in channels):
+            return None
+        return sum(int(channel) << (8 * i) for i, channel in enumerate(channels))
+
+    def remap_array(self, label_array: np.ndarray) -> np.ndarray:
+        if self.num_channels == 1:
+            label_array = label_array[..., 0] if label_array.ndim == 3 else label_array
+            return self.lut[label_array]
+
+        label_array = label_array.astype(np.uint32)
+        keys = label_array[..., 0]
+        for i in range(1, self.num_channels):
+            keys |= label_array[..., i] << (8 * i)
+        if len(self.keys) == 0:
+            return np.zeros(keys.shape, dtype=np.uint8)
+        positions = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        return np.where(self.keys[positions] == keys, self.indices[positions], 0).astype(np.uint8)
+
+    def __call__(self, label: Image.Image) -> Image.Image:
+        label_array = np.array(label.convert(self.label_image_mode))
+        return Image.fromarray(self.remap_array(label_array), mode='L')
+
+
+class RemappedMask(NamedTuple):
+    """Path of a mask in a mask store, which is already remapped to class indices. It is used in place of a label path."""
+    path: str
+
+    def open(self) -> Image.Image:
+        return Image.open(self.path).convert('L')
+
+
+def _save_remapped(args):
+    label, path, remap = args
+    label = Image.open(label.open()) if isinstance(label, PackedRecord) else Image.open(str(label))
+    remap(label).save(path, format='PNG')
+
+
+def _write_mask_store(tmp_dir: Path, labels: Sequence, remap: LabelRemap, num_processes: int):
+    with Pool(num_processes) as pool:
+        pool.map(_save_remapped, [(label, tmp_dir / f"{idx:08d}.png", remap) for idx, label in enumerate(labels)],
+                 chunksize=64)
+
+
+def build_mask_store(name: str, labels: Sequence, remap: LabelRemap, sources: Sequence[Optional[PathLike]],
+                     num_processes: int = DEFAULT_NUM_PROCESSES) -> List[RemappedMask]:
+    """
+    Remap every label once in parallel processes and save the masks as PNG files in a mask store.
+    The store is reused while the list of labels, the label mapping, sizes and modification times of label files, and
+    modification times of ``sources`` are unchanged.
+    """
+    store_dir = MASK_STORE_DIR / f"{name}_{fingerprint([remap.key] + [str(label) for label in labels])}"
+    build_store(store_dir, MASK_STORE_META_FILENAME,
+                meta_fn=lambda: {'sources': {str(source): file_mtime(source) for source in sources if source is not None},
+                                 'files': files_fingerprint(labels)},
+                write_fn=partial(_write_mask_store, labels=labels, remap=remap, num_processes=num_processes),
+                description="mask store of remapped labels")
+
+    return [RemappedMask(str(store_dir / f"{idx:08d}.png")) for idx in range(len(labels))]
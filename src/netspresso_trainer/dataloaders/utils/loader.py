@@ -1,14 +1,29 @@
 import random
+import threading
+from collections import deque
+from ctypes import c_int
 from functools import partial
-from typing import Callable
+from multiprocessing import Value
+from queue import Full, Queue
+from typing import Callable, Dict
 
 import numpy as np
 import torch
-from torch.utils.data import DataLoader
+import torch.nn.functional as F
+from torch.utils.data import BatchSampler, DataLoader, default_collate
 
+from .autotune import AUTO, autotune_workers
+from .cache import get_cache_config
 from .constants import IMAGENET_DEFAULT_MEAN, IMAGENET_DEFAULT_STD
+from .decode import ImageDecoder, get_decode_config
 from .misc import expand_to_chs
-from .sampler import DistributedEvalSampler
+from .sampler import (
+    BucketBatchSampler,
+    DistributedEvalSampler,
+    GroupedBatchSampler,
+    MultiScaleBatchSampler,
+    RepeatAugSampler,
+)
 
 NUM_RGB_CHANNEL = 3
 
@@ -48,6 +63,154 @@ def fast_collate(batch):
         raise AssertionError()
 
 
+def _to_half(images):
+    # uint8 images are already compact, and are normalized after the transfer
+    return images.half() if images.is_floating_point() else images
+
+
+def half_precision_collate(original_batch, collate_fn):
+    """Collate with ``collate_fn`` and cast float images to half precision, which halves the bytes sent from workers."""
+    batch = collate_fn(original_batch)
+    if isinstance(batch, dict):
+        batch['pixel_values'] = _to_half(batch['pixel_values'])
+        return batch
+    # (indices, images, target) of classification
+    indices, images, *others = batch
+    return (indices, _to_half(images), *others)
+
+
+def padded_collate(original_batch, collate_fn, pad_values: Dict[str, float]):
+    """
+    Pad images (and the masks of ``pad_values``) of samples at the bottom and right to the largest size of the batch,
+    and collate with ``collate_fn``. (h, w) of each image before padding is given as ``valid_shape``.
+    """
+    valid_shapes = [tuple(sample['pixel_values'].shape[-2:]) for sample in original_batch]
+    max_h = max(h for h, _ in valid_shapes)
+    max_w = max(w for _, w in valid_shapes)
+    for sample, (h, w) in zip(original_batch, valid_shapes):
+        if (h, w) == (max_h, max_w):
+            continue
+        for key, value in pad_values.items():
+            if key in sample:
+                sample[key] = F.pad(sample[key], (0, max_w - w, 0, max_h - h), value=value)
+
+    batch = collate_fn(original_batch)
+    batch['valid_shape'] = torch.tensor(valid_shapes, dtype=torch.long)
+    return batch
+
+
+def _map_tensors(batch, fn):
+    """Apply ``fn`` to every tensor of ``batch``, which may be nested in dict, list and tuple."""
+    if isinstance(batch, torch.Tensor):
+        return fn(batch)
+    if isinstance(batch, dict):
+        return {k: _map_tensors(v, fn) for k, v in batch.items()}
+    if isinstance(batch, tuple):
+        return tuple(_map_tensors(v, fn) for v in batch)
+    if isinstance(batch, list):
+        return [_map_tensors(v, fn) for v in batch]
+    return batch
+
+
+def _to_device(tensor: torch.Tensor, device: torch.device) -> torch.Tensor:
+    # Copy from pinned memory, so that the copy does not block the host
+    if not tensor.is_pinned():
+        tensor = tensor.pin_memory()
+    return tensor.to(device, non_blocking=True)
+
+
+class PrefetchLoader:
+    """
+    Wrapper of ``DataLoader`` which prepares the next ``num_prefetch`` batches while the current batch is used.
+    On CUDA devices, batches are copied to the device with non-blocking copies on a side stream, so that the copy
+    overlaps with the training step. Otherwise, the next batches are loaded in a background thread.
+    """
+
+    def __init__(self, loader: DataLoader, device: torch.device, num_prefetch: int = 1):
+        assert num_prefetch >= 1, "``num_prefetch`` must be positive!"
+        self.loader = loader
+        self.device = torch.device(device)
+        self.num_prefetch = num_prefetch
+
+    def __getattr__(self, name):
+        # Attributes of the wrapped loader, e.g. dataset, sampler
+        if name == 'loader':
+            raise AttributeError(name)
+        return getattr(self.loader, name)
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __iter__(self):
+        if self.device.type == 'cuda':
+            return self._iter_cuda()
+        return self._iter_thread()
+
+    def _iter_cuda(self):
+        stream = torch.cuda.Stream(device=self.device)
+        loader_iter = iter(self.loader)
+        prefetched = deque()
+
+        def _prefetch():
+            batch = next(loader_iter, None)
+            if batch is None:
+                return
+            with torch.cuda.stream(stream):
+                batch = _map_tensors(batch, partial(_to_device, device=self.device))
+                ready = torch.cuda.Event()
+                ready.record(stream)
+            prefetched.append((batch, ready))
+
+        for _ in range(self.num_prefetch):
+            _prefetch()
+        while prefetched:
+            batch, ready = prefetched.popleft()
+            current_stream = torch.cuda.current_stream(self.device)
+            current_stream.wait_event(ready)
+            # Memory of the batch is allocated on the side stream, but used on the current stream
+            _map_tensors(batch, lambda tensor, stream=current_stream: tensor.record_stream(stream) if tensor.is_cuda else None)
+            _prefetch()
+            yield batch
+
+    def _iter_thread(self):
+        queue = Queue(maxsize=self.num_prefetch)
+        stopped = threading.Event()
+        end_of_loader = object()
+
+        def _put(item):
+            while not stopped.is_set():
+                try:
+                    queue.put(item, timeout=0.1)
+                    return True
+                except Full:
+                    continue
+            return False
+
+        def _load():
+            try:
+                for batch in self.loader:
+                    if not _put(batch):
+                        return
+                _put(end_of_loader)
+            except Exception as e:  # Raised again in the main thread
+                _put(e)
+
+        thread = threading.Thread(target=_load, daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = queue.get()
+                if item is end_of_loader:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # The loading thread stops at its next batch if the iteration is stopped early
+            stopped.set()
+            thread.join()
+
+
 def init_worker(worker_id, worker_seeding='all'):
     worker_info = torch.utils.data.get_worker_info()
     assert worker_info.id == worker_id
@@ -64,6 +227,14 @@ def init_worker(worker_id, worker_seeding='all'):
             np.random.seed(worker_info.seed % (2 ** 32 - 1))
 
 
+def _build_loader(dataset, loader_args):
+    try:
+        return DataLoader(dataset, **loader_args)
+    except TypeError:
+        loader_args.pop('persistent_workers')  # only in Pytorch 1.7+
+        return DataLoader(dataset, **loader_args)
+
+
 def create_loader(
         dataset,
         dataset_name,
@@ -71,7 +242,6 @@ def create_loader(
         batch_size=1,
         is_training=False,
         num_aug_repeats=0,
-        num_aug_splits=0,
         num_workers=1,
         distributed=False,
         collate_fn=None,
@@ -84,15 +254,38 @@ def create_loader(
         world_size=1,
         rank=0,
         cache_data=False,
+        decode_backend=None,
+        prefetch=0,
+        device=None,
+        multi_scale_sizes=None,
+        bucket_image_sizes=None,
         kwargs=None
 ):
-    if is_training:
+    if isinstance(dataset, torch.utils.data.IterableDataset):
+        # Iterable dataset splits the samples across ranks and workers by itself
+        sampler = None
+        dataset.shard(rank, world_size, batch_size, drop_last=is_training)
+    elif is_training and num_aug_repeats > 1:
+        sampler = RepeatAugSampler(dataset, num_replicas=world_size, rank=rank, num_repeats=num_aug_repeats)
+        # Repeats of a sample in a row are decoded once by the dataloader worker
+        dataset.echo_image = True
+    elif is_training:
         sampler = torch.utils.data.distributed.DistributedSampler(dataset, num_replicas=world_size, rank=rank, drop_last=True)
     else:
         sampler = DistributedEvalSampler(dataset, num_replicas=world_size, rank=rank)
 
-    if cache_data:
-        dataset.cache_dataset(sampler, distributed)
+    decode_conf = get_decode_config(decode_backend)
+    if decode_conf is not None and hasattr(dataset, 'set_decoder'):
+        # Set before caching, so that cached images are decoded with it
+        dataset.set_decoder(ImageDecoder(**decode_conf))
+
+    cache_conf = get_cache_config(cache_data)
+    if cache_conf is not None and sampler is not None:
+        # Samples of each process change in every epoch with repeated augmentation, so every sample is cached
+        dataset.cache_dataset(range(len(dataset)) if isinstance(sampler, RepeatAugSampler) else sampler, distributed, cache_conf)
+
+    if fp16:
+        collate_fn = partial(half_precision_collate, collate_fn=collate_fn if collate_fn is not None else default_collate)
 
     loader_args = {
         'batch_size': batch_size,
@@ -105,10 +298,46 @@ def create_loader(
         'worker_init_fn': partial(init_worker, worker_seeding=worker_seeding),
         'persistent_workers': persistent_workers
     }
-    try:
-        loader = DataLoader(dataset, **loader_args)
-    except TypeError:
-        loader_args.pop('persistent_workers')  # only in Pytorch 1.7+
-        loader = DataLoader(dataset, **loader_args)
+    if getattr(dataset, 'group_ids', None) is not None:
+        # Keep samples of the same group (e.g. pose instances of an image) in the same batch, and so in the same worker
+        loader_args['batch_sampler'] = GroupedBatchSampler(sampler, dataset.group_ids, batch_size, drop_last=is_training)
+        for key in ['batch_size', 'shuffle', 'sampler', 'drop_last']:
+            loader_args.pop(key)
+    if bucket_image_sizes is not None and not is_training and sampler is not None:
+        # Images of similar shape are batched together, and padded by ``padded_collate``
+        loader_args['batch_sampler'] = BucketBatchSampler(sampler, bucket_image_sizes, batch_size)
+        for key in ['batch_size', 'shuffle', 'sampler', 'drop_last']:
+            loader_args.pop(key)
+    if multi_scale_sizes is not None and is_training and sampler is not None:
+        # Every sample of a batch is resized to the image size of the batch, which is given with the sample index
+        batch_sampler = loader_args.pop('batch_sampler', None) or BatchSampler(sampler, batch_size, drop_last=is_training)
+        loader_args['batch_sampler'] = MultiScaleBatchSampler(batch_sampler, multi_scale_sizes, dataset=dataset)
+        for key in ['batch_size', 'shuffle', 'sampler', 'drop_last']:
+            loader_args.pop(key, None)
+
+    if num_workers == AUTO:
+        def _build_trial_loader(num_workers, prefetch_factor):
+            return _build_loader(dataset, {**loader_args, 'num_workers': num_workers,
+                                           'prefetch_factor': prefetch_factor, 'persistent_workers': False})
+
+        # Transforms of the trials may read the epoch (e.g. ``MosaicDetection``), which the training pipeline sets
+        # after the loader is built
+        has_cur_epoch = hasattr(dataset, 'cur_epoch')
+        if not has_cur_epoch:
+            dataset.cur_epoch = Value(c_int, 0)
+        num_workers, loader_args['prefetch_factor'] = autotune_workers(
+            _build_trial_loader, batch_size, name=dataset_name, distributed=distributed)
+        loader_args['num_workers'] = num_workers
+        if not has_cur_epoch:
+            del dataset.cur_epoch
+        if hasattr(dataset, 'pop_cache_stats'):
+            dataset.pop_cache_stats()  # Hits and misses of the calibration are not reported
+        if hasattr(dataset, 'pop_num_loaded_images'):
+            dataset.pop_num_loaded_images()
+
+    loader = _build_loader(dataset, loader_args)
+
+    if prefetch and device is not None:
+        loader = PrefetchLoader(loader, device, num_prefetch=prefetch)
 
     return loader
@@ -0,0 +1,113 @@
+"""
+Manifest of local dataset samples, which is persisted to skip scanning and sorting directories on every launch.
+
+A manifest is only valid while the modification times of its sources (image and label directories, or label files)
+are unchanged. Adding, removing or renaming a file in a directory updates the modification time of the directory,
+so the manifest is rebuilt in that case.
+"""
+import json
+import os
+from multiprocessing.pool import ThreadPool
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from loguru import logger
+
+from .misc import natural_key
+from .store import (
+    DEFAULT_CACHE_DIR,
+    DEFAULT_NUM_STAT_THREADS,
+    PathLike,
+    barrier,
+    file_mtime,
+    fingerprint,
+    is_local_writer,
+)
+
+MANIFEST_VERSION = 1
+MANIFEST_DIR = DEFAULT_CACHE_DIR / "manifest"
+
+
+def _source_stamps(sources: Sequence[Optional[PathLike]]) -> Dict[str, Optional[int]]:
+    return {str(Path(source).resolve()): file_mtime(source) for source in sources if source is not None}
+
+
+def manifest_path(name: str, sources: Sequence[Optional[PathLike]]) -> Path:
+    return MANIFEST_DIR / f"{name}_{fingerprint(_source_stamps(sources).keys())}.json"
+
+
+def scan_files(directory: PathLike, extensions: Iterable[str]) -> List[str]:
+    """List files in ``directory`` with one of ``extensions`` (case-insensitive) in natural order."""
+    extensions = {ext.lower() for ext in extensions}
+    with os.scandir(directory) as entries:
+        files = [entry.path for entry in entries
+                 if entry.is_file() and os.path.splitext(entry.name)[1].lower() in extensions]
+    return sorted(files, key=natural_key)
+
+
+def scan_dirs(dirs_and_extensions: Sequence[Tuple[PathLike, Iterable[str]]],
+              num_threads: int = DEFAULT_NUM_STAT_THREADS) -> List[List[str]]:
+    """Scan each (directory, extensions) in parallel. See ``scan_files``."""
+    with ThreadPool(min(num_threads, max(len(dirs_and_extensions), 1))) as pool:
+        return pool.starmap(scan_files, dirs_and_extensions)
+
+
+def read_manifest(name: str, sources: Sequence[Optional[PathLike]]) -> Optional[List[Dict]]:
+    path = manifest_path(name, sources)
+    if not path.exists():
+        return None
+    try:
+        with open(path, 'r') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if manifest.get('version') != MANIFEST_VERSION or manifest.get('sources') != _source_stamps(sources):
+        logger.info(f"Manifest {path} is outdated. Scanning the dataset again.")
+        return None
+    logger.info(f"Loaded {len(manifest['samples'])} samples from manifest {path}")
+    return [{'image': sample['image'], 'label': sample['label']} for sample in manifest['samples']]
+
+
+def write_manifest(name: str, sources: Sequence[Optional[PathLike]], samples: List[Dict],
+                   num_threads: int = DEFAULT_NUM_STAT_THREADS):
+    path = manifest_path(name, sources)
+
+    def _stat(sample):
+        stat = os.stat(sample['image'])
+        return {'image': sample['image'], 'label': sample['label'], 'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+
+    with ThreadPool(num_threads) as pool:
+        entries = pool.map(_stat, samples, chunksize=256)
+    manifest = {'version': MANIFEST_VERSION, 'sources': _source_stamps(sources), 'samples': entries}
+
+    # Write atomically, since machines which share the file system may write the same manifest at once
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + f".tmp{os.getpid()}")
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Failed to save dataset manifest at {path}: {e}")
+
+
+def load_manifest(name: str, sources: Sequence[Optional[PathLike]], scan_fn: Callable[[], List[Dict]]) -> List[Dict]:
+    """
+    Samples from the manifest, or from ``scan_fn`` if the manifest is outdated.
+    One process of each machine scans the dataset and writes the manifest, while the others wait and read it.
+    """
+    samples = None
+    if is_local_writer():
+        samples = read_manifest(name, sources)
+        if samples is None:
+            samples = scan_fn()
+            write_manifest(name, sources, samples)
+    barrier()
+
+    if samples is None:
+        samples = read_manifest(name, sources)
+    if samples is None:
+        # The manifest could not be saved
+        samples = scan_fn()
+    return samples
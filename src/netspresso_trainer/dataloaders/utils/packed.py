@@ -0,0 +1,205 @@
+"""
+Packed, sharded on-disk dataset format.
+
+A packed dataset directory looks like::
+
+    PACKED_ROOT
+    ├── meta.json
+    ├── train.index.npy
+    ├── train-00000.shard
+    ├── train-00001.shard
+    ├── valid.index.npy
+    └── valid-00000.shard
+
+Each shard is a flat byte file which holds the encoded image bytes of a sample followed by its parsed label bytes.
+The index of each split is an int64 array with one row per sample, so a sample is read with a single contiguous
+slice of a memory-mapped shard.
+"""
+import io
+import json
+import mmap
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Union
+
+import numpy as np
+
+PACKED_META_FILENAME = "meta.json"
+PACKED_INDEX_SUFFIX = ".index.npy"
+PACKED_SHARD_SUFFIX = ".shard"
+DEFAULT_SHARD_SIZE_MB = 256
+
+# Columns of the index array
+INDEX_SHARD = 0
+INDEX_IMAGE_OFFSET = 1
+INDEX_IMAGE_LENGTH = 2
+INDEX_LABEL_OFFSET = 3
+INDEX_LABEL_LENGTH = 4
+INDEX_CLASS = 5
+NUM_INDEX_COLUMNS = 6
+
+# How the label bytes of each sample should be interpreted
+LABEL_TYPE_NONE = 'none'  # label is stored as class index in the index array (or not stored at all)
+LABEL_TYPE_ARRAY = 'array'  # label is a numpy array serialized with ``np.save``
+LABEL_TYPE_IMAGE = 'image'  # label is an encoded image file (e.g. segmentation mask)
+
+
+def shard_name(split: str, shard_idx: int) -> str:
+    return f"{split}-{shard_idx:05d}{PACKED_SHARD_SUFFIX}"
+
+
+def serialize_array(array: np.ndarray) -> bytes:
+    buffer = io.BytesIO()
+    np.save(buffer, np.ascontiguousarray(array, dtype=np.float32), allow_pickle=False)
+    return buffer.getvalue()
+
+
+def deserialize_array(buffer: Union[bytes, memoryview]) -> np.ndarray:
+    return np.load(io.BytesIO(buffer), allow_pickle=False)
+
+
+class PackedShardWriter:
+    """Writes samples of one split sequentially into size-capped shards."""
+
+    def __init__(self, root: Union[str, Path], split: str, label_type: str, shard_size_mb: int = DEFAULT_SHARD_SIZE_MB):
+        assert label_type in [LABEL_TYPE_NONE, LABEL_TYPE_ARRAY, LABEL_TYPE_IMAGE], f"Unknown label type: {label_type}"
+        self.root = Path(root)
+        self.root.mkdir(exist_ok=True, parents=True)
+        self.split = split
+        self.label_type = label_type
+        self.shard_size = shard_size_mb * 1024 * 1024
+
+        self._rows: List[List[int]] = []
+        self._shards: List[str] = []
+        self._file = None
+        self._offset = 0
+
+    def _open_next_shard(self):
+        if self._file is not None:
+            self._file.close()
+        name = shard_name(self.split, len(self._shards))
+        self._shards.append(name)
+        self._file = open(self.root / name, 'wb')  # noqa: SIM115 -- kept open across ``write`` calls, closed by ``close``
+        self._offset = 0
+
+    def write(self, image_bytes: bytes, label_bytes: Optional[bytes] = None, class_idx: int = -1):
+        label_bytes = label_bytes if label_bytes is not None else b''
+        record_size = len(image_bytes) + len(label_bytes)
+        if self._file is None or (self._offset > 0 and self._offset + record_size > self.shard_size):
+            self._open_next_shard()
+
+        image_offset = self._offset
+        self._file.write(image_bytes)
+        label_offset = image_offset + len(image_bytes)
+        self._file.write(label_bytes)
+        self._offset = label_offset + len(label_bytes)
+
+        self._rows.append([len(self._shards) - 1, image_offset, len(image_bytes), label_offset, len(label_bytes), class_idx])
+
+    def close(self) -> Dict:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        index = np.array(self._rows, dtype=np.int64).reshape(-1, NUM_INDEX_COLUMNS)
+        np.save(self.root / f"{self.split}{PACKED_INDEX_SUFFIX}", index)
+        return {'num_samples': len(index), 'shards': self._shards, 'label_type': self.label_type}
+
+
+class PackedShardReader:
+    """Memory-mapped, read-only access to one split of a packed dataset."""
+
+    def __init__(self, root: Union[str, Path], split: str):
+        self.root = Path(root)
+        self.split = split
+
+        meta = read_packed_meta(self.root)
+        assert split in meta['splits'], f"Split {split} does not exist in packed dataset {self.root}!"
+        split_meta = meta['splits'][split]
+        self.label_type = split_meta['label_type']
+        self.shard_names = split_meta['shards']
+
+        self.index = np.load(self.root / f"{split}{PACKED_INDEX_SUFFIX}", mmap_mode='r')
+        self._shards: Dict[int, mmap.mmap] = {}
+
+    def __len__(self):
+        return len(self.index)
+
+    def _shard(self, shard_idx: int) -> mmap.mmap:
+        if shard_idx not in self._shards:
+            with open(self.root / self.shard_names[shard_idx], 'rb') as f:
+                self._shards[shard_idx] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._shards[shard_idx]
+
+    def image_bytes(self, index: int) -> memoryview:
+        row = self.index[index]
+        offset, length = int(row[INDEX_IMAGE_OFFSET]), int(row[INDEX_IMAGE_LENGTH])
+        return memoryview(self._shard(int(row[INDEX_SHARD])))[offset:offset + length]
+
+    def label_bytes(self, index: int) -> Optional[memoryview]:
+        row = self.index[index]
+        offset, length = int(row[INDEX_LABEL_OFFSET]), int(row[INDEX_LABEL_LENGTH])
+        if length == 0:
+            return None
+        return memoryview(self._shard(int(row[INDEX_SHARD])))[offset:offset + length]
+
+    def class_idx(self, index: int) -> Optional[int]:
+        class_idx = int(self.index[index][INDEX_CLASS])
+        return class_idx if class_idx >= 0 else None
+
+
+# Readers are opened lazily in each process (after DataLoader workers are forked)
+_READERS: Dict[tuple, PackedShardReader] = {}
+
+
+def get_packed_reader(root: Union[str, Path], split: str) -> PackedShardReader:
+    key = (str(root), split)
+    if key not in _READERS:
+        _READERS[key] = PackedShardReader(root, split)
+    return _READERS[key]
+
+
+class PackedRecord(NamedTuple):
+    """Picklable reference to the image or label of one packed sample. It is used in place of a file path."""
+    root: str
+    split: str
+    index: int
+    field: str = 'image'
+
+    @property
+    def reader(self) -> PackedShardReader:
+        return get_packed_reader(self.root, self.split)
+
+    def read_bytes(self) -> memoryview:
+        if self.field == 'image':
+            return self.reader.image_bytes(self.index)
+        return self.reader.label_bytes(self.index)
+
+    def open(self) -> io.BytesIO:
+        return io.BytesIO(self.read_bytes())
+
+    def read_array(self) -> np.ndarray:
+        return deserialize_array(self.read_bytes())
+
+
+def read_packed_meta(root: Union[str, Path]) -> Dict:
+    meta_path = Path(root) / PACKED_META_FILENAME
+    assert meta_path.exists(), f"Cannot locate packed dataset meta file {meta_path}! Is this a packed dataset directory?"
+    with open(meta_path, 'r') as f:
+        return json.load(f)
+
+
+def write_packed_meta(root: Union[str, Path], meta: Dict):
+    with open(Path(root) / PACKED_META_FILENAME, 'w') as f:
+        json.dump(meta, f, indent=4)
+
+
+def load_packed_data(root: Union[str, Path], split: str) -> List[Dict[str, Optional[Union[PackedRecord, int]]]]:
+    """Build the sample list of a packed split in the same shape as ``BaseDataSampler.load_data``."""
+    reader = get_packed_reader(root, split)
+    images_and_targets = []
+    for idx in range(len(reader)):
+        if reader.label_type == LABEL_TYPE_NONE:
+            label = reader.class_idx(idx)
+        else:
+            label = PackedRecord(str(root), split, idx, 'label') if reader.index[idx][INDEX_LABEL_LENGTH] > 0 else None
+        images_and_targets.append({'image': PackedRecord(str(root), split, idx, 'image'), 'label': label})
+    return images_and_targets
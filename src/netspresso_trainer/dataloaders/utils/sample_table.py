@@ -0,0 +1,161 @@
+"""
+Compact columnar table of dataset samples.
+
+A list of dicts of strings holds a few Python objects per sample. Their reference counts are updated whenever they
+are touched, so the pages of the list are copied into every forked dataloader worker as an epoch goes on.
+``SampleTable`` keeps each field as a few numpy arrays instead (e.g. paths as one utf-8 blob with offsets), and
+builds the dict of a sample only when it is accessed.
+"""
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+
+class ConstantColumn:
+    """Column whose values are all the same, e.g. the root of every packed record."""
+
+    def __init__(self, value, length: int):
+        self.value = value
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index: int):
+        return self.value
+
+
+class StringColumn:
+    """Strings which are encoded as utf-8 and concatenated in one blob."""
+
+    def __init__(self, values: Sequence[str]):
+        encoded = [value.encode('utf-8') for value in values]
+        self.offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        self.offsets[1:] = np.cumsum([len(value) for value in encoded])
+        self.blob = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> str:
+        return self.blob[self.offsets[index]:self.offsets[index + 1]].tobytes().decode('utf-8')
+
+
+class IntColumn:
+
+    def __init__(self, values: Sequence[int]):
+        self.values = np.asarray(values, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, index: int) -> int:
+        return int(self.values[index])
+
+
+class RecordColumn:
+    """NamedTuple values (e.g. ``PackedRecord``), which are kept as a column for each field."""
+
+    def __init__(self, record_type: type, values: Sequence[tuple]):
+        self.record_type = record_type
+        self.fields = [make_column([getattr(value, field) for value in values]) for field in record_type._fields]
+
+    def __len__(self):
+        return len(self.fields[0]) if len(self.fields) != 0 else 0
+
+    def __getitem__(self, index: int):
+        return self.record_type(*(field[index] for field in self.fields))
+
+
+class OptionalColumn:
+    """Column with missing (``None``) values. Missing values are filled with another value in ``column``."""
+
+    def __init__(self, values: Sequence):
+        self.valid = np.array([value is not None for value in values], dtype=bool)
+        filler = next(value for value in values if value is not None)
+        self.column = make_column([value if value is not None else filler for value in values])
+
+    def __len__(self):
+        return len(self.valid)
+
+    def __getitem__(self, index: int):
+        return self.column[index] if self.valid[index] else None
+
+
+class ObjectColumn:
+    """Fallback for values of other types. These are kept as Python objects."""
+
+    def __init__(self, values: Sequence):
+        self.values = np.empty(len(values), dtype=object)
+        self.values[:] = list(values)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, index: int):
+        return self.values[index]
+
+
+def _is_int(value) -> bool:
+    return isinstance(value, (int, np.integer)) and not isinstance(value, bool)
+
+
+def make_column(values: Sequence):
+    values = list(values)
+    if len(values) == 0:
+        return ConstantColumn(None, 0)
+    if any(value is None for value in values):
+        if all(value is None for value in values):
+            return ConstantColumn(None, len(values))
+        return OptionalColumn(values)
+
+    value_type = type(values[0])
+    if any(type(value) is not value_type for value in values):
+        return ObjectColumn(values)
+    if issubclass(value_type, tuple) and hasattr(value_type, '_fields'):
+        return RecordColumn(value_type, values)
+    if value_type is str:
+        return ConstantColumn(values[0], len(values)) if len(set(values)) == 1 else StringColumn(values)
+    if _is_int(values[0]):
+        return IntColumn(values)
+    return ObjectColumn(values)
+
+
+class SampleTable(Sequence):
+    """
+    Read-only sequence of sample dicts (e.g. ``{'image': ..., 'label': ...}``), which is stored column by column.
+    Accessing a sample only touches its own row.
+    """
+
+    def __init__(self, columns: Dict[str, Any], length: int):
+        self.columns = columns
+        self.length = length
+
+    @classmethod
+    def from_samples(cls, samples: Optional[Sequence[Dict]]) -> Optional['SampleTable']:
+        if samples is None or isinstance(samples, SampleTable):
+            return samples
+        samples: List[Dict] = list(samples)
+        fields = list(samples[0].keys()) if len(samples) != 0 else []
+        columns = {field: make_column([sample[field] for sample in samples]) for field in fields}
+        return cls(columns, len(samples))
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index: int) -> Dict:
+        index = int(index)
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError(f"Sample index {index} is out of range for {self.length} samples")
+        return {field: column[index] for field, column in self.columns.items()}
+
+    def __iter__(self) -> Iterator[Dict]:
+        for index in range(self.length):
+            yield self[index]
+
+    def column(self, field: str) -> List:
+        """All values of ``field``."""
+        column = self.columns[field]
+        return [column[index] for index in range(self.length)]
@@ -3,10 +3,12 @@ Based on the publicly available DeepDeblur-PyTorch repository.
 https://github.com/SeungjunNah/DeepDeblur-PyTorch/blob/master/src/data/sampler.py
 """
 import math
+from typing import Dict, List, Sequence
 
+import numpy as np
 import torch
 import torch.distributed as dist
-from torch.utils.data import Sampler
+from torch.utils.data import BatchSampler, Sampler
 
 
 class DistributedEvalSampler(Sampler):
@@ -117,3 +119,174 @@ class DistributedEvalSampler(Sampler):
             epoch (int): _epoch number.
         """
         self.epoch = epoch
+
+
+class GroupedBatchSampler(BatchSampler):
+    r"""
+    BatchSampler which puts samples of the same group (e.g. instances cropped from the same image) in a row.
+
+    Groups are visited in the order of their first sample from ``sampler``, and samples of a group are split into
+    two batches only at a batch boundary. Since a whole batch is loaded by one dataloader worker,
+    each group is loaded by one worker in most cases.
+
+    Arguments:
+        sampler (Sampler): Base sampler, e.g. :class:`~torch.utils.data.DistributedSampler`.
+        group_ids (Sequence[int]): Group id of each sample in the dataset.
+        batch_size (int): Size of mini-batch.
+        drop_last (bool): If ``True``, the sampler will drop the last batch if its size would be less than ``batch_size``.
+    """
+
+    def __init__(self, sampler, group_ids: Sequence[int], batch_size: int, drop_last: bool):
+        super().__init__(sampler, batch_size, drop_last)
+        self.group_ids = group_ids
+
+    def __iter__(self):
+        groups: Dict[int, List[int]] = {}
+        for idx in self.sampler:
+            groups.setdefault(int(self.group_ids[idx]), []).append(idx)
+
+        batch = []
+        for indices in groups.values():
+            for idx in indices:
+                batch.append(idx)
+                if len(batch) == self.batch_size:
+                    yield batch
+                    batch = []
+        if len(batch) != 0 and not self.drop_last:
+            yield batch
+
+
+class BucketBatchSampler(BatchSampler):
+    r"""
+    BatchSampler for evaluation which puts images of similar aspect ratio and size in the same batch.
+
+    Samples from ``sampler`` are grouped into aspect ratio buckets and sorted by image area in each bucket, and then
+    split into batches. Images of a batch are padded to the largest one, so that batches have little padding.
+    The order of samples is changed, so it should be used only where the order does not matter, e.g. validation.
+
+    Arguments:
+        sampler (Sampler): Base sampler, e.g. :class:`DistributedEvalSampler`.
+        image_sizes (np.ndarray): (w, h) of each image in the dataset.
+        batch_size (int): Size of mini-batch.
+        drop_last (bool): If ``True``, the sampler will drop the last batch if its size would be less than ``batch_size``.
+        num_buckets_per_octave (int): The number of aspect ratio buckets for each doubling of the aspect ratio.
+    """
+
+    def __init__(self, sampler, image_sizes: np.ndarray, batch_size: int, drop_last: bool = False,
+                 num_buckets_per_octave: int = 4):
+        super().__init__(sampler, batch_size, drop_last)
+        self.image_sizes = np.asarray(image_sizes)
+        self.num_buckets_per_octave = num_buckets_per_octave
+
+    def __iter__(self):
+        indices = np.array(list(self.sampler), dtype=np.int64)
+        # Dummy samples (-1) of DistributedEvalSampler are loaded as the last sample of the dataset
+        w, h = self.image_sizes[indices].T.astype(np.float64)
+        buckets = np.round(np.log2(w / h) * self.num_buckets_per_octave)
+        indices = indices[np.lexsort((w * h, buckets))]
+
+        for start in range(0, len(indices), self.batch_size):
+            batch = indices[start:start + self.batch_size].tolist()
+            if len(batch) < self.batch_size and self.drop_last:
+                return
+            yield batch
+
+
+class MultiScaleBatchSampler(Sampler):
+    r"""
+    Wrapper of a batch sampler which assigns an image size to each batch, for multi-scale training with ``RandomResize``.
+
+    Each index of a batch is given as a pair of the sample index and the image size of the batch, so that every sample
+    of a batch is resized to the same size regardless of which dataloader worker loads it.
+    Sizes are drawn with the seed and the current epoch, so that every DDP process uses the same size for each batch.
+
+    Arguments:
+        batch_sampler (Sampler): Base batch sampler, e.g. :class:`~torch.utils.data.BatchSampler`.
+        sizes (Sequence[List[int]]): Candidate image sizes.
+        dataset (Dataset, optional): Dataset whose ``cur_epoch`` is the current epoch.
+            If not available, the number of iterations over the sampler is used instead.
+        seed (int, optional): Random seed to draw the sizes. Default: ``0``.
+    """
+
+    def __init__(self, batch_sampler, sizes: Sequence[List[int]], dataset=None, seed: int = 0):
+        self.batch_sampler = batch_sampler
+        self.sizes = [tuple(size) for size in sizes]
+        self.dataset = dataset
+        self.seed = seed
+        self._num_iterations = 0
+
+    def __iter__(self):
+        cur_epoch = getattr(self.dataset, 'cur_epoch', None)
+        epoch = cur_epoch.value if cur_epoch is not None else self._num_iterations
+        self._num_iterations += 1
+
+        g = torch.Generator()
+        g.manual_seed(self.seed + epoch)
+        for batch in self.batch_sampler:
+            size = self.sizes[int(torch.randint(len(self.sizes), (1,), generator=g))]
+            yield [(idx, size) for idx in batch]
+
+    def __len__(self):
+        return len(self.batch_sampler)
+
+
+class RepeatAugSampler(Sampler):
+    r"""
+    Sampler for repeated augmentation, which gives each sample ``num_repeats`` times in an epoch.
+
+    Based on the RepeatAugSampler of DeiT.
+    https://github.com/facebookresearch/deit/blob/main/samplers.py
+
+    Repeats of a sample come in a row and are split across the processes, so that each process gets a different
+    augmented view. In a single process, the repeats are in the same batch, and the dataloader worker of the batch
+    decodes the image only once. Each process yields as many samples in an epoch as with
+    :class:`~torch.utils.data.DistributedSampler`, so an epoch covers ``1 / num_repeats`` of the dataset.
+
+    Arguments:
+        dataset (Dataset): Dataset used for sampling. Its ``cur_epoch`` reseeds the shuffling in every epoch.
+        num_replicas (int): Number of processes participating in distributed training.
+        rank (int): Rank of the current process within :attr:`num_replicas`.
+        num_repeats (int): The number of augmented views of each sample.
+        shuffle (bool, optional): If ``True`` (default), sampler will shuffle the indices.
+        seed (int, optional): Random seed to shuffle the indices. Default: ``0``.
+    """
+
+    def __init__(self, dataset, num_replicas: int, rank: int, num_repeats: int, shuffle: bool = True, seed: int = 0):
+        self.dataset = dataset
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.num_repeats = num_repeats
+        self.shuffle = shuffle
+        self.seed = seed
+        self._num_iterations = 0
+
+        self.num_samples = math.ceil(len(self.dataset) * num_repeats / self.num_replicas)
+        self.total_size = self.num_samples * self.num_replicas
+        self.num_selected_samples = math.ceil(len(self.dataset) / self.num_replicas)
+
+    def __iter__(self):
+        cur_epoch = getattr(self.dataset, 'cur_epoch', None)
+        epoch = cur_epoch.value if cur_epoch is not None else self._num_iterations
+        self._num_iterations += 1
+
+        if self.shuffle:
+            g = torch.Generator()
+            g.manual_seed(self.seed + epoch)
+            indices = torch.randperm(len(self.dataset), generator=g)
+        else:
+            indices = torch.arange(len(self.dataset))
+        # e.g. [0, 0, 0, 1, 1, 1, 2, 2, 2, ...]
+        indices = torch.repeat_interleave(indices, repeats=self.num_repeats, dim=0).tolist()
+
+        # add extra samples to make it evenly divisible
+        indices += indices[:(self.total_size - len(indices))]
+        assert len(indices) == self.total_size
+
+        # subsample
+        indices = indices[self.rank:self.total_size:self.num_replicas]
+        assert len(indices) == self.num_samples
+
+        return iter(indices[:self.num_selected_samples])
+
+    def __len__(self):
+        return self.num_selected_samples
@@ -0,0 +1,123 @@
+"""
+Helpers for stores which are derived from dataset files once and saved on the local disk (e.g. label index, mask
+store, memory-mapped image cache, manifest).
+
+A store is written by one process of each machine into a temporary directory, which then replaces the store
+directory, while the other processes wait at a barrier. It is reused while its meta (e.g. sizes and modification
+times of the source files) is unchanged.
+"""
+import hashlib
+import json
+import os
+import shutil
+import socket
+from multiprocessing.pool import ThreadPool
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional, Sequence, Tuple, Union
+
+import torch.distributed as dist
+from loguru import logger
+
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "netspresso_trainer"
+DEFAULT_NUM_PROCESSES = 8
+DEFAULT_NUM_STAT_THREADS = 8  # Stat of files waits on the file system, not on the CPU
+
+PathLike = Union[str, Path]
+
+
+def fingerprint(keys: Iterable[str]) -> str:
+    hasher = hashlib.sha1()
+    for key in keys:
+        hasher.update(str(key).encode())
+        hasher.update(b'\0')
+    return hasher.hexdigest()[:16]
+
+
+def file_mtime(path: PathLike) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def file_stamp(path: PathLike) -> Optional[Tuple[int, int]]:
+    """(size, modification time) of a file, or ``None`` if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def files_fingerprint(files: Sequence, num_threads: int = DEFAULT_NUM_STAT_THREADS) -> str:
+    """
+    Fingerprint of the size and modification time of every file, which changes when a file is edited in place.
+    Items which are not paths (e.g. records of packed datasets) are skipped.
+    """
+    paths = [str(file) for file in files if isinstance(file, (str, Path))]
+    with ThreadPool(num_threads) as pool:
+        stamps = pool.map(file_stamp, paths, chunksize=256)
+    return fingerprint(f"{path}:{stamp}" for path, stamp in zip(paths, stamps))
+
+
+def is_local_writer() -> bool:
+    """Whether this process writes stores of its machine, so that every machine has them without a shared file system."""
+    if not dist.is_initialized():
+        return True
+    return int(os.environ.get('LOCAL_RANK', dist.get_rank())) == 0
+
+
+def barrier():
+    if dist.is_initialized():
+        dist.barrier()
+
+
+def write_store(store_dir: Path, write_fn: Callable[[Path], None]):
+    """Fill a temporary directory with ``write_fn`` and move it to ``store_dir`` at once."""
+    tmp_dir = store_dir.with_name(store_dir.name + f".tmp{socket.gethostname()}_{os.getpid()}")
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    write_fn(tmp_dir)
+
+    if store_dir.exists():
+        shutil.rmtree(store_dir, ignore_errors=True)
+    try:
+        tmp_dir.rename(store_dir)
+    except OSError:
+        # Another machine wrote the same store in a shared file system first
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if not store_dir.exists():
+            raise
+
+
+def read_store_meta(store_dir: Path, meta_filename: str) -> Optional[Dict]:
+    try:
+        with open(store_dir / meta_filename, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def build_store(store_dir: Path, meta_filename: str, meta_fn: Callable[[], Dict], write_fn: Callable[[Path], None],
+                description: str):
+    """
+    Write the store with ``write_fn`` on one process of each machine unless it exists with the same meta.
+    ``meta_fn`` is only called by the writing process, since it may stat every file of the dataset.
+    ``write_fn`` fills the given directory, and the meta is saved there as ``meta_filename`` with any other fields
+    which ``write_fn`` saved in it. Every process returns after the store is ready.
+    """
+    if is_local_writer():
+        meta = meta_fn()
+        saved_meta = read_store_meta(store_dir, meta_filename)
+        if saved_meta is not None and all(saved_meta.get(key) == value for key, value in meta.items()):
+            logger.info(f"Reuse {description} at {store_dir}")
+        else:
+            logger.info(f"Build {description} at {store_dir}")
+
+            def _write(tmp_dir: Path):
+                write_fn(tmp_dir)
+                saved = read_store_meta(tmp_dir, meta_filename) or {}
+                with open(tmp_dir / meta_filename, 'w') as f:
+                    json.dump({**saved, **meta}, f)
+
+            write_store(store_dir, _write)
+    barrier()
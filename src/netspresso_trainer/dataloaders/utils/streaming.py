@@ -0,0 +1,178 @@
+"""
+Streaming mode of Hugging Face datasets, which reads samples from the dataset files (or hub) while training instead of
+preparing the whole dataset in the cache directory.
+
+Samples of a stream are split by shards across DDP ranks and dataloader workers. If the dataset has no validation
+split, the train split is divided into train and validation streams by a hash of the encoded image of each sample,
+so the division is the same for every run, rank and worker.
+"""
+import zlib
+from functools import partial
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import torch.utils.data as data
+from loguru import logger
+
+DEFAULT_SHUFFLE_BUFFER = 1000
+DEFAULT_SHUFFLE_SEED = 42
+SPLIT_HASH_BUCKETS = 10000
+
+
+def _example_hash(value: Dict) -> int:
+    # ``value`` is an undecoded image feature, which has either encoded bytes or a file path
+    key = value['bytes'] if value.get('bytes') is not None else str(value.get('path')).encode()
+    return zlib.crc32(key)
+
+
+def _in_split(example: Dict, image_feature_name: str, threshold: int, train: bool) -> bool:
+    return (_example_hash(example[image_feature_name]) % SPLIT_HASH_BUCKETS < threshold) == train
+
+
+def count_examples(stream, split: str) -> int:
+    """Number of examples in ``stream``. Only a single column is read if the size is not in the dataset info."""
+    from datasets import Image as HFImage
+
+    if stream.info.splits is not None and split in stream.info.splits and stream.info.splits[split].num_examples:
+        return stream.info.splits[split].num_examples
+
+    features = stream.features
+    column = next((name for name, feature in features.items() if not isinstance(feature, HFImage)), None) \
+        if features is not None else None
+    if column is None:
+        column = list(features.keys())[0] if features is not None else None
+    counted = stream.select_columns([column]) if column is not None else stream
+    if column is not None and isinstance(features[column], HFImage):
+        counted = counted.cast_column(column, HFImage(decode=False))
+    logger.info(f"Counting samples of {split} split of streaming dataset...")
+    return sum(1 for _ in counted)
+
+
+def split_streaming_dataset(total_dataset, image_feature_name: str,
+                            train_valid_split_ratio: float) -> Tuple[object, object, Optional[object], Dict[str, int]]:
+    """
+    Build train, valid, and test streams and (estimated) number of samples of each stream.
+    Images are kept encoded in the streams, and decoded by ``StreamingHFDataset``.
+    """
+    from datasets import Image as HFImage
+
+    streams = {split: stream.cast_column(image_feature_name, HFImage(decode=False))
+               for split, stream in total_dataset.items()}
+    num_samples = {split: count_examples(total_dataset[split], split) for split in streams}
+
+    train_samples = streams['train']
+    valid_samples = streams.get('validation')
+    test_samples = streams.get('test')
+    num_train = num_samples['train']
+    num_valid = num_samples.get('validation')
+    if valid_samples is None:
+        # Hash split is deterministic without any index of samples. Its sizes are estimated by the split ratio.
+        threshold = int(SPLIT_HASH_BUCKETS * train_valid_split_ratio)
+        train_samples = streams['train'].filter(
+            partial(_in_split, image_feature_name=image_feature_name, threshold=threshold, train=True))
+        valid_samples = streams['train'].filter(
+            partial(_in_split, image_feature_name=image_feature_name, threshold=threshold, train=False))
+        num_train = int(num_samples['train'] * train_valid_split_ratio)
+        num_valid = num_samples['train'] - num_train
+    return train_samples, valid_samples, test_samples, \
+        {'train': num_train, 'valid': num_valid, 'test': num_samples.get('test')}
+
+
+def scan_label_column(stream, label_feature_name: str) -> List:
+    """Sorted unique labels of ``stream``, which are read from the label column only."""
+    return sorted({example[label_feature_name] for example in stream.select_columns([label_feature_name])})
+
+
+class StreamingHFDataset(data.IterableDataset):
+    """
+    Iterable dataset over a stream of Hugging Face dataset.
+    Each row is processed by ``dataset``, the map-style Hugging Face dataset of the task which holds the stream.
+    In training, every rank yields the same number of full batches, so that DDP processes do not wait for each other.
+    """
+
+    def __init__(self, dataset, num_samples: int, shuffle: bool,
+                 shuffle_buffer: int = DEFAULT_SHUFFLE_BUFFER, seed: int = DEFAULT_SHUFFLE_SEED):
+        super(StreamingHFDataset, self).__init__()
+        self.dataset = dataset
+        self.num_samples = num_samples
+        self.shuffle = shuffle
+        self.shuffle_buffer = shuffle_buffer
+        self.seed = seed
+
+        self.rank = 0
+        self.world_size = 1
+        self.batch_size = 1
+        self.drop_last = False
+        self.cur_epoch = None
+        self._num_iterations = 0
+
+    def __getattr__(self, name):
+        # Attributes of the task dataset, e.g. num_classes, class_map
+        if name == 'dataset':
+            raise AttributeError(name)
+        return getattr(self.dataset, name)
+
+    def shard(self, rank: int, world_size: int, batch_size: int, drop_last: bool):
+        self.rank = rank
+        self.world_size = world_size
+        self.batch_size = batch_size
+        self.drop_last = drop_last
+
+    def _stream(self, epoch: int):
+        from datasets.distributed import split_dataset_by_node
+
+        stream = self.dataset.samples
+        if self.world_size > 1:
+            stream = split_dataset_by_node(stream, rank=self.rank, world_size=self.world_size)
+        if self.shuffle:
+            # Shuffling is reseeded by epoch, so it is deterministic and different for each epoch
+            stream = stream.shuffle(seed=self.seed, buffer_size=self.shuffle_buffer)
+            stream.set_epoch(epoch)
+        return stream
+
+    def _worker_quota(self, worker_id: int, num_workers: int, num_shards: int) -> Optional[int]:
+        if not self.drop_last:
+            return None
+        # Split full batches of this rank to the workers which have any shard
+        num_active_workers = max(min(num_workers, num_shards), 1)
+        if worker_id >= num_active_workers:
+            return 0
+        num_batches = (self.num_samples // self.world_size) // self.batch_size
+        return (num_batches // num_active_workers + int(worker_id < num_batches % num_active_workers)) * self.batch_size
+
+    def _decode(self, row: Dict) -> Dict:
+        from datasets import Image as HFImage
+
+        image = row[self.dataset.image_feature_name]
+        if isinstance(image, dict):
+            row[self.dataset.image_feature_name] = HFImage().decode_example(image)
+        return row
+
+    def __iter__(self):
+        epoch = self.cur_epoch.value if self.cur_epoch is not None else self._num_iterations
+        self._num_iterations += 1
+
+        worker_info = data.get_worker_info()
+        worker_id, num_workers = (worker_info.id, worker_info.num_workers) if worker_info is not None else (0, 1)
+        stream = self._stream(epoch)
+        quota = self._worker_quota(worker_id, num_workers, stream.num_shards)
+
+        consumer_id = self.rank * num_workers + worker_id
+        num_consumers = self.world_size * num_workers
+        count = 0
+        while quota is None or count < quota:
+            num_yielded = 0
+            for row in stream:
+                if quota is not None and count >= quota:
+                    break
+                yield self.dataset._process_row(count * num_consumers + consumer_id, self._decode(row))
+                count += 1
+                num_yielded += 1
+            if quota is None or num_yielded == 0:
+                break
+            # A shard of this worker ran out before the quota. Repeat the stream to fill the batches.
+
+    def __len__(self):
+        if self.drop_last:
+            return (self.num_samples // self.world_size) // self.batch_size * self.batch_size
+        return int(np.ceil(self.num_samples / self.world_size))
@@ -50,7 +50,7 @@ def evaluation_common(
     if conf.distributed and conf.rank == 0:
         torch.distributed.barrier()
 
-    eval_dataloader = build_dataloader(conf, task, model_name, dataset=test_dataset, phase='val')
+    eval_dataloader = build_dataloader(conf, task, model_name, dataset=test_dataset, phase='val', devices=devices)
 
     # Build model
     # TODO: Not implemented for various model types. Only support pytorch model now
@@ -54,7 +54,7 @@ def inference_common(
     if conf.distributed and conf.rank == 0:
         torch.distributed.barrier()
 
-    test_dataloader = build_dataloader(conf, task, model_name, dataset=test_dataset, phase='val')
+    test_dataloader = build_dataloader(conf, task, model_name, dataset=test_dataset, phase='val', devices=devices)
 
     # Build model
     # TODO: Not implemented for various model types. Only support pytorch model now
@@ -138,6 +138,7 @@ class TrainingLogger():
         metrics: Optional[Dict] = None,
         learning_rate: Optional[float] = None,
         elapsed_time: Optional[float] = None,
+        data_stats: Optional[Dict] = None,
     ):
         if not self.use_imagesaver: # TODO: This is uneffective way
             samples = None
@@ -157,7 +158,8 @@ class TrainingLogger():
                 metrics=metrics,
                 images=samples,
                 learning_rate=learning_rate,
-                elapsed_time=elapsed_time
+                elapsed_time=elapsed_time,
+                data_stats=data_stats
             )
 
     def log_end_of_traning(self, final_metrics=None):
@@ -20,6 +20,7 @@ class StdOutLogger:
         metrics: Optional[Dict] = None,
         learning_rate: Optional[float] = None,
         elapsed_time: Optional[float] = None,
+        data_stats: Optional[Dict] = None,
         **kwargs
     ):
         if epoch is not None and prefix == 'training':
@@ -29,6 +30,8 @@ class StdOutLogger:
             logger.info(f"learning rate: {learning_rate:.7f}")
         if elapsed_time is not None:
             logger.info(f"elapsed_time: {elapsed_time:.7f}")
+        if data_stats is not None:
+            logger.info(f"{prefix} data: {[(name, value) for name, value in data_stats.items()]}")
 
         if losses is not None:
             logger.info(f"{prefix} loss: {losses['total']:.7f}")
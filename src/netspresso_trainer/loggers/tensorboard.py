@@ -102,6 +102,7 @@ class TensorboardLogger:
         metrics: Optional[Dict] = None,
         learning_rate: Optional[float] = None,
         elapsed_time: Optional[float] = None,
+        data_stats: Optional[Dict] = None,
         **kwargs
     ):
         self._epoch = 0 if epoch is None else epoch
@@ -116,6 +117,8 @@ class TensorboardLogger:
             self.log_scalar('learning_rate', learning_rate, mode='misc')
         if elapsed_time is not None:
             self.log_scalar('elapsed_time', elapsed_time, mode='misc')
+        if data_stats is not None:
+            self.log_scalars_with_dict(data_stats, mode='data')
 
 
 def _as_grid(image_batch, rows: int, cols: int):
@@ -44,6 +44,7 @@ class BasePipeline(ABC):
         metrics: Optional[Dict] = None,
         learning_rate: Optional[float] = None,
         elapsed_time: Optional[float] = None,
+        data_stats: Optional[Dict] = None,
     ):
         self.logger.log(
             prefix=prefix,
@@ -52,7 +53,8 @@ class BasePipeline(ABC):
             losses=losses,
             metrics=metrics,
             learning_rate=learning_rate,
-            elapsed_time=elapsed_time
+            elapsed_time=elapsed_time,
+            data_stats=data_stats
         )
 
     @abstractmethod
@@ -5,6 +5,8 @@ import torch
 import torch.distributed as dist
 from loguru import logger
 
+from ...dataloaders import CREATE_BATCH_TRANSFORM
+
 NUM_SAMPLES = 16
 
 
@@ -26,6 +28,20 @@ class BaseTaskProcessor(ABC):
             self.data_type = torch.float32
         self.grad_scaler = torch.cuda.amp.GradScaler(enabled=self.mixed_precision)
 
+        # Normalization (and photometric transforms) of uint8 batches with ``augmentation.batch_transform``
+        self.train_batch_transform = CREATE_BATCH_TRANSFORM(conf.augmentation, is_training=True,
+                                                            num_classes=kwargs.get('num_classes'))
+        self.eval_batch_transform = CREATE_BATCH_TRANSFORM(conf.augmentation, is_training=False)
+
+    def transform_batch(self, images, target=None, training=False):
+        if images.dtype == torch.float16:
+            # Images sent from dataloader workers in half precision with ``environment.fp16_transport``
+            images = images.float()
+        batch_transform = self.train_batch_transform if training else self.eval_batch_transform
+        if batch_transform is None:
+            return images, target
+        return batch_transform(images, target)
+
     @abstractmethod
     def train_step(self, train_model, batch):
         raise NotImplementedError
@@ -2,6 +2,7 @@ from typing import Literal
 
 import numpy as np
 import torch
+from torch.nn import functional as F
 
 from .base import BaseTaskProcessor
 
@@ -9,13 +10,22 @@ from .base import BaseTaskProcessor
 class ClassificationProcessor(BaseTaskProcessor):
     def __init__(self, conf, postprocessor, devices, **kwargs):
         super(ClassificationProcessor, self).__init__(conf, postprocessor, devices, **kwargs)
+        self.num_classes = kwargs.get('num_classes')
+
+    def expand_labels(self, labels, dtype):
+        """Expand class indices of the batch to one-hot vectors on the device. Soft labels are only cast to ``dtype``."""
+        if labels.dim() > 1:
+            return labels.to(dtype)
+        # Unlabeled samples (-1) are masked to zero vectors on the device, so no host-side check (sync) is needed
+        one_hot = F.one_hot(labels.clamp(min=0), num_classes=self.num_classes)
+        return (one_hot * (labels >= 0).unsqueeze(-1)).to(dtype)
 
     def train_step(self, train_model, batch, optimizer, loss_factory, metric_factory):
         train_model.train()
         indices, images, labels = batch
-        images = images.to(self.devices).to(self.data_type)
-        labels = labels.to(self.devices).to(self.data_type)
-        target = {'target': labels}
+        images, labels = self.transform_batch(images.to(self.devices), labels.to(self.devices), training=True)
+        images = images.to(self.data_type)
+        target = {'target': self.expand_labels(labels, self.data_type)}
 
         optimizer.zero_grad()
 
@@ -46,9 +56,9 @@ class ClassificationProcessor(BaseTaskProcessor):
     def valid_step(self, eval_model, batch, loss_factory, metric_factory):
         eval_model.eval()
         indices, images, labels = batch
-        images = images.to(self.devices)
+        images, _ = self.transform_batch(images.to(self.devices))
         labels = labels.to(self.devices)
-        target = {'target': labels}
+        target = {'target': self.expand_labels(labels, images.dtype)}
 
         out = eval_model(images)
         loss_factory.calc(out, target, phase='valid')
@@ -56,7 +66,7 @@ class ClassificationProcessor(BaseTaskProcessor):
             labels = torch.argmax(labels, dim=-1)
         pred = self.postprocessor(out)
 
-        indices = indices.numpy()
+        indices = indices.cpu().numpy()
         labels = labels.detach().cpu().numpy() # Change it to numpy before compute metric
         if self.conf.distributed:
             gathered_pred = [None for _ in range(torch.distributed.get_world_size())]
@@ -83,12 +93,12 @@ class ClassificationProcessor(BaseTaskProcessor):
     def test_step(self, test_model, batch):
         test_model.eval()
         indices, images, _ = batch
-        images = images.to(self.devices)
+        images, _ = self.transform_batch(images.to(self.devices))
 
         out = test_model(images)
         pred = self.postprocessor(out, k=1)
 
-        indices = indices.numpy()
+        indices = indices.cpu().numpy()
         if self.conf.distributed:
             gathered_pred = [None for _ in range(torch.distributed.get_world_size())]
 
@@ -10,10 +10,18 @@ class DetectionProcessor(BaseTaskProcessor):
         super(DetectionProcessor, self).__init__(conf, postprocessor, devices, **kwargs)
         self.num_classes = kwargs['num_classes']
 
+    @staticmethod
+    def clip_to_valid_shape(pred, valid_shapes):
+        # Boxes of padded batches (see ``padded_collate``) are clipped to each image before padding
+        for (boxes, _), (h, w) in zip(pred, valid_shapes.tolist()):
+            boxes[:, 0:4:2] = boxes[:, 0:4:2].clip(0, w)
+            boxes[:, 1:4:2] = boxes[:, 1:4:2].clip(0, h)
+        return pred
+
     def train_step(self, train_model, batch, optimizer, loss_factory, metric_factory):
         train_model.train()
         images, labels, bboxes = batch['pixel_values'], batch['label'], batch['bbox']
-        images = images.to(self.devices)
+        images, _ = self.transform_batch(images.to(self.devices), training=True)
         targets = [{"boxes": box.to(self.devices), "labels": label.to(self.devices),}
                    for box, label in zip(bboxes, labels)]
 
@@ -60,7 +68,7 @@ class DetectionProcessor(BaseTaskProcessor):
     def valid_step(self, eval_model, batch, loss_factory, metric_factory):
         eval_model.eval()
         indices, images, labels, bboxes = batch['indices'], batch['pixel_values'], batch['label'], batch['bbox']
-        images = images.to(self.devices)
+        images, _ = self.transform_batch(images.to(self.devices))
         targets = [{"boxes": box.to(self.devices), "labels": label.to(self.devices)}
                    for box, label in zip(bboxes, labels)]
 
@@ -72,8 +80,10 @@ class DetectionProcessor(BaseTaskProcessor):
         loss_factory.calc(out, targets, phase='valid')
 
         pred = self.postprocessor(out, original_shape=images[0].shape)
+        if 'valid_shape' in batch:
+            pred = self.clip_to_valid_shape(pred, batch['valid_shape'])
 
-        indices = indices.numpy()
+        indices = indices.cpu().numpy()
         if self.conf.distributed:
             # Remove dummy samples, they only come in distributed environment
             images = images[indices != -1]
@@ -117,13 +127,15 @@ class DetectionProcessor(BaseTaskProcessor):
     def test_step(self, test_model, batch):
         test_model.eval()
         indices, images = batch['indices'], batch['pixel_values']
-        images = images.to(self.devices)
+        images, _ = self.transform_batch(images.to(self.devices))
 
         out = test_model(images)
 
         pred = self.postprocessor(out, original_shape=images[0].shape)
+        if 'valid_shape' in batch:
+            pred = self.clip_to_valid_shape(pred, batch['valid_shape'])
 
-        indices = indices.numpy()
+        indices = indices.cpu().numpy()
         if self.conf.distributed:
             # Remove dummy samples, they only come in distributed environment
             filtered_pred = []
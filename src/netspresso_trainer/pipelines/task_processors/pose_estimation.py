@@ -13,7 +13,7 @@ class PoseEstimationProcessor(BaseTaskProcessor):
     def train_step(self, train_model, batch, optimizer, loss_factory, metric_factory):
         train_model.train()
         images, keypoints = batch['pixel_values'], batch['keypoints']
-        images = images.to(self.devices)
+        images, _ = self.transform_batch(images.to(self.devices), training=True)
         target = {'keypoints': keypoints.to(self.devices)}
 
         optimizer.zero_grad()
@@ -50,7 +50,7 @@ class PoseEstimationProcessor(BaseTaskProcessor):
     def valid_step(self, eval_model, batch, loss_factory, metric_factory):
         eval_model.eval()
         indices, images, keypoints = batch['indices'], batch['pixel_values'], batch['keypoints']
-        images = images.to(self.devices)
+        images, _ = self.transform_batch(images.to(self.devices))
         target = {'keypoints': keypoints.to(self.devices)}
 
         out = eval_model(images)
@@ -58,7 +58,7 @@ class PoseEstimationProcessor(BaseTaskProcessor):
 
         pred = self.postprocessor(out)
 
-        indices = indices.numpy()
+        indices = indices.cpu().numpy()
         keypoints = keypoints.detach().cpu().numpy()
         if self.conf.distributed:
             pred = pred[indices != -1]
@@ -85,13 +85,13 @@ class PoseEstimationProcessor(BaseTaskProcessor):
     def test_step(self, test_model, batch):
         test_model.eval()
         indices, images = batch['indices'], batch['pixel_values']
-        images = images.to(self.devices)
+        images, _ = self.transform_batch(images.to(self.devices))
 
         out = test_model(images)
 
         pred = self.postprocessor(out)
 
-        indices = indices.numpy()
+        indices = indices.cpu().numpy()
         if self.conf.distributed:
             pred = pred[indices != -1]
 
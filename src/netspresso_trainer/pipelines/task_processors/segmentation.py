@@ -1,7 +1,9 @@
 from typing import Literal
 
+import numpy as np
 import torch
 
+from ...metrics.segmentation.metric import IGNORE_INDEX_NONE_VALUE
 from .base import BaseTaskProcessor
 
 
@@ -9,10 +11,33 @@ class SegmentationProcessor(BaseTaskProcessor):
     def __init__(self, conf, postprocessor, devices, **kwargs):
         super(SegmentationProcessor, self).__init__(conf, postprocessor, devices, **kwargs)
 
+    @staticmethod
+    def crop_to_valid_shape(batch_array, valid_shapes):
+        # Samples of padded batches (see ``padded_collate``) are cropped to each image before padding
+        return [array[..., :h, :w] for array, (h, w) in zip(batch_array, valid_shapes.tolist())]
+
+    @staticmethod
+    def fill_padding(pred, valid_shapes, fill_value=IGNORE_INDEX_NONE_VALUE):
+        # Predictions on the padding are not shown, as padded label pixels which are ignored
+        pred = pred.copy()
+        for pred_image, (h, w) in zip(pred, valid_shapes.tolist()):
+            pred_image[h:, :] = fill_value
+            pred_image[:, w:] = fill_value
+        return pred
+
+    @staticmethod
+    def update_metric(metric_factory, pred, labels, phase):
+        if isinstance(pred, list):
+            # Cropped images differ in shape, so that each of them is evaluated as a batch of its own
+            for pred_image, labels_image in zip(pred, labels):
+                metric_factory.update(pred_image[np.newaxis], labels_image[np.newaxis], phase=phase)
+            return
+        metric_factory.update(pred, labels, phase=phase)
+
     def train_step(self, train_model, batch, optimizer, loss_factory, metric_factory):
         train_model.train()
         batch['indices']
-        images = batch['pixel_values'].to(self.devices)
+        images, _ = self.transform_batch(batch['pixel_values'].to(self.devices), training=True)
         labels = batch['labels'].long().to(self.devices)
         target = {'target': labels}
 
@@ -49,7 +74,7 @@ class SegmentationProcessor(BaseTaskProcessor):
     def valid_step(self, eval_model, batch, loss_factory, metric_factory):
         eval_model.eval()
         indices = batch['indices']
-        images = batch['pixel_values'].to(self.devices)
+        images, _ = self.transform_batch(batch['pixel_values'].to(self.devices))
         labels = batch['labels'].long().to(self.devices)
         target = {'target': labels}
 
@@ -62,22 +87,34 @@ class SegmentationProcessor(BaseTaskProcessor):
 
         pred = self.postprocessor(out)
 
-        indices = indices.numpy()
+        indices = indices.cpu().numpy()
         labels = labels.detach().cpu().numpy() # Change it to numpy before compute metric
+        valid_shapes = batch['valid_shape'] if 'valid_shape' in batch else None
         if self.conf.distributed:
-            gathered_pred = [None for _ in range(torch.distributed.get_world_size())]
-            gathered_labels = [None for _ in range(torch.distributed.get_world_size())]
-
             # Remove dummy samples, they only come in distributed environment
             pred = pred[indices != -1]
             labels = labels[indices != -1]
-            torch.distributed.gather_object(pred, gathered_pred if torch.distributed.get_rank() == 0 else None, dst=0)
-            torch.distributed.gather_object(labels, gathered_labels if torch.distributed.get_rank() == 0 else None, dst=0)
+            if valid_shapes is not None:
+                valid_shapes = valid_shapes[torch.from_numpy(indices != -1)]
+
+        metric_pred, metric_labels = pred, labels
+        if valid_shapes is not None:
+            # Every image is evaluated without padding, same as evaluation with batch size 1
+            metric_pred = self.crop_to_valid_shape(pred, valid_shapes)
+            metric_labels = self.crop_to_valid_shape(labels, valid_shapes)
+            pred = self.fill_padding(pred, valid_shapes)
+
+        if self.conf.distributed:
+            gathered_pred = [None for _ in range(torch.distributed.get_world_size())]
+            gathered_labels = [None for _ in range(torch.distributed.get_world_size())]
+
+            torch.distributed.gather_object(metric_pred, gathered_pred if torch.distributed.get_rank() == 0 else None, dst=0)
+            torch.distributed.gather_object(metric_labels, gathered_labels if torch.distributed.get_rank() == 0 else None, dst=0)
             torch.distributed.barrier()
             if torch.distributed.get_rank() == 0:
-                [metric_factory.update(g_pred, g_labels, phase='valid') for g_pred, g_labels in zip(gathered_pred, gathered_labels)]
+                [self.update_metric(metric_factory, g_pred, g_labels, phase='valid') for g_pred, g_labels in zip(gathered_pred, gathered_labels)]
         else:
-            metric_factory.update(pred, labels, phase='valid')
+            self.update_metric(metric_factory, metric_pred, metric_labels, phase='valid')
 
         logs = {
             'images': images.detach().cpu().numpy(),
@@ -94,13 +131,15 @@ class SegmentationProcessor(BaseTaskProcessor):
         test_model.eval()
         indices = batch['indices']
         images = batch['pixel_values']
-        images = images.to(self.devices)
+        images, _ = self.transform_batch(images.to(self.devices))
 
         out = test_model(images)
 
         pred = self.postprocessor(out)
+        if 'valid_shape' in batch:
+            pred = self.fill_padding(pred, batch['valid_shape'])
 
-        indices = indices.numpy()
+        indices = indices.cpu().numpy()
         if self.conf.distributed:
             gathered_pred = [None for _ in range(torch.distributed.get_world_size())]
 
@@ -67,6 +67,7 @@ class TrainingPipeline(BasePipeline):
         self.start_epoch = start_epoch
         self.cur_epoch = cur_epoch
         self.profile = profile  # TODO: provide torch_tb_profiler for training
+        self._train_throughput = None  # (number of batches, elapsed time) of the last epoch
 
         self.training_history: Dict[int, Dict[
             Literal['train_losses', 'valid_losses', 'train_metrics', 'valid_metrics'], Dict[str, float]
@@ -167,11 +168,14 @@ class TrainingPipeline(BasePipeline):
 
     def train_one_epoch(self, epoch):
         outputs = []
+        self.timer.start_record(name=f'train_steps_{epoch}')
         for _idx, batch in enumerate(tqdm(self.train_dataloader, leave=False)):
             out = self.task_processor.train_step(self.model, batch, self.optimizer, self.loss_factory, self.metric_factory)
             if self.model_ema:
                 self.model_ema.update(model=self.model.module if hasattr(self.model, 'module') else self.model)
             outputs.append(out)
+        self.timer.end_record(name=f'train_steps_{epoch}')
+        self._train_throughput = (len(outputs), self.timer.get(name=f'train_steps_{epoch}', as_pop=True))
         self.task_processor.get_metric_with_all_outputs(outputs, phase='train', metric_factory=self.metric_factory)
 
     @torch.no_grad()
@@ -190,6 +194,25 @@ class TrainingPipeline(BasePipeline):
         self.task_processor.get_metric_with_all_outputs(outputs, phase='valid', metric_factory=self.metric_factory)
         return returning_samples
 
+    def pop_train_data_stats(self) -> Optional[Dict[str, float]]:
+        # Statistics of the data loading (e.g. throughput, cache hit rate) since the last call
+        data_stats = {}
+        dataset = self.train_dataloader.dataset
+        num_loaded_images = dataset.pop_num_loaded_images() if hasattr(dataset, 'pop_num_loaded_images') else None
+        throughput, self._train_throughput = self._train_throughput, None
+        if throughput is not None and throughput[1] > 0:
+            num_batches, elapsed_time = throughput
+            samples_per_sec = num_batches * self.conf.environment.batch_size * self.conf.world_size / elapsed_time
+            data_stats['samples_per_sec'] = samples_per_sec
+            if num_loaded_images is not None:
+                # Images loaded by the dataloader workers, which do not include repeats of a sample reused in a worker
+                data_stats['unique_samples_per_sec'] = num_loaded_images * self.conf.world_size / elapsed_time
+
+        cache_stats = dataset.pop_cache_stats() if hasattr(dataset, 'pop_cache_stats') else None
+        if cache_stats is not None:
+            data_stats.update({f'cache_{name}': value for name, value in cache_stats.items()})
+        return data_stats if data_stats else None
+
     def log_end_epoch(
         self,
         epoch: int,
@@ -200,7 +223,8 @@ class TrainingPipeline(BasePipeline):
         train_losses = self.loss_factory.result('train')
         train_metrics = self.metric_factory.result('train')
         self.log_results(prefix='training', epoch=epoch, losses=train_losses, metrics=train_metrics,
-                         learning_rate=self.learning_rate, elapsed_time=time_for_epoch)
+                         learning_rate=self.learning_rate, elapsed_time=time_for_epoch,
+                         data_stats=self.pop_train_data_stats())
 
         if valid_logging:
             valid_losses = self.loss_factory.result('valid') if valid_logging else None
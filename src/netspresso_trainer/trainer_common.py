@@ -50,14 +50,11 @@ def train_common(
         if valid_dataset is not None:
             logger.info(f"Summary | Validation dataset: {len(valid_dataset)} sample(s)")
 
-    # TODO: Temporarily set batch_size in train_dataset for RandomResize. This better to be removed later.
-    train_dataset.batch_size = conf.environment.batch_size
-
     if conf.distributed and conf.rank == 0:
         torch.distributed.barrier()
 
-    train_dataloader = build_dataloader(conf, task, model_name, dataset=train_dataset, phase='train')
-    eval_dataloader = build_dataloader(conf, task, model_name, dataset=valid_dataset, phase='val')
+    train_dataloader = build_dataloader(conf, task, model_name, dataset=train_dataset, phase='train', devices=devices)
+    eval_dataloader = build_dataloader(conf, task, model_name, dataset=valid_dataset, phase='val', devices=devices)
 
     # Build model
     if is_graphmodule_training:
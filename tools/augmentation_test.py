@@ -0,0 +1,113 @@
+import io
+import random
+
+import numpy as np
+import PIL.Image as Image
+import pytest
+import torch
+from netspresso_trainer.dataloaders.augmentation.custom import image_proc as TC
+from netspresso_trainer.dataloaders.augmentation.registry import TRANSFORM_DICT
+from netspresso_trainer.dataloaders.utils.decode import DECODE_BACKENDS, ImageDecoder
+from PIL import ImageFilter
+
+NUM_SEEDS = 10
+# Interpolated pixels and the HSV to RGB conversion may differ by one intensity level from the PIL path
+MAX_PIXEL_DIFF = {'resize': 1, 'resize_long': 1, 'randomresizedcrop': 1, 'hsvjitter': 1}
+
+TRANSFORM_CASES = {
+    'resize': ('resize', {'size': [96, 128], 'interpolation': 'bilinear', 'max_size': None, 'resize_criteria': None}),
+    'resize_long': ('resize', {'size': 100, 'interpolation': 'bicubic', 'max_size': None, 'resize_criteria': 'long'}),
+    'resize_nearest': ('resize', {'size': 120, 'interpolation': 'nearest', 'max_size': None, 'resize_criteria': 'short'}),
+    'randomhorizontalflip': ('randomhorizontalflip', {'p': 1.0}),
+    'randomverticalflip': ('randomverticalflip', {'p': 1.0}),
+    'pad': ('pad', {'size': [300, 400], 'fill': 114}),
+    'centercrop': ('centercrop', {'size': 200}),
+    'randomresizedcrop': ('randomresizedcrop', {'size': 128, 'scale': [0.08, 1.0], 'ratio': [0.75, 1.33], 'interpolation': 'bilinear'}),
+    'hsvjitter': ('hsvjitter', {'h_mag': 5, 's_mag': 30, 'v_mag': 30}),
+}
+BBOX_CASES = ['resize', 'resize_long', 'resize_nearest', 'randomhorizontalflip', 'randomverticalflip', 'pad']
+
+
+class KeypointDataset:
+    flip_indices = [1, 0, 2]
+
+
+def _sample_image():
+    rng = np.random.default_rng(0)
+    # Smooth image, so that differences of interpolation stay small
+    blocks = np.kron(rng.integers(0, 255, (24, 32, 3), dtype=np.uint8), np.ones((10, 10, 1), dtype=np.uint8))
+    image = Image.fromarray(blocks).filter(ImageFilter.GaussianBlur(3))
+    mask = Image.fromarray(np.kron(rng.integers(0, 4, (24, 32), dtype=np.uint8), np.ones((10, 10), dtype=np.uint8)))
+    edge = Image.fromarray((np.asarray(mask) * 60).astype(np.uint8))
+    return image, mask, edge
+
+
+IMAGE, MASK, EDGE = _sample_image()
+BBOX = np.array([[10., 20., 100., 150.], [50., 60., 300., 200.]], dtype=np.float32)
+KEYPOINT = np.array([[[30., 40., 1.], [200., 100., 1.], [120., 220., 0.]]], dtype=np.float32)
+
+
+def _transform(transforms, array_mode, seed, **targets):
+    compose = TC.Compose(transforms + [TC.ToTensor()], additional_targets={'edge': 'mask'}, array_mode=array_mode)
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+    targets = {k: v.copy() for k, v in targets.items()}
+    return compose(image=IMAGE.copy(), **targets)
+
+
+def _assert_image_close(pil_image, array_image, max_diff):
+    assert pil_image.shape == array_image.shape
+    assert ((pil_image - array_image).abs() * 255).round().max().item() <= max_diff
+
+
+@pytest.mark.parametrize('case', list(TRANSFORM_CASES))
+def test_image_and_mask_parity(case):
+    name, kwargs = TRANSFORM_CASES[case]
+    for seed in range(NUM_SEEDS):
+        outputs = [_transform([TRANSFORM_DICT[name](**kwargs)], array_mode, seed, mask=MASK, edge=EDGE)
+                   for array_mode in [False, True]]
+        _assert_image_close(outputs[0]['image'], outputs[1]['image'], MAX_PIXEL_DIFF.get(case, 0))
+        for key in ['mask', 'edge']:
+            assert torch.equal(outputs[0][key], outputs[1][key])
+
+
+@pytest.mark.parametrize('case', BBOX_CASES)
+def test_bbox_parity(case):
+    name, kwargs = TRANSFORM_CASES[case]
+    for seed in range(NUM_SEEDS):
+        outputs = [_transform([TRANSFORM_DICT[name](**kwargs)], array_mode, seed, bbox=BBOX, label=np.array([[1], [2]]))
+                   for array_mode in [False, True]]
+        assert torch.equal(outputs[0]['bbox'], outputs[1]['bbox'])
+
+
+@pytest.mark.parametrize('name', ['randomhorizontalflip', 'randomverticalflip'])
+def test_flip_keypoint_parity(name):
+    outputs = []
+    for array_mode in [False, True]:
+        compose = TC.Compose([TRANSFORM_DICT[name](p=1.0), TC.ToTensor()], array_mode=array_mode)
+        outputs.append(compose(image=IMAGE.copy(), keypoint=KEYPOINT.copy(), dataset=KeypointDataset()))
+    _assert_image_close(outputs[0]['image'], outputs[1]['image'], 0)
+    assert np.array_equal(outputs[0]['keypoint'], outputs[1]['keypoint'])
+
+
+def test_pose_affine_keypoint_parity():
+    transform = TRANSFORM_DICT['posetopdownaffine'](scale=[0.75, 1.25], scale_prob=1., translate=0.1, translate_prob=1.,
+                                                    rotation=60, rotation_prob=1., size=[64, 64])
+    for seed in range(NUM_SEEDS):
+        outputs = [_transform([transform], array_mode, seed, bbox=BBOX[:1], keypoint=KEYPOINT)
+                   for array_mode in [False, True]]
+        _assert_image_close(outputs[0]['image'], outputs[1]['image'], 0)
+        assert np.array_equal(outputs[0]['keypoint'], outputs[1]['keypoint'])
+        assert torch.equal(outputs[0]['bbox'], outputs[1]['bbox'])
+
+
+@pytest.mark.parametrize('backend', DECODE_BACKENDS)
+@pytest.mark.parametrize('image_format', ['JPEG', 'PNG'])
+def test_decode_array_parity(backend, image_format):
+    buffer = io.BytesIO()
+    IMAGE.save(buffer, format=image_format)
+    decoder = ImageDecoder(backend)
+    array = decoder.decode(buffer.getvalue(), as_array=True)
+    assert isinstance(array, np.ndarray) and array.flags.writeable
+    assert np.array_equal(array, np.array(decoder.decode(buffer.getvalue())))
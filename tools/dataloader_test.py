@@ -0,0 +1,200 @@
+import csv
+
+import numpy as np
+import PIL.Image as Image
+import pytest
+import torch
+from netspresso_trainer.dataloaders import build_dataloader, build_dataset
+from netspresso_trainer.dataloaders.augmentation.custom.image_proc import RandomResize
+from netspresso_trainer.dataloaders.utils import label_index, label_remap, manifest
+from netspresso_trainer.losses import build_losses
+from netspresso_trainer.metrics import build_metrics
+from netspresso_trainer.pipelines.task_processors.segmentation import SegmentationProcessor
+from netspresso_trainer.postprocessors.segmentation import SegmentationPostprocessor
+from omegaconf import OmegaConf
+
+NUM_IMAGES = 12
+NUM_CLASSES = 3
+BATCH_SIZE = 4
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    # Keep manifests and label stores of the fixtures out of the user cache
+    monkeypatch.setattr(manifest, 'MANIFEST_DIR', tmp_path / "cache" / "manifest")
+    monkeypatch.setattr(label_index, 'LABEL_INDEX_DIR', tmp_path / "cache" / "label_index")
+    monkeypatch.setattr(label_remap, 'MASK_STORE_DIR', tmp_path / "cache" / "mask_store")
+    return tmp_path / "cache"
+
+
+def _data_conf(root, name, task, label_train, label_valid):
+    return OmegaConf.create({
+        'name': name,
+        'task': task,
+        'format': 'local',
+        'path': {
+            'root': str(root),
+            'train': {'image': 'images/train', 'label': label_train},
+            'valid': {'image': 'images/valid', 'label': label_valid},
+            'test': {'image': None, 'label': None},
+            'pattern': {'image': None, 'label': None},
+        },
+        'label_image_mode': 'L',
+        'id_mapping': [str(idx) for idx in range(NUM_CLASSES)],
+    })
+
+
+def _images(root, split, rng, sizes):
+    (root / "images" / split).mkdir(parents=True)
+    for idx, (h, w) in enumerate(sizes):
+        Image.fromarray(rng.integers(0, 255, (h, w, 3), dtype=np.uint8)).save(root / "images" / split / f"{idx}.png")
+
+
+def classification_dataset(root):
+    rng = np.random.default_rng(0)
+    (root / "labels").mkdir(parents=True)
+    for split in ['train', 'valid']:
+        _images(root, split, rng, [(40 + 4 * idx, 56) for idx in range(NUM_IMAGES)])
+        with open(root / "labels" / f"{split}.csv", 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['image_id', 'class'])
+            writer.writerows([[f"{idx}.png", idx % NUM_CLASSES] for idx in range(NUM_IMAGES)])
+    return _data_conf(root, 'cls_test', 'classification', 'labels/train.csv', 'labels/valid.csv')
+
+
+def segmentation_dataset(root, sizes=None):
+    rng = np.random.default_rng(0)
+    sizes = sizes or [(40 + 4 * idx, 56) for idx in range(NUM_IMAGES)]
+    for split in ['train', 'valid']:
+        _images(root, split, rng, sizes)
+        (root / "labels" / split).mkdir(parents=True)
+        for idx, (h, w) in enumerate(sizes):
+            mask = np.kron(rng.integers(0, NUM_CLASSES, (h // 4, w // 4), dtype=np.uint8), np.ones((4, 4), dtype=np.uint8))
+            Image.fromarray(mask).save(root / "labels" / split / f"{idx}.png")
+    return _data_conf(root, 'seg_test', 'segmentation', 'labels/train', 'labels/valid')
+
+
+def build_conf(conf_data, augmentation, model_name='resnet50', **environment):
+    return OmegaConf.create({
+        'data': conf_data,
+        'augmentation': augmentation,
+        'model': {'name': model_name, 'losses': [{'criterion': 'cross_entropy', 'ignore_index': 255, 'weight': None}]},
+        'training': {},
+        'environment': {'batch_size': BATCH_SIZE, 'num_workers': 2, **environment},
+        'distributed': False,
+        'world_size': 1,
+        'rank': 0,
+    })
+
+
+def build(conf, phase='train'):
+    train_dataset, valid_dataset, _ = build_dataset(conf.data, conf.augmentation, conf.data.task, conf.model.name, distributed=False)
+    dataset = train_dataset if phase == 'train' else valid_dataset
+    return build_dataloader(conf, conf.data.task, conf.model.name, dataset, phase=phase)
+
+
+LRU_EPOCHS = 3
+
+
+def _lru_hit_rates(loader):
+    hit_rates = []
+    for epoch in range(LRU_EPOCHS):
+        loader.sampler.set_epoch(epoch)
+        for _ in loader:
+            pass
+        hit_rates.append(loader.dataset.pop_cache_stats()['hit_rate'])
+    return hit_rates
+
+
+@pytest.mark.parametrize('encoded', [False, True])
+def test_memory_cache_lru_shared_by_workers(tmp_path, cache_dir, encoded):
+    conf_data = classification_dataset(tmp_path / "data")
+    cache_data = {'backend': 'memory', 'max_bytes': '1G', 'policy': 'lru', 'encoded': encoded}
+    loader = build(build_conf(conf_data, {'train': [RESIZE], 'inference': [RESIZE]}, num_workers=4, cache_data=cache_data))
+
+    # Whole dataset fits in the budget, so every sample is a hit after the first epoch regardless of the worker
+    assert _lru_hit_rates(loader) == [0., 1., 1.]
+    dataset = loader.dataset
+    for index in range(len(dataset)):
+        assert np.array_equal(np.array(dataset.image_cache.load(index)), np.array(dataset._load_sample(index)))
+
+
+def test_memory_cache_lru_budget(tmp_path, cache_dir):
+    conf_data = classification_dataset(tmp_path / "data")
+    image_bytes = [h * 56 * 3 for h in range(40, 40 + 4 * NUM_IMAGES, 4)]
+    max_bytes = sum(image_bytes) // 2
+    cache_data = {'backend': 'memory', 'max_bytes': max_bytes, 'policy': 'lru'}
+    loader = build(build_conf(conf_data, {'train': [RESIZE], 'inference': [RESIZE]}, num_workers=4, cache_data=cache_data))
+
+    _lru_hit_rates(loader)
+    store = loader.dataset.image_cache.store
+    stored = np.flatnonzero(store.arrays['states'] == store.CACHED)
+    assert 0 < store.cached_bytes.value <= max_bytes
+    assert store.cached_bytes.value == sum(image_bytes[index] for index in stored)
+    assert sorted(path.name for path in store.store_dir.iterdir()) == sorted(str(index) for index in stored)
+
+
+RANDOM_RESIZE = {'name': 'randomresize', 'base_size': [64, 64], 'stride': 16, 'random_range': 1, 'interpolation': 'bilinear'}
+RESIZE = {'name': 'resize', 'size': [64, 64], 'interpolation': 'bilinear', 'max_size': None, 'resize_criteria': None}
+
+
+@pytest.mark.parametrize('dataset_fn', [classification_dataset, segmentation_dataset])
+def test_random_resize_batches(tmp_path, cache_dir, dataset_fn):
+    conf_data = dataset_fn(tmp_path / "data")
+    loader = build(build_conf(conf_data, {'train': [RANDOM_RESIZE], 'inference': [RESIZE]}))
+
+    sizes = {tuple(size) for size in RandomResize.get_sizes([64, 64], stride=16, random_range=1)}
+    batch_sizes = []
+    for _ in range(3):
+        for batch in loader:
+            images = batch[1] if conf_data.task == 'classification' else batch['pixel_values']
+            assert len(images) == BATCH_SIZE
+            batch_sizes.append(tuple(images.shape[-2:]))
+            if conf_data.task == 'segmentation':
+                assert tuple(batch['labels'].shape[-2:]) == batch_sizes[-1]
+    assert set(batch_sizes) <= sizes
+    # Sizes change across batches
+    assert len(set(batch_sizes)) > 1
+
+
+class SegmentationModel(torch.nn.Module):
+    def __init__(self, kernel_size):
+        super().__init__()
+        torch.manual_seed(0)
+        # Replicated border differs from the zero padding of the batch, so predictions at the border can change
+        self.conv = torch.nn.Conv2d(3, NUM_CLASSES, kernel_size, padding=kernel_size // 2, padding_mode='replicate')
+
+    def forward(self, x):
+        return {'pred': self.conv(x)}
+
+
+def _segmentation_metrics(conf, model):
+    loader = build(conf, phase='valid')
+    processor = SegmentationProcessor(conf, SegmentationPostprocessor(conf.model), 'cpu')
+    loss_factory = build_losses(conf.model)
+    metric_factory = build_metrics('segmentation', conf.model, num_classes=NUM_CLASSES)
+    with torch.no_grad():
+        for batch in loader:
+            processor.valid_step(model, batch, loss_factory, metric_factory)
+    return metric_factory.result('valid')
+
+
+@pytest.mark.parametrize('kernel_size', [1, 3])
+def test_segmentation_eval_bucketing_metrics(tmp_path, cache_dir, kernel_size):
+    # Images of different heights, so that the shorter images of each batch are padded at the bottom
+    heights = [40 + 4 * idx for idx in range(NUM_IMAGES)]
+    conf_data = segmentation_dataset(tmp_path / "data", sizes=[(h, 56) for h in heights])
+    augmentation = {'train': [], 'inference': []}
+    model = SegmentationModel(kernel_size).eval()
+
+    baseline = _segmentation_metrics(build_conf(conf_data, augmentation, batch_size=1), model)
+    bucketed = _segmentation_metrics(build_conf(conf_data, augmentation, eval_bucketing=True), model)
+    if kernel_size == 1:
+        # Pixel-wise predictions do not see the padding, so the metrics are identical
+        assert all(np.isclose(bucketed[name], baseline[name], rtol=0, atol=1e-12) for name in baseline)
+    else:
+        # Only the last row of each padded image sees the padding. Changing 1 / h of the pixels changes pixel
+        # accuracy by at most 1 / h, and IoU by at most 2 / h
+        tolerance = 1 / min(heights)
+        assert abs(bucketed['pixel_acc'] - baseline['pixel_acc']) <= tolerance
+        assert abs(bucketed['iou'] - baseline['iou']) <= 2 * tolerance
@@ -0,0 +1,127 @@
+import argparse
+from functools import partial
+from multiprocessing.pool import ThreadPool
+from pathlib import Path
+
+import numpy as np
+from netspresso_trainer.dataloaders import DATA_SAMPLER
+from netspresso_trainer.dataloaders.builder import TRAIN_VALID_SPLIT_RATIO
+from netspresso_trainer.dataloaders.detection.local import get_label
+from netspresso_trainer.dataloaders.pose_estimation.local import parse_pose_rows
+from netspresso_trainer.dataloaders.utils.packed import (
+    DEFAULT_SHARD_SIZE_MB,
+    LABEL_TYPE_ARRAY,
+    LABEL_TYPE_IMAGE,
+    LABEL_TYPE_NONE,
+    PackedShardWriter,
+    serialize_array,
+    write_packed_meta,
+)
+from omegaconf import OmegaConf
+from tqdm import tqdm
+
+SPLITS = ['train', 'valid', 'test']
+LABEL_TYPE = {
+    'classification': LABEL_TYPE_NONE,
+    'detection': LABEL_TYPE_ARRAY,
+    'segmentation': LABEL_TYPE_IMAGE,
+    'pose_estimation': LABEL_TYPE_ARRAY,
+}
+
+
+def parse_args():
+
+    parser = argparse.ArgumentParser(description="Convert local dataset into packed, sharded dataset format")
+
+    parser.add_argument(
+        '--data', type=str, required=True,
+        help="Data config path of local dataset (e.g. config/data/coco_yolo.yaml)")
+    parser.add_argument(
+        '-o', '--output', type=str, required=True,
+        help="Output directory of packed dataset")
+    parser.add_argument(
+        '--shard-size', type=int, default=DEFAULT_SHARD_SIZE_MB,
+        help="Maximum size (MB) of each shard")
+    parser.add_argument(
+        '--num-threads', type=int, default=8,
+        help="The number of threads to read files")
+
+    args, _ = parser.parse_known_args()
+
+    return args
+
+
+def read_label_bytes(task, label):
+    if label is None or task == 'classification':
+        return None
+    if task == 'detection':
+        class_idx, boxes = get_label(label)
+        return serialize_array(np.concatenate([class_idx, boxes], axis=-1).reshape(-1, 5))
+    if task == 'segmentation':
+        return Path(label).read_bytes()
+    if task == 'pose_estimation':
+        return serialize_array(parse_pose_rows(label)['instances'])
+    raise AssertionError(f"Task ({task}) is not understood!")
+
+
+def read_sample(sample, task):
+    image_bytes = Path(sample['image']).read_bytes()
+    label_bytes = read_label_bytes(task, sample['label'])
+    class_idx = sample['label'] if task == 'classification' and sample['label'] is not None else -1
+    return image_bytes, label_bytes, class_idx
+
+
+def load_local_samples(data_sampler, split):
+    # Read label files directly. ``load_data`` may replace them with label index or mask store records
+    if hasattr(data_sampler, 'load_local_data'):
+        return data_sampler.load_local_data(split=split)
+    return data_sampler.load_data(split=split)
+
+
+def pack_dataset(conf_data, output_dir, shard_size_mb=DEFAULT_SHARD_SIZE_MB, num_threads=8):
+    assert conf_data.format == 'local', f"Only local dataset can be packed, but got {conf_data.format} format!"
+    task = conf_data.task
+    assert task in LABEL_TYPE, f"Packed dataset for {task} is not yet supported!"
+
+    output_dir = Path(output_dir).resolve()
+    data_sampler = DATA_SAMPLER[task](conf_data, train_valid_split_ratio=TRAIN_VALID_SPLIT_RATIO)
+
+    meta = {'task': task, 'splits': {}}
+    for split in SPLITS:
+        if conf_data.path[split].image is None:
+            continue
+        samples = load_local_samples(data_sampler, split)
+        has_label = any(sample['label'] is not None for sample in samples)
+        writer = PackedShardWriter(output_dir, split,
+                                   label_type=LABEL_TYPE[task] if has_label else LABEL_TYPE_NONE,
+                                   shard_size_mb=shard_size_mb)
+
+        # Samples are written in order, so each shard is read sequentially while training
+        with ThreadPool(num_threads) as pool:
+            for image_bytes, label_bytes, class_idx in tqdm(pool.imap(partial(read_sample, task=task), samples),
+                                                            total=len(samples), desc=f"Packing {split}"):
+                writer.write(image_bytes, label_bytes, class_idx)
+
+        meta['splits'][split] = writer.close()
+        print(f"{split}: {meta['splits'][split]['num_samples']} sample(s) in {len(meta['splits'][split]['shards'])} shard(s)")
+
+    write_packed_meta(output_dir, meta)
+
+    # Data config which can be used directly for training
+    packed_conf_data = OmegaConf.create(OmegaConf.to_container(conf_data))
+    packed_conf_data.format = 'packed'
+    packed_conf_data.path.root = str(output_dir)
+    for split in SPLITS:
+        packed = split in meta['splits']
+        packed_conf_data.path[split].image = split if packed else None
+        packed_conf_data.path[split].label = split if packed and meta['splits'][split]['label_type'] != LABEL_TYPE_NONE else None
+    OmegaConf.save(OmegaConf.create({'data': packed_conf_data}), output_dir / "data.yaml")
+    print(f"Packed dataset saved at {output_dir}. Use {output_dir / 'data.yaml'} as data config.")
+    return packed_conf_data
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    conf_data = OmegaConf.load(args.data).data
+    pack_dataset(conf_data, args.output, shard_size_mb=args.shard_size, num_threads=args.num_threads)
@@ -0,0 +1,64 @@
+import numpy as np
+import PIL.Image as Image
+import pytest
+from netspresso_trainer.dataloaders import DATA_SAMPLER
+from netspresso_trainer.dataloaders.utils import label_index, manifest
+from omegaconf import OmegaConf
+from pack_dataset import pack_dataset
+
+NUM_KEYPOINTS = 3
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    # Keep manifests and label indices of the fixture out of the user cache
+    monkeypatch.setattr(manifest, 'MANIFEST_DIR', tmp_path / "cache" / "manifest")
+    monkeypatch.setattr(label_index, 'LABEL_INDEX_DIR', tmp_path / "cache" / "label_index")
+    return tmp_path / "cache"
+
+
+def _pose_dataset(root, num_images=4):
+    rng = np.random.default_rng(0)
+    instances = {}
+    for split in ['train', 'valid']:
+        (root / "images" / split).mkdir(parents=True)
+        (root / "labels" / split).mkdir(parents=True)
+        for idx in range(num_images):
+            name = f"{split}_{idx}"
+            Image.fromarray(rng.integers(0, 255, (32, 48, 3), dtype=np.uint8)).save(root / "images" / split / f"{name}.png")
+            # Each row is (x, y, visibility) * num_keypoints and bbox of an instance
+            rows = np.round(rng.uniform(0, 32, (idx + 1, NUM_KEYPOINTS * 3 + 4)), 2).astype(np.float32)
+            (root / "labels" / split / f"{name}.txt").write_text('\n'.join(' '.join(str(v) for v in row) for row in rows))
+            instances[str(root / "images" / split / f"{name}.png")] = rows
+    conf_data = OmegaConf.create({
+        'name': 'pose_pack_test',
+        'task': 'pose_estimation',
+        'format': 'local',
+        'path': {
+            'root': str(root),
+            'train': {'image': 'images/train', 'label': 'labels/train'},
+            'valid': {'image': 'images/valid', 'label': 'labels/valid'},
+            'test': {'image': None, 'label': None},
+            'pattern': {'image': None, 'label': None},
+        },
+        'id_mapping': [{'name': str(idx), 'skeleton': None, 'swap': None} for idx in range(NUM_KEYPOINTS)],
+    })
+    return conf_data, instances
+
+
+def test_pose_pack_round_trip(tmp_path, cache_dir):
+    conf_data, instances = _pose_dataset(tmp_path / "local")
+    packed_conf_data = pack_dataset(conf_data, tmp_path / "packed", num_threads=2)
+    # Packing reads label files directly without building a label index
+    assert not (cache_dir / "label_index").exists()
+
+    local_sampler = DATA_SAMPLER['pose_estimation'](conf_data, train_valid_split_ratio=0.9)
+    packed_sampler = DATA_SAMPLER['pose_estimation'](packed_conf_data, train_valid_split_ratio=0.9)
+    for split in ['train', 'valid']:
+        local_samples = local_sampler.load_local_data(split=split)
+        packed_samples = packed_sampler.load_data(split=split)
+        assert len(packed_samples) == len(local_samples)
+        for local_sample, packed_sample in zip(local_samples, packed_samples):
+            with open(local_sample['image'], 'rb') as f:
+                assert bytes(packed_sample['image'].read_bytes()) == f.read()
+            assert np.array_equal(packed_sample['label'].read()['instances'], instances[local_sample['image']])